@@ -0,0 +1,362 @@
+#!/usr/bin/python
+"""Aggregate the average delays of the clients of a serverless edge computing"""
+
+__author__  = "Claudio Cicconetti"
+__version__ = "0.1.0"
+__license__ = "MIT"
+
+import argparse
+import json
+import math
+import os
+import numpy as np
+import scipy.stats
+import results
+
+# default maximum number of values for which the quantiles are exact
+DEFAULT_EXACT_LIMIT = 100000
+
+# default relative accuracy of the quantiles of the sketch
+DEFAULT_ACCURACY = 0.01
+
+class Sketch(object):
+    """
+    Mergeable sketch of the quantiles of a set of positive values.
+
+    Every value x is counted in the bucket with index ceil(log_gamma(x)),
+    where gamma = (1 + accuracy) / (1 - accuracy), so that the value
+    returned for any quantile is within a relative error of accuracy from
+    the exact one, with a number of buckets which grows only with the
+    logarithm of the ratio between the largest and smallest values. Zeros
+    are counted separately. Two sketches with the same accuracy are merged
+    by adding the counts of their buckets.
+    """
+
+    def __init__(self, accuracy = DEFAULT_ACCURACY):
+        assert 0 < accuracy < 1
+
+        self.accuracy = accuracy
+        self.gamma    = (1.0 + accuracy) / (1.0 - accuracy)
+        self.bins     = dict()
+        self.zeros    = 0
+
+    def __len__(self):
+        return self.zeros + sum(self.bins.values())
+
+    def add(self, values):
+        "Count an array of non-negative values"
+
+        values = np.asarray(values, dtype=float)
+        assert np.all(values >= 0)
+
+        positive = values[values > 0]
+        self.zeros += len(values) - len(positive)
+        (indices, counts) = np.unique(
+            np.ceil(np.log(positive) / math.log(self.gamma)).astype(int), return_counts = True)
+        for (ndx, count) in zip(indices, counts):
+            self.bins[int(ndx)] = self.bins.get(int(ndx), 0) + int(count)
+
+    def merge(self, other):
+        "Add the counts of another sketch with the same accuracy"
+
+        assert self.accuracy == other.accuracy
+
+        self.zeros += other.zeros
+        for (ndx, count) in other.bins.items():
+            self.bins[ndx] = self.bins.get(ndx, 0) + count
+
+    def quantile(self, q):
+        "Return the estimated q-quantile, or NaN if there are no values"
+
+        assert 0 <= q <= 1
+
+        total = len(self)
+        if total == 0:
+            return float('nan')
+
+        rank = q * (total - 1)
+        if rank < self.zeros:
+            return 0.0
+        cumulative = self.zeros
+        for ndx in sorted(self.bins.keys()):
+            cumulative += self.bins[ndx]
+            if cumulative > rank:
+                break
+
+        # the value with the same relative error from both ends of the bucket
+        return 2.0 * self.gamma ** ndx / (self.gamma + 1.0)
+
+class Aggregate(object):
+    """
+    Online aggregate of the average delays of the clients in many runs.
+
+    The negative values, which mark the clients that are not stable, are
+    only counted, while of the others the mean and its confidence interval
+    are computed, from their sum and sum of squares, and the quantiles:
+    exact, while there are at most exact_limit values, otherwise estimated
+    with a Sketch with the given relative accuracy, into which the values
+    are moved as soon as the limit is exceeded.
+
+    Aggregates with the same parameters, e.g., of the runs executed by
+    different workers or hosts, are merged with merge(), also after being
+    saved to and loaded from JSON files.
+    """
+
+    def __init__(self, exact_limit = DEFAULT_EXACT_LIMIT, accuracy = DEFAULT_ACCURACY):
+        assert exact_limit >= 0
+        assert 0 < accuracy < 1
+
+        self.exact_limit = exact_limit
+        self.accuracy    = accuracy
+
+        self.count    = 0
+        self.unstable = 0
+        self.sum      = 0.0
+        self.sumsq    = 0.0
+
+        # the stable values, until exact_limit is exceeded, then the sketch
+        self.values = []
+        self.sketch = None
+
+    def add(self, delays):
+        "Add the average delays of the clients in a run, if not None"
+
+        if delays is None:
+            return
+
+        delays = np.asarray(delays, dtype=float).ravel()
+        stable = delays[delays >= 0]
+
+        self.count    += len(stable)
+        self.unstable += len(delays) - len(stable)
+        self.sum      += float(np.sum(stable))
+        self.sumsq    += float(np.sum(stable ** 2))
+
+        if self.sketch is not None:
+            self.sketch.add(stable)
+        else:
+            self.values.append(stable)
+            self.__compact()
+
+    def merge(self, other):
+        "Add all the values of another aggregate with the same parameters"
+
+        assert self.exact_limit == other.exact_limit
+        assert self.accuracy == other.accuracy
+
+        self.count    += other.count
+        self.unstable += other.unstable
+        self.sum      += other.sum
+        self.sumsq    += other.sumsq
+
+        if other.sketch is not None:
+            if self.sketch is None:
+                self.sketch = Sketch(self.accuracy)
+                self.sketch.add(self.__exact())
+                self.values = []
+            self.sketch.merge(other.sketch)
+        elif self.sketch is not None:
+            self.sketch.add(other.__exact())
+        else:
+            self.values.append(other.__exact())
+            self.__compact()
+
+    def __exact(self):
+        "Return the array of all the stable values, if not in the sketch"
+
+        if len(self.values) != 1:
+            self.values = [np.concatenate(self.values) if len(self.values) > 0 else np.zeros(0)]
+        return self.values[0]
+
+    def __compact(self):
+        "Move the values to the sketch if there are more than exact_limit"
+
+        if self.count > self.exact_limit:
+            self.sketch = Sketch(self.accuracy)
+            self.sketch.add(self.__exact())
+            self.values = []
+
+    def total(self):
+        "Return the number of values, including the unstable ones"
+
+        return self.count + self.unstable
+
+    def mean(self):
+        "Return the mean of the stable values, or NaN if there are none"
+
+        return self.sum / self.count if self.count > 0 else float('nan')
+
+    def confidence(self, level = 0.95):
+        """
+        Return the half-width of the confidence interval of the mean at the
+        given level, or NaN if there are less than two values.
+        """
+
+        if self.count < 2:
+            return float('nan')
+
+        variance = max(0.0, (self.sumsq - self.sum ** 2 / self.count) / (self.count - 1))
+        quantile = scipy.stats.t.ppf(0.5 + level / 2.0, self.count - 1)
+        return float(quantile * math.sqrt(variance / self.count))
+
+    def quantile(self, q):
+        "Return the q-quantile of the stable values, or NaN if there are none"
+
+        assert 0 <= q <= 1
+
+        if self.sketch is not None:
+            return self.sketch.quantile(q)
+
+        values = self.__exact()
+        return float(np.percentile(values, 100.0 * q)) if len(values) > 0 else float('nan')
+
+    def statistic(self, name):
+        """
+        Return the list of the values of a statistic: 'mean' for the mean
+        and the half-width of its 95% confidence interval, 'unstable' for the
+        fraction of unstable values, or a number in [0, 1] for that quantile.
+        """
+
+        if name == 'mean':
+            return [self.mean(), self.confidence()]
+        if name == 'unstable':
+            return [float(self.unstable) / self.total() if self.total() > 0 else float('nan')]
+        return [self.quantile(float(name))]
+
+    def to_dict(self):
+        "Return a JSON-serializable dictionary with the aggregate"
+
+        return {
+            'exact_limit': self.exact_limit,
+            'accuracy':    self.accuracy,
+            'count':       self.count,
+            'unstable':    self.unstable,
+            'sum':         self.sum,
+            'sumsq':       self.sumsq,
+            'values':      self.__exact().tolist() if self.sketch is None else None,
+            'bins':        dict([(str(k), v) for (k, v) in self.sketch.bins.items()]) \
+                if self.sketch is not None else None,
+            'zeros':       self.sketch.zeros if self.sketch is not None else 0,
+            }
+
+    @staticmethod
+    def from_dict(data):
+        "Return an aggregate from a dictionary returned by to_dict()"
+
+        ret = Aggregate(data['exact_limit'], data['accuracy'])
+        ret.count    = data['count']
+        ret.unstable = data['unstable']
+        ret.sum      = data['sum']
+        ret.sumsq    = data['sumsq']
+        if data['bins'] is not None:
+            ret.sketch = Sketch(ret.accuracy)
+            ret.sketch.bins  = dict([(int(k), v) for (k, v) in data['bins'].items()])
+            ret.sketch.zeros = data['zeros']
+        else:
+            ret.values = [np.array(data['values'], dtype=float)]
+        return ret
+
+    def save(self, filename):
+        "Save the aggregate to a JSON file"
+
+        with open(filename, 'w') as outfile:
+            json.dump(self.to_dict(), outfile)
+
+    @staticmethod
+    def load(filename):
+        "Return the aggregate saved to a JSON file"
+
+        with open(filename, 'r') as infile:
+            return Aggregate.from_dict(json.load(infile))
+
+def read(filename, exact_limit = DEFAULT_EXACT_LIMIT, accuracy = DEFAULT_ACCURACY, stream = False):
+    """
+    Return the aggregate of a file, either saved with Aggregate.save() or
+    written by serverless.py in text format, with the delays of a run per
+    line, in a single pass.
+
+    With stream, the text file is written by serverless.py with --stream,
+    or --resume, where every line starts with the run index, see
+    results.StreamWriter, and only the last result of every run is added.
+    """
+
+    if filename.endswith('.json'):
+        return Aggregate.load(filename)
+
+    ret = Aggregate(exact_limit, accuracy)
+    if stream:
+        # the file may be still being written
+        streamed = results.read_stream(filename, repair = False)
+        for run in sorted(streamed.keys()):
+            ret.add(streamed[run])
+        return ret
+
+    with open(filename, 'r') as infile:
+        for line in infile:
+            values = line.split()
+            if len(values) > 0:
+                ret.add(np.array(values, dtype=float))
+    return ret
+
+def write_summary(filename, statistic, entries):
+    """
+    Write a summary file with a line for every entry, a tuple with the
+    abscissa and the aggregate, with the former followed by the values of
+    the given statistic of the latter, see Aggregate.statistic().
+    """
+
+    directory = os.path.dirname(filename)
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    with open(filename, 'w') as outfile:
+        for (abscissa, aggregate) in entries:
+            outfile.write(' '.join([str(abscissa)] + [str(v) for v in aggregate.statistic(statistic)]) + '\n')
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument(
+        "input", type=str, nargs='+',
+        help="Files with the delays of a run per line, or aggregates in .json files, all merged")
+    parser.add_argument(
+        "--stream", action="store_true", default=False,
+        help="The text files are written by serverless.py with --stream or --resume, with the run index first on every line")
+    parser.add_argument(
+        "--statistics", type=str, default='0.5,0.9,0.95,0.98,mean',
+        help="Statistics printed, comma-separated: quantiles, mean, or unstable")
+    parser.add_argument(
+        "--abscissa", type=str, default='',
+        help="Value added to every statistic as a new line of the output files, empty to print to standard output")
+    parser.add_argument(
+        "--output", type=str, default='data/{statistic}.dat',
+        help="Output files with --abscissa, with {statistic} replaced by the name of every statistic")
+    parser.add_argument(
+        "--save", type=str, default='',
+        help="JSON file where to save the merged aggregate, empty for none")
+    parser.add_argument(
+        "--exact_limit", type=int, default=DEFAULT_EXACT_LIMIT,
+        help="Maximum number of values for which the quantiles are exact")
+    parser.add_argument(
+        "--accuracy", type=float, default=DEFAULT_ACCURACY,
+        help="Relative accuracy of the quantiles beyond --exact_limit values")
+    args = parser.parse_args()
+
+    aggregate = read(args.input[0], args.exact_limit, args.accuracy, args.stream)
+    for filename in args.input[1:]:
+        aggregate.merge(read(filename, args.exact_limit, args.accuracy, args.stream))
+
+    if args.save:
+        aggregate.save(args.save)
+
+    for statistic in args.statistics.split(','):
+        values = ' '.join([str(v) for v in aggregate.statistic(statistic)])
+        if args.abscissa:
+            filename = args.output.format(statistic = statistic)
+            if os.path.dirname(filename) and not os.path.isdir(os.path.dirname(filename)):
+                os.makedirs(os.path.dirname(filename))
+            with open(filename, 'a') as outfile:
+                outfile.write('{} {}\n'.format(args.abscissa, values))
+        else:
+            print statistic, values
@@ -0,0 +1,289 @@
+#!/usr/bin/python
+"""Measure the execution time of the steady-state computations"""
+
+__author__  = "Claudio Cicconetti"
+__version__ = "0.1.0"
+__license__ = "MIT"
+
+import argparse
+import json
+import platform
+import sys
+import time
+import numpy as np
+import steadystate
+import configuration
+
+# phases of SteadyState timed separately, in order of execution
+PHASES = ['construction', 'tables', 'delta', 'deltabar', 'transition', 'probabilities', 'absorbing']
+
+def make_configurations(clients, servers, runs, seed = 0, chi = 0.1, single = False):
+    """
+    Return a list of random configurations.
+
+    The load of every client is drawn in [0.1, 0.3] and the serving rate of
+    every server is such that the average utilization is about 0.2, so that
+    most states are stable irrespective of the number of clients.
+    """
+
+    rng = np.random.RandomState(seed)
+    num_servers_per_client = 1 if single else 2
+    assert servers >= num_servers_per_client
+
+    ret = []
+    for n in range(runs):
+        load = rng.uniform(0.1, 0.3, clients)
+        mu = rng.uniform(0.5, 1.5, servers) * 5.0 * load.sum() / servers
+        association = np.zeros([clients, servers], dtype=int)
+        for i in range(clients):
+            association[i, rng.choice(servers, num_servers_per_client, replace=False)] = 1
+        ret.append(configuration.Configuration(
+            chi = chi,
+            tau = np.zeros([clients, servers]),
+            x = np.ones([clients]),
+            load = load,
+            mu = mu,
+            association = association))
+
+    return ret
+
+def timed(func):
+    "Return the time required to call func, in s"
+
+    now = time.time()
+    func()
+    return time.time() - now
+
+def bench_phases(conf, options):
+    """
+    Return a dictionary with the time required by every phase of SteadyState,
+    which is None for the steady state probabilities if the transition
+    matrix is degenerate.
+    """
+
+    ret = dict()
+    holder = []
+
+    ret['construction'] = timed(lambda: holder.append(steadystate.SteadyState(conf, **options)))
+    ss = holder[0]
+
+    # servers assigned to and probed by all clients in all states
+    clients = np.arange(ss.nclients)[:, np.newaxis]
+    states = np.arange(ss.nstates)
+    ret['tables'] = timed(lambda: (ss.server(clients, states), ss.server(clients, states, True)))
+
+    # the delay matrices are private, and computed on demand by the other phases
+    ret['delta'] = timed(ss._SteadyState__delta)
+    ret['deltabar'] = timed(ss._SteadyState__deltabar)
+
+    try:
+        ret['transition'] = timed(ss.transition)
+        ret['probabilities'] = timed(ss.probabilities)
+    except steadystate.DegenerateException:
+        ret.setdefault('transition', None)
+        ret['probabilities'] = None
+
+    ret['absorbing'] = timed(ss.absorbing)
+
+    return ret
+
+def bench_single(confs):
+    "Return the time required by SteadyStateSingle, per configuration and in batch"
+
+    def sequential():
+        for conf in confs:
+            steadystate.SteadyStateSingle(conf).steady_state_delays()
+
+    def batch():
+        steadystate.SteadyStateSingle.batch_delays(configuration.ConfigurationBatch.stack(confs))
+
+    return {'sequential': timed(sequential), 'batch': timed(batch)}
+
+def bench_simulator(confs, workers, processes, options):
+    "Return the time required by Simulator to run all configurations"
+
+    sim = steadystate.Simulator(nthreads = workers, processes = processes, options = options)
+    return timed(lambda: sim.run(confs))
+
+def best(values):
+    "Return the minimum of the valid measurements, None if there are none"
+
+    values = [v for v in values if v is not None]
+    return min(values) if len(values) > 0 else None
+
+def run(clients, servers, repetitions = 3, runs = 4, workers = 1,
+        processes = False, seed = 0, options = None, verbose = False):
+    """
+    Run the benchmarks for all combinations of the number of clients and
+    servers, returning a list of records, each with the benchmark name,
+    its parameters, and the best time across the repetitions.
+    """
+
+    options = options if options is not None else dict()
+    records = []
+
+    def add(record, seconds):
+        record['time'] = seconds
+        records.append(record)
+        if verbose:
+            print '{:<10} {:<14} clients {:>3} servers {:>3} workers {:>3}: {}'.format(
+                record['benchmark'], record.get('phase', ''), record['clients'],
+                record['servers'], record.get('workers', ''), seconds)
+            sys.stdout.flush()
+
+    for m in servers:
+        for n in clients:
+            confs = make_configurations(n, m, repetitions, seed = seed)
+            times = [bench_phases(conf, options) for conf in confs]
+            for phase in PHASES:
+                add({'benchmark': 'phases', 'phase': phase, 'clients': n, 'servers': m},
+                    best([t[phase] for t in times]))
+
+            single = make_configurations(n, m, runs, seed = seed, single = True)
+            times = [bench_single(single) for r in range(repetitions)]
+            for kind in ['sequential', 'batch']:
+                add({'benchmark': 'single', 'phase': kind, 'clients': n, 'servers': m},
+                    best([t[kind] for t in times]))
+
+            confs = make_configurations(n, m, runs, seed = seed)
+            for w in range(1, workers + 1):
+                add({'benchmark': 'simulator', 'phase': 'processes' if processes else 'threads',
+                     'clients': n, 'servers': m, 'workers': w},
+                    best([bench_simulator(confs, w, processes, options) for r in range(repetitions)]))
+
+    return records
+
+def record_key(record):
+    "Return the fields identifying a measurement, i.e., all but the time"
+
+    return tuple(sorted([(k, v) for (k, v) in record.items() if k != 'time']))
+
+def compare(baseline, current, threshold = 1.5, min_time = 1e-3):
+    """
+    Compare two lists of records, returning a list of tuples with the key,
+    the baseline and current time, and their ratio, for the measurements
+    in both, ordered by decreasing ratio.
+
+    Also return the list of the regressions, i.e., the entries where the
+    current time exceeds the baseline by more than threshold times, with
+    times smaller than min_time ignored as too noisy.
+    """
+
+    old = dict([(record_key(r), r['time']) for r in baseline])
+
+    ret = []
+    regressions = []
+    for r in current:
+        key = record_key(r)
+        if key not in old or old[key] is None or r['time'] is None:
+            continue
+        ratio = r['time'] / old[key] if old[key] > 0 else float('inf')
+        entry = (key, old[key], r['time'], ratio)
+        ret.append(entry)
+        if r['time'] >= min_time and ratio > threshold:
+            regressions.append(entry)
+
+    ret.sort(key = lambda e: -e[3])
+    regressions.sort(key = lambda e: -e[3])
+    return (ret, regressions)
+
+def int_list(value):
+    "Parse a comma-separated list of integers, or ranges such as 2-10"
+
+    ret = []
+    for item in value.split(','):
+        if '-' in item:
+            (first, last) = item.split('-')
+            ret += range(int(first), int(last) + 1)
+        else:
+            ret.append(int(item))
+    return ret
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument(
+        "--verbose", action="store_true", default=False,
+        help="Print every measurement as soon as available")
+    parser.add_argument(
+        "--clients", type=int_list, default=int_list('2,4,6,8,10'),
+        help="Numbers of clients, comma-separated, ranges allowed (e.g., 2-10)")
+    parser.add_argument(
+        "--servers", type=int_list, default=int_list('2,4'),
+        help="Numbers of servers, comma-separated, ranges allowed")
+    parser.add_argument(
+        "--repetitions", type=int, default=3,
+        help="Number of repetitions of every measurement, the best one is kept")
+    parser.add_argument(
+        "--runs", type=int, default=4,
+        help="Number of configurations run by Simulator and SteadyStateSingle")
+    parser.add_argument(
+        "--workers", type=int, default=1,
+        help="Maximum number of workers of Simulator, all from 1 are measured")
+    parser.add_argument(
+        "--processes", action="store_true", default=False,
+        help="Use a pool of processes in Simulator instead of threads")
+    parser.add_argument(
+        "--solver", type=str, default='auto',
+        help="Steady state solver")
+    parser.add_argument(
+        "--no_lumping", action="store_true", default=False,
+        help="Do not lump together indistinguishable clients in Simulator")
+    parser.add_argument(
+        "--seed", type=int, default=0,
+        help="Random number generator's seed")
+    parser.add_argument(
+        "--label", type=str, default='',
+        help="Label saved with the results, e.g., the commit")
+    parser.add_argument(
+        "--output", type=str, default='benchmark.json',
+        help="Output file, in JSON format, empty for none")
+    parser.add_argument(
+        "--compare", type=str, default='',
+        help="Compare with the results in this file, exit with an error if there are regressions")
+    parser.add_argument(
+        "--threshold", type=float, default=1.5,
+        help="Minimum ratio between current and baseline times to report a regression")
+    args = parser.parse_args()
+
+    # consistency checks
+    assert args.repetitions >= 1
+    assert args.runs >= 1
+    assert args.workers >= 1
+    assert args.threshold > 0
+
+    records = run(
+        args.clients, args.servers,
+        repetitions = args.repetitions,
+        runs = args.runs,
+        workers = args.workers,
+        processes = args.processes,
+        seed = args.seed,
+        options = {'solver': args.solver, 'lumping': not args.no_lumping},
+        verbose = args.verbose)
+
+    if args.output:
+        with open(args.output, 'w') as outfile:
+            json.dump({
+                'label': args.label,
+                'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+                'python': platform.python_version(),
+                'numpy': np.__version__,
+                'arguments': vars(args),
+                'records': records,
+                }, outfile, indent=1, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare, 'r') as infile:
+            baseline = json.load(infile)
+
+        (entries, regressions) = compare(baseline['records'], records, args.threshold)
+        print "comparison with {} ({})".format(args.compare, baseline.get('label', ''))
+        for (key, old, new, ratio) in entries:
+            print '{:>8.3f}x {:>12.6f} -> {:>12.6f} s  {}'.format(
+                ratio, old, new, ', '.join(['{}={}'.format(k, v) for (k, v) in key]))
+
+        if len(regressions) > 0:
+            print "{} regressions above {}x".format(len(regressions), args.threshold)
+            sys.exit(1)
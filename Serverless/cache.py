@@ -0,0 +1,215 @@
+"""
+Persistent cache of the results of the steady-state simulations
+"""
+
+__author__  = "Claudio Cicconetti"
+__version__ = "0.1.0"
+__license__ = "MIT"
+
+import numpy as np
+import hashlib
+import os
+import tempfile
+import threading
+import time
+import zipfile
+
+class ResultCache(object):
+    """
+    Content-addressed on-disk cache of simulation results.
+
+    Every result is stored in a separate file, named after the hash of the
+    configuration and simulation settings, and it is written to a temporary
+    file first and then renamed, so that concurrent writers, in different
+    threads or processes, never expose a partial result to the readers.
+
+    If max_size is not None, the least recently used results are removed
+    when the total size of the files exceeds max_size bytes. The size and
+    time of last use of every file are indexed in memory when the cache is
+    opened, and then updated by get() and put(), so that the directory is
+    not scanned again: the results stored meanwhile by other processes are
+    only accounted for when used through this object.
+    """
+
+    def __init__(self, directory, max_size = None):
+        assert max_size is None or max_size > 0
+
+        self.directory = directory
+        self.max_size  = max_size
+
+        if not os.path.isdir(self.directory):
+            try:
+                os.makedirs(self.directory)
+            except OSError:
+                # created meanwhile by someone else
+                if not os.path.isdir(self.directory):
+                    raise
+
+        # size and time of last use of every file, by path, see evict()
+        self.lock  = threading.Lock()
+        self.index = dict()
+        self.total = 0
+        if self.max_size is not None:
+            self.__scan()
+        self.evict()
+
+    def __getstate__(self):
+        "Return the state to be pickled, i.e., all but the lock"
+
+        state = dict(self.__dict__)
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        "Restore the state after unpickling, with a new lock"
+
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def key(configuration, mode, options = None):
+        """
+        Return the key of the result of a simulation.
+
+        mode identifies the quantity computed, e.g., 'single', 'dual' or
+        'absorbing', and options are the settings of the simulation, e.g.,
+        the solver, as a dictionary.
+        """
+
+        h = hashlib.sha1()
+        for name in ['tau', 'x', 'load', 'mu']:
+            value = np.ascontiguousarray(getattr(configuration, name), dtype=np.float64)
+            h.update('{}:{}:'.format(name, value.shape))
+            h.update(value.tobytes())
+        value = np.ascontiguousarray(configuration.association, dtype=np.int64)
+        h.update('association:{}:'.format(value.shape))
+        h.update(value.tobytes())
+        h.update('chi:{!r}:'.format(float(configuration.chi)))
+        h.update('mode:{}:'.format(mode))
+        h.update('options:{!r}'.format(sorted((options if options is not None else dict()).items())))
+
+        return h.hexdigest()
+
+    def __path(self, key):
+        "Return the path of the file of a result"
+
+        return os.path.join(self.directory, key[:2], key + '.npz')
+
+    def get(self, key):
+        """
+        Return the result with given key, or None if not present.
+
+        The result is a dictionary with the average delays, which are None
+        if not available, the list of absorbing states, and the steady state
+        probabilities, which are None if they have not been stored, and
+        those of the lumped chain if lumped is True, see LumpedChain.
+        """
+
+        path = self.__path(key)
+        try:
+            with np.load(path) as data:
+                ret = {
+                    'delays': data['delays'] if data['has_delays'] else None,
+                    'absorbing': data['absorbing'].tolist(),
+                    'pi': data['pi'] if data['has_pi'] else None,
+                    'lumped': bool(data['lumped']) if 'lumped' in data else False,
+                    }
+
+        except (IOError, OSError, KeyError, ValueError, zipfile.BadZipfile):
+            # missing, just evicted, or corrupted
+            return None
+
+        # mark as recently used
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        if self.max_size is not None:
+            self.__touch(path)
+
+        return ret
+
+    def put(self, key, delays = None, absorbing = None, pi = None, lumped = False):
+        """
+        Store a result, replacing the one with the same key, if any, where
+        lumped is True if pi are the probabilities of the lumped chain.
+        """
+
+        path = self.__path(key)
+        directory = os.path.dirname(path)
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                if not os.path.isdir(directory):
+                    raise
+
+        (fd, tmppath) = tempfile.mkstemp(suffix='.tmp', dir=directory)
+        try:
+            with os.fdopen(fd, 'wb') as outfile:
+                np.savez(
+                    outfile,
+                    has_delays = delays is not None,
+                    delays = delays if delays is not None else np.zeros(0),
+                    absorbing = np.array(absorbing if absorbing is not None else [], dtype=np.int64),
+                    has_pi = pi is not None,
+                    pi = pi if pi is not None else np.zeros(0),
+                    lumped = lumped)
+            os.rename(tmppath, path)
+
+        except:
+            try:
+                os.remove(tmppath)
+            except OSError:
+                pass
+            raise
+
+        if self.max_size is not None:
+            self.__touch(path)
+            self.evict()
+
+    def __touch(self, path):
+        "Update the size and time of last use of a file in the index"
+
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            return
+        with self.lock:
+            (mtime, old) = self.index.get(path, (0, 0))
+            self.index[path] = (time.time(), size)
+            self.total += size - old
+
+    def __scan(self):
+        "Index the size and time of last use of all the files in the directory"
+
+        self.index = dict()
+        for (dirpath, dirnames, filenames) in os.walk(self.directory):
+            for filename in filenames:
+                if not filename.endswith('.npz'):
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                self.index[path] = (stat.st_mtime, stat.st_size)
+        self.total = sum([size for (mtime, size) in self.index.values()])
+
+    def evict(self):
+        "Remove the least recently used results until the cache fits max_size"
+
+        if self.max_size is None or self.total <= self.max_size:
+            return
+
+        with self.lock:
+            for (path, (mtime, size)) in sorted(self.index.items(), key = lambda e: e[1][0]):
+                if self.total <= self.max_size:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    # removed meanwhile by someone else
+                    pass
+                del self.index[path]
+                self.total -= size
@@ -4,6 +4,9 @@ __author__  = "Claudio Cicconetti"
 __version__ = "0.1.0"
 __license__ = "MIT"
 
+import numpy as np
+import os
+
 class DegenerateException(Exception):
     """Raised when the transition matrix is degenerate"""
     pass
@@ -34,3 +37,90 @@ class Configuration(object):
         self.load        = load
         self.mu          = mu
         self.association = association
+
+class ConfigurationBatch(object):
+    """Stack of configurations with the same number of clients and servers"""
+
+    # arrays saved, one .npy file each, see save()
+    FIELDS = ['chi', 'tau', 'x', 'load', 'mu', 'association']
+
+    def __init__(self,
+                 chi,
+                 tau,
+                 x,
+                 load,
+                 mu,
+                 association):
+
+        # consistency checks
+        assert len(chi.shape) == 1
+        assert np.all((0 < chi) & (chi < 1))
+        assert len(tau.shape) == 3
+        assert len(x.shape) == 2
+        assert len(load.shape) == 2
+        assert len(mu.shape) == 2
+        assert len(association.shape) == 3
+        assert tau.shape == association.shape
+        assert chi.shape[0] == tau.shape[0] == x.shape[0] == load.shape[0] == mu.shape[0]
+        assert x.shape[1] == load.shape[1] == tau.shape[1]
+        assert mu.shape[1] == tau.shape[2]
+
+        # save input values, the first dimension is the configuration index
+        self.chi         = chi
+        self.tau         = tau
+        self.x           = x
+        self.load        = load
+        self.mu          = mu
+        self.association = association
+
+    @staticmethod
+    def stack(configurations):
+        "Return a batch with the given list of Configuration objects"
+
+        return ConfigurationBatch(
+            chi = np.array([c.chi for c in configurations], dtype=float),
+            tau = np.array([c.tau for c in configurations]),
+            x = np.array([c.x for c in configurations]),
+            load = np.array([c.load for c in configurations]),
+            mu = np.array([c.mu for c in configurations]),
+            association = np.array([c.association for c in configurations]))
+
+    def __len__(self):
+        return self.tau.shape[0]
+
+    def __getitem__(self, ndx):
+        "Return the configuration with given index"
+
+        return Configuration(
+            chi = self.chi[ndx],
+            tau = self.tau[ndx],
+            x = self.x[ndx],
+            load = self.load[ndx],
+            mu = self.mu[ndx],
+            association = self.association[ndx])
+
+    def save(self, directory):
+        """
+        Save the batch in a directory, created if needed, with one .npy file
+        per array, whose first dimension is the configuration index.
+        """
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        for field in ConfigurationBatch.FIELDS:
+            np.save(os.path.join(directory, field + '.npy'), getattr(self, field))
+
+    @staticmethod
+    def load(directory, mmap = True):
+        """
+        Return the batch saved in a directory with save(), whose arrays are
+        memory-mapped read-only, unless mmap is False, so that only the
+        configurations used are read from disk.
+        """
+
+        arrays = dict()
+        for field in ConfigurationBatch.FIELDS:
+            arrays[field] = np.load(
+                os.path.join(directory, field + '.npy'), mmap_mode = 'r' if mmap else None)
+
+        return ConfigurationBatch(**arrays)
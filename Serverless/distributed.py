@@ -0,0 +1,384 @@
+#!/usr/bin/python
+"""Execute the simulations of a coordinator in worker processes on any host"""
+
+__author__  = "Claudio Cicconetti"
+__version__ = "0.1.0"
+__license__ = "MIT"
+
+import argparse
+import multiprocessing
+import os
+import socket
+import threading
+import time
+from multiprocessing.managers import BaseManager
+
+# default duration of the leases of the jobs, in s
+DEFAULT_LEASE = 60
+
+# default number of times a job is given to another worker when its lease expires
+DEFAULT_RETRIES = 3
+
+# interval between consecutive requests of an idle worker, in s
+POLL_INTERVAL = 0.1
+
+# environment variable with the authentication key, if not given explicitly
+AUTHKEY_VARIABLE = 'SERVERLESS_AUTHKEY'
+
+class WorkQueue(object):
+    """
+    Queue of the jobs of a coordinator, shared with the workers.
+
+    Every job is leased to a worker when taken with get(), for lease
+    seconds, during which the worker must renew it, with renew(), or return
+    its result, with put(). When a lease expires, e.g., because the worker
+    or its host have crashed, the job is taken again by another worker, up
+    to retries times, after which it is considered lost: its result is
+    that of a skipped simulation, see steadystate._simulate(), with lost set
+    to True in the execution statistics. A job whose simulation raises an
+    exception is reported by its worker in the same way, with failed set
+    to True and the error in the statistics, see work(). Only the first result of every job
+    is kept, since a job retried may be completed more than once.
+
+    The results are returned to the coordinator by collect() in order of
+    completion, each with its job index.
+    """
+
+    def __init__(self):
+        self.lock        = threading.Lock()
+        self.settings    = None
+        self.lease       = DEFAULT_LEASE
+        self.max_retries = DEFAULT_RETRIES
+
+        self.configurations = []
+        self.pending        = []
+        self.leases         = dict()
+        self.retries        = dict()
+        self.done           = set()
+        self.completed      = []
+
+    def load(self, configurations, order, settings, lease = DEFAULT_LEASE, retries = DEFAULT_RETRIES,
+             runs = None):
+        """
+        Load the configurations of the jobs, executed in the given order of
+        their indices, and the settings of the simulations, a tuple with the
+        mode, verbose flag, options and budget, see steadystate._simulate(),
+        and the indices of their runs, by default their positions.
+        """
+
+        assert lease > 0
+        assert retries >= 0
+
+        with self.lock:
+            self.configurations = configurations
+            self.runs           = list(runs) if runs is not None else range(len(configurations))
+            self.pending        = list(reversed(order))
+            self.settings       = settings
+            self.lease          = lease
+            self.max_retries    = retries
+            self.leases         = dict()
+            self.retries        = dict()
+            self.done           = set()
+            self.completed      = []
+
+    def parameters(self):
+        """
+        Return the settings of the simulations followed by the duration of
+        the leases, or None if the jobs have not been loaded yet.
+        """
+
+        return self.settings + (self.lease,) if self.settings is not None else None
+
+    def get(self, worker, size = 1):
+        """
+        Lease up to size jobs to a worker, and return the list of tuples
+        with their index, run index and configuration, which is empty if there are no
+        jobs available at the moment, or None if all have been completed.
+        """
+
+        with self.lock:
+            self.__expire()
+
+            if self.settings is None or len(self.pending) == 0:
+                return None if self.settings is not None and len(self.leases) == 0 else []
+
+            ret = []
+            while len(self.pending) > 0 and len(ret) < size:
+                job = self.pending.pop()
+                self.leases[job] = (worker, time.time() + self.lease)
+                ret.append((job, self.runs[job], self.configurations[job]))
+            return ret
+
+    def renew(self, worker):
+        "Renew the leases of all the jobs of a worker"
+
+        with self.lock:
+            deadline = time.time() + self.lease
+            for (job, (owner, expiry)) in self.leases.items():
+                if owner == worker:
+                    self.leases[job] = (worker, deadline)
+
+    def put(self, worker, job, result):
+        """
+        Save the result of a job, a tuple returned by steadystate._simulate(),
+        unless it has been already completed.
+        """
+
+        with self.lock:
+            if job in self.done:
+                return
+            self.leases.pop(job, None)
+            if job in self.pending:
+                self.pending.remove(job)
+            self.__complete(job, result)
+
+    def collect(self):
+        "Return the list of the results completed since the last call"
+
+        with self.lock:
+            self.__expire()
+            ret = self.completed
+            self.completed = []
+            return ret
+
+    def __expire(self):
+        "Give the jobs whose lease has expired to other workers, or drop them"
+
+        now = time.time()
+        for (job, (owner, expiry)) in self.leases.items():
+            if expiry > now:
+                continue
+            del self.leases[job]
+            self.retries[job] = self.retries.get(job, 0) + 1
+            if self.retries[job] > self.max_retries:
+                self.__complete(job, (0.0, None, None, {'lost': True, 'retries': self.max_retries}))
+            else:
+                self.pending.append(job)
+
+    def __complete(self, job, result):
+        "Mark a job as completed with the given result"
+
+        self.done.add(job)
+        self.completed.append((job, result))
+
+# the work queue served by the coordinator, see _work_queue()
+_queue = []
+
+def _work_queue():
+    "Return the work queue of this process, created when first used"
+
+    if len(_queue) == 0:
+        _queue.append(WorkQueue())
+    return _queue[0]
+
+class QueueManager(BaseManager):
+    "Manager serving the work queue of a coordinator"
+
+QueueManager.register('queue', callable = _work_queue)
+
+def parse_address(value):
+    "Return the tuple with the host and port of an address in the form host:port"
+
+    (host, port) = value.rsplit(':', 1)
+    return (host, int(port))
+
+def find_authkey(authkey = None):
+    """
+    Return the authentication key shared by a coordinator and its workers:
+    the given one, if not empty, otherwise that in the environment variable
+    AUTHKEY_VARIABLE, if set, otherwise None.
+
+    There is no default key, since the coordinator and the workers unpickle
+    whatever they receive from the peers that know it.
+    """
+
+    if authkey:
+        return authkey
+    return os.environ.get(AUTHKEY_VARIABLE, None) or None
+
+def random_authkey():
+    "Return a new random authentication key, in hexadecimal"
+
+    return os.urandom(16).encode('hex')
+
+def worker_name():
+    "Return a name identifying the current worker process on any host"
+
+    return "{}:{}".format(socket.gethostname(), os.getpid())
+
+class Coordinator(object):
+    """
+    Serve the jobs of a Simulator to workers on any host, which connect
+    to the given address, a tuple with the host and port, where the
+    port is chosen by the operating system if 0, see address.
+
+    The work queue is served by a separate process, started with start(),
+    from which the results are collected with collect(), and stopped with
+    shutdown(). Local workers can be started with spawn().
+
+    The authkey cannot be empty, see find_authkey().
+    """
+
+    def __init__(self, address, authkey):
+        assert authkey
+
+        self.manager = QueueManager(address = address, authkey = authkey)
+        self.authkey = authkey
+        self.address = None
+        self.queue   = None
+        self.workers = []
+
+    def start(self, configurations, order, settings, lease = DEFAULT_LEASE, retries = DEFAULT_RETRIES,
+              runs = None):
+        """
+        Start serving the jobs with the given configurations, in the given
+        order, see WorkQueue.load().
+        """
+
+        self.manager.start()
+        self.address = self.manager.address
+        self.queue = self.manager.queue()
+        self.queue.load(configurations, order, settings, lease, retries, runs)
+
+    def spawn(self, nworkers):
+        "Start the given number of worker processes on this host"
+
+        for i in range(nworkers):
+            p = multiprocessing.Process(target = work, args = (self.address, self.authkey))
+            p.daemon = True
+            p.start()
+            self.workers.append(p)
+
+    def collect(self):
+        "Return the results completed since the last call, see WorkQueue.collect()"
+
+        return self.queue.collect()
+
+    def alive(self):
+        "Return the number of local workers still running"
+
+        return len([p for p in self.workers if p.is_alive()])
+
+    def shutdown(self, abort = False):
+        """
+        Wait for the local workers to terminate and stop serving the jobs.
+
+        With abort, e.g., on errors or when interrupted, the local workers
+        are terminated first, instead of running until all the jobs are
+        done, and the remote ones find the coordinator unreachable.
+        """
+
+        if abort:
+            for p in self.workers:
+                p.terminate()
+        for p in self.workers:
+            p.join()
+        self.workers = []
+        self.queue = None
+        self.manager.shutdown()
+
+def work(address, authkey, batch = 1, name = None):
+    """
+    Execute the jobs of the coordinator at the given address, until all
+    have been completed or the coordinator is not reachable.
+
+    The jobs are taken batch at a time, and their leases are renewed by a
+    separate thread, while running. If a simulation raises an exception,
+    the job is completed as skipped, with failed set to True and the error
+    in the statistics, since it would fail in any other worker, too.
+
+    Return the number of jobs executed.
+    """
+
+    # imported here since steadystate depends on this module
+    from steadystate import _simulate
+
+    name = name if name is not None else worker_name()
+    manager = QueueManager(address = address, authkey = authkey)
+
+    executed = 0
+    stop = threading.Event()
+    try:
+        manager.connect()
+        queue = manager.queue()
+
+        # wait for the coordinator to load the jobs
+        settings = queue.parameters()
+        while settings is None:
+            time.sleep(POLL_INTERVAL)
+            settings = queue.parameters()
+        (mode, verbose, options, budget, lease) = settings
+
+        def heartbeat():
+            "Renew the leases of the jobs of this worker"
+
+            while not stop.wait(lease / 3.0):
+                try:
+                    queue.renew(name)
+                except (EOFError, IOError):
+                    break
+
+        t = threading.Thread(target = heartbeat)
+        t.daemon = True
+        t.start()
+
+        while True:
+            jobs = queue.get(name, batch)
+            if jobs is None:
+                break
+            if len(jobs) == 0:
+                time.sleep(POLL_INTERVAL)
+                continue
+            for (job, run, configuration) in jobs:
+                try:
+                    result = _simulate(
+                        configuration, mode, verbose, options, None, False, budget = budget, run = run)
+                except Exception as err:
+                    result = (0.0, None, None, {'failed': True, 'error': repr(err)})
+                queue.put(name, job, result)
+                executed += 1
+
+    except (EOFError, IOError):
+        # the coordinator has terminated
+        pass
+
+    finally:
+        stop.set()
+
+    return executed
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument(
+        "--address", type=str, required=True,
+        help="Address of the coordinator, as host:port, see serverless.py --coordinator")
+    parser.add_argument(
+        "--authkey", type=str, default='',
+        help="Authentication key shared with the coordinator, empty to read it from the {} environment variable".format(AUTHKEY_VARIABLE))
+    parser.add_argument(
+        "--processes", type=int, default=1,
+        help="Number of worker processes to use, 0 for one per CPU core")
+    parser.add_argument(
+        "--batch", type=int, default=1,
+        help="Number of jobs taken at a time by every worker process")
+    args = parser.parse_args()
+
+    # consistency checks
+    assert args.processes >= 0
+    assert args.batch >= 1
+
+    authkey = find_authkey(args.authkey)
+    if authkey is None:
+        parser.error("missing authentication key, use --authkey or {}".format(AUTHKEY_VARIABLE))
+
+    address = parse_address(args.address)
+    workers = []
+    for i in range(args.processes if args.processes > 0 else multiprocessing.cpu_count()):
+        p = multiprocessing.Process(target = work, args = (address, authkey, args.batch))
+        p.start()
+        workers.append(p)
+
+    for p in workers:
+        p.join()
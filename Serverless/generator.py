@@ -0,0 +1,190 @@
+"""
+Generate the configurations of the runs of a serverless edge computing
+system from independent random streams, one per run
+"""
+
+__author__  = "Claudio Cicconetti"
+__version__ = "0.1.0"
+__license__ = "MIT"
+
+import numpy as np
+import random
+from configuration import Configuration, ConfigurationBatch
+
+# constants of the splitmix64 generator
+GOLDEN = np.uint64(0x9E3779B97F4A7C15)
+MIX1   = np.uint64(0xBF58476D1CE4E5B9)
+MIX2   = np.uint64(0x94D049BB133111EB)
+
+# streams of every run
+STREAM_MU          = 0
+STREAM_LOAD        = 1
+STREAM_ASSOCIATION = 2
+NUM_STREAMS        = 3
+
+# key of the seeds of the runs, distinct from the streams, see run_seed()
+SEED_KEY = np.uint64(0x5EED5EED5EED5EED)
+
+def splitmix64(x):
+    "Return the splitmix64 hash of every element of an array of uint64"
+
+    # the arithmetic is modulo 2^64
+    with np.errstate(over='ignore'):
+        z = np.array(x, dtype=np.uint64) + GOLDEN
+        z = (z ^ (z >> np.uint64(30))) * MIX1
+        z = (z ^ (z >> np.uint64(27))) * MIX2
+        return z ^ (z >> np.uint64(31))
+
+def run_seed(seed, run):
+    """
+    Return the seed of a run, in [0, 2^32), derived from the global seed
+    and the run index, e.g., for the random number generator of the Monte
+    Carlo estimator, so that different runs are not correlated.
+    """
+
+    key = splitmix64(splitmix64(np.uint64(seed) ^ SEED_KEY) ^ np.uint64(run))
+    return int(key >> np.uint64(32))
+
+def uniform(seed, runs, stream, size):
+    """
+    Return an array with shape (len(runs), size) of random numbers in [0, 1)
+    drawn from the given stream of every run.
+
+    Every number only depends on the seed, run index, stream and position,
+    i.e., the generator is counter-based: the runs can be generated in any
+    order and in any subset, always with the same result.
+    """
+
+    runs = np.asarray(runs, dtype=np.uint64)
+    key = splitmix64(
+        splitmix64(np.uint64(seed)) ^ (runs * np.uint64(NUM_STREAMS) + np.uint64(stream)))
+    with np.errstate(over='ignore'):
+        counters = np.arange(1, size + 1, dtype=np.uint64) * GOLDEN
+        values = splitmix64(key[:, np.newaxis] + counters[np.newaxis, :])
+
+    # the 53 most significant bits are the mantissa
+    return (values >> np.uint64(11)).astype(np.float64) * 2.0 ** -53
+
+class ConfigurationGenerator(object):
+    """
+    Random configurations with uniform serving rates and loads in the given
+    ranges, and every client associated to candidates servers drawn
+    uniformly without replacement, while chi, the network delays (tau)
+    and the requests (x) are the same for all.
+
+    The configuration of every run is drawn from its own streams, derived
+    from the seed and the run index, see uniform(), hence any batch of runs
+    is generated in one vectorized call, and the workers can generate the
+    runs they execute independently of the others.
+
+    The object is a sequence of the configurations of the runs, which can
+    be passed to Simulator.run().
+    """
+
+    def __init__(self,
+                 runs,
+                 tau,
+                 x,
+                 chi = 0.1,
+                 candidates = 2,
+                 mu_min = 1.0,
+                 mu_max = 1.0,
+                 load_min = 0.1,
+                 load_max = 0.3,
+                 seed = 0):
+
+        # consistency checks
+        assert runs >= 0
+        assert len(tau.shape) == 2
+        assert x.shape[0] == tau.shape[0]
+        assert 1 <= candidates <= tau.shape[1]
+        assert mu_max >= mu_min
+        assert load_max >= load_min
+
+        self.runs       = runs
+        self.tau        = tau
+        self.x          = x
+        self.chi        = chi
+        self.candidates = candidates
+        self.mu_min     = mu_min
+        self.mu_max     = mu_max
+        self.load_min   = load_min
+        self.load_max   = load_max
+        self.seed       = seed
+
+        self.nclients = tau.shape[0]
+        self.nservers = tau.shape[1]
+
+    def __len__(self):
+        return self.runs
+
+    def __getitem__(self, run):
+        "Return the configuration of a run"
+
+        if not 0 <= run < self.runs:
+            raise IndexError("Run index out of range: {}".format(run))
+
+        return self.batch(run, run + 1)[0]
+
+    def batch(self, first, last):
+        "Return a ConfigurationBatch with the runs from first to last (excluded)"
+
+        assert 0 <= first <= last <= self.runs
+
+        runs = np.arange(first, last)
+        nruns = len(runs)
+
+        mu = self.mu_min + (self.mu_max - self.mu_min) * \
+            uniform(self.seed, runs, STREAM_MU, self.nservers)
+        load = self.load_min + (self.load_max - self.load_min) * \
+            uniform(self.seed, runs, STREAM_LOAD, self.nclients)
+
+        # the servers with the smallest keys are a uniform sample without replacement
+        keys = uniform(self.seed, runs, STREAM_ASSOCIATION, self.nclients * self.nservers)
+        keys = keys.reshape([nruns, self.nclients, self.nservers])
+        chosen = np.argsort(keys, axis=2)[:, :, :self.candidates]
+        association = np.zeros([nruns, self.nclients, self.nservers], dtype=int)
+        np.put_along_axis(association, chosen, 1, axis=2)
+
+        return ConfigurationBatch(
+            chi = np.full(nruns, self.chi, dtype=float),
+            tau = np.broadcast_to(self.tau, (nruns,) + self.tau.shape),
+            x = np.broadcast_to(self.x, (nruns,) + self.x.shape),
+            load = load,
+            mu = mu,
+            association = association)
+
+def legacy_configurations(runs, tau, x, chi, candidates, mu_min, mu_max, load_min, load_max):
+    """
+    Return the list of the configurations of the given number of runs, with
+    the same distribution as ConfigurationGenerator, drawn in sequence from
+    the random module, which must be seeded by the caller.
+
+    This is the generator of earlier versions, to reproduce their outputs.
+    """
+
+    (nclients, nservers) = tau.shape
+
+    ret = []
+    for n in range(runs):
+        # random serving rate
+        mu = np.array([random.uniform(mu_min, mu_max) for i in range(nservers)])
+
+        # random load for clients
+        load = np.array([random.uniform(load_min, load_max) for i in range(nclients)])
+
+        # random association
+        association = np.zeros([nclients, nservers], dtype = int)
+        for i in range(nclients):
+            for j in random.sample(range(nservers), candidates):
+                association[i, j] = 1
+
+        ret.append(Configuration(
+            chi = chi,
+            tau = tau,
+            x = x,
+            load = load,
+            mu = mu,
+            association = association))
+
+    return ret
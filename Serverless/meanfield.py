@@ -0,0 +1,249 @@
+"""
+Approximate the steady-state delays of a serverless edge computing system
+with a mean-field model of the clients
+"""
+
+__author__  = "Claudio Cicconetti"
+__version__ = "0.1.0"
+__license__ = "MIT"
+
+import numpy as np
+import time
+from steadystate import SteadyStateGeneric, SteadyState, peak_memory
+
+# default tolerance and maximum number of iterations of the fixed point
+DEFAULT_TOL     = 1e-6
+DEFAULT_MAXITER = 10000
+
+# number of iterations with constant step, after which it starts decreasing
+PATIENCE = 100
+
+class MeanField(SteadyStateGeneric):
+    """
+    Approximate steady-state delays of a serverless edge computing with two
+    options, where every client is assumed to be on its second server with
+    probability p, independently of the others.
+
+    Given p, a client on a server sees the expected load of the other
+    clients, plus its own, and it applies the same remain/leave rule as in
+    SteadyState, see SteadyState.remain(), on its first and second server.
+    If it prefers to leave only one of them then it moves to the other one,
+    if it prefers to leave both then it is on either with equal probability,
+    and if it prefers to remain on both then p does not change.
+
+    The probabilities are updated towards the new values with a step equal
+    to damping, which decreases after PATIENCE iterations, to settle the
+    oscillations, until the largest change is smaller than tol, or after
+    maxiter iterations. Every iteration has a cost proportional
+    to the number of clients and servers. The residual is the largest
+    difference between the probabilities and their new values, which may
+    not vanish where a client is on the edge between leaving and remaining.
+    """
+
+    def __init__(self,
+                 configuration,
+                 verbose = False,
+                 damping = 0.5,
+                 tol = None,
+                 maxiter = None,
+                 nodes = 7,
+                 p0 = None):
+
+        super(MeanField, self).__init__(verbose)
+
+        # consistency checks
+        assert 0 < damping <= 1
+        assert nodes >= 1
+
+        # fixed point parameters
+        self.damping = damping
+        self.tol     = tol if tol is not None else DEFAULT_TOL
+        self.maxiter = maxiter if maxiter is not None else DEFAULT_MAXITER
+
+        # quadrature of the standard normal distribution
+        (nodes, weights) = np.polynomial.hermite_e.hermegauss(nodes)
+        self.nodes   = nodes
+        self.weights = weights / weights.sum()
+
+        # input
+        self.chi         = configuration.chi
+        self.tau         = configuration.tau
+        self.x           = configuration.x
+        self.load        = configuration.load
+        self.mu          = configuration.mu
+        self.association = configuration.association
+
+        #
+        # derived variables
+        #
+
+        # lazy initialization variables
+        self.p      = None
+        self.delays = None
+
+        # initial guess of the probabilities
+        self.p0     = p0
+
+        # execution statistics, see SteadyState.record()
+        self.stats  = dict()
+
+        # scalars
+        self.nclients = self.tau.shape[0]
+        self.nservers = self.tau.shape[1]
+
+        # possible servers for each client
+        self.possible_servers = np.zeros([self.nclients, 2], dtype=int)
+        for i in range(self.nclients):
+            server_list = np.flatnonzero(self.association[i] == 1)
+            assert len(server_list) == 2
+            self.possible_servers[i] = server_list
+        self.first  = self.possible_servers[:, 0]
+        self.second = self.possible_servers[:, 1]
+
+        # further size checks
+        assert self.x.shape[0] == self.nclients
+        assert self.load.shape[0] == self.nclients
+        assert self.mu.shape[0] == self.nservers
+        assert self.association.shape[0] == self.nclients
+        assert self.association.shape[1] == self.nservers
+
+    def clear(self):
+        "Remove all derived data structures"
+
+        self.p      = None
+        self.delays = None
+        self.stats  = dict()
+
+    def debugPrint(self, printDelay = False):
+        "Print the internal data structures"
+
+        self.printMat("Network delays",   self.tau)
+        self.printMat("Requests",         self.x)
+        self.printMat("Request rates",    self.load)
+        self.printMat("Server rates",     self.mu)
+        self.printMat("Associations",     self.association)
+        self.printMat("Possible servers", self.possible_servers)
+
+        if printDelay:
+            self.printMat("Steady state average delays", self.steady_state_delays())
+            self.printMat("Probability of the second server", self.p)
+
+    def delays_given(self, p):
+        """
+        Return the average delays of every client when on its first and
+        second server (first index), served and probing the other server
+        (second index), for every pair of values of the load of the other
+        clients on the two servers (last two indices), given the probability
+        of every client to be on its second server.
+
+        The array returned has shape (2, 2, nclients, nodes, nodes), where
+        the values of the load are the nodes of a Gauss-Hermite quadrature
+        of a normal distribution with the mean and variance of the load of
+        the other clients, which are independent Bernoulli variables.
+        """
+
+        # mean and variance of the capacity left on every server
+        served = np.bincount(self.first, (1 - p) * self.load, self.nservers) + \
+            np.bincount(self.second, p * self.load, self.nservers)
+        probed = np.bincount(self.first, p * self.load, self.nservers) + \
+            np.bincount(self.second, (1 - p) * self.load, self.nservers)
+        available = self.mu - served - self.chi * probed
+
+        # a client weighs load on the server it is served by, chi times that
+        # when probing, hence its contribution varies by (1 - chi) times its load
+        own = (1 - self.chi) * self.load
+        variance = own ** 2 * p * (1 - p)
+        variances = np.bincount(self.first, variance, self.nservers) + \
+            np.bincount(self.second, variance, self.nservers)
+
+        # the expected load includes that of the client itself, which is
+        # replaced by the actual one: on the first server, it adds p times
+        # its load to the served load there and removes it from the probed
+        # load of the second server, and vice versa on the second server
+        means = np.array([
+            [available[self.first] - p * own, available[self.second] + p * own],
+            [available[self.second] - (1 - p) * own, available[self.first] + (1 - p) * own]])
+        deviations = np.sqrt(np.maximum(np.array([
+            [variances[self.first] - variance, variances[self.second] - variance],
+            [variances[self.second] - variance, variances[self.first] - variance]]), 0))
+        servers = np.array([[self.first, self.second], [self.second, self.first]])
+
+        # nodes of the server serving on the next to last index, probing on the last one
+        nodes = np.zeros([2, len(self.nodes), len(self.nodes)])
+        nodes[0] = self.nodes[:, np.newaxis]
+        nodes[1] = self.nodes[np.newaxis, :]
+        denominators = means[..., np.newaxis, np.newaxis] + \
+            deviations[..., np.newaxis, np.newaxis] * nodes[np.newaxis, :, np.newaxis]
+
+        mu = self.mu[servers][..., np.newaxis, np.newaxis]
+        stable = denominators > 0
+        tau = self.tau[np.arange(self.nclients), servers][..., np.newaxis, np.newaxis]
+        x = self.x[:, np.newaxis, np.newaxis]
+        return np.where(stable, tau + x * mu / np.where(stable, denominators, 1.0), -1.0)
+
+    def probabilities(self):
+        "Compute the probability of every client to be on its second server"
+
+        if self.p is not None:
+            return self.p
+
+        now = time.time()
+
+        p = np.full(self.nclients, 0.5) if self.p0 is None else np.array(self.p0, dtype=float)
+        change = np.inf
+        residual = np.inf
+        iterations = 0
+        while change > self.tol and iterations < self.maxiter:
+            (leave_first, leave_second) = self.leaving(p)
+
+            # rate of switching from the first to the second server is
+            # proportional to the probability of leaving the first, and
+            # vice versa, hence the stationary probability of the second
+            rate = leave_first + leave_second
+            target = np.where(rate > 0, leave_first / np.where(rate > 0, rate, 1.0), p)
+
+            step = self.damping / (1.0 + max(0, iterations - PATIENCE) * self.damping)
+            residual = np.max(np.abs(target - p))
+            update = step * (target - p)
+            p += update
+            change = np.max(np.abs(update))
+            iterations += 1
+
+        self.p = p
+
+        self.stats['time_solve']  = time.time() - now
+        self.stats['iterations']  = iterations
+        self.stats['residual']    = float(residual)
+        self.stats['converged']   = bool(change <= self.tol)
+        self.stats['peak_memory'] = peak_memory()
+
+        if self.verbose:
+            print "Mean field: {} iterations, change {}{}".format(
+                iterations, change, "" if change <= self.tol else " (not converged)")
+
+        return self.p
+
+    def leaving(self, p):
+        """
+        Return the probability of every client to prefer leaving its first
+        and second server, respectively, given the probability of every
+        client to be on its second server.
+        """
+
+        delays = self.delays_given(p)
+        leave = np.logical_not(SteadyState.remain(delays[:, 0], delays[:, 1]))
+        return np.dot(np.dot(leave, self.weights), self.weights)
+
+    def steady_state_delays(self):
+        "Return the average delay per client"
+
+        if self.delays is not None:
+            return self.delays
+
+        p = self.probabilities()
+
+        # the delay when served does not depend on the load of the server probed
+        delays = np.dot(self.delays_given(p)[:, 0, :, :, 0], self.weights)
+        self.delays = (1 - p) * delays[0] + p * delays[1]
+
+        return self.delays
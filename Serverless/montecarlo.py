@@ -0,0 +1,213 @@
+"""
+Estimate the steady-state delays of a serverless edge computing system
+by simulating the Markov chain
+"""
+
+__author__  = "Claudio Cicconetti"
+__version__ = "0.1.0"
+__license__ = "MIT"
+
+import numpy as np
+import scipy.stats
+import time
+from steadystate import SteadyStateGeneric, SteadyState, peak_memory
+
+class MonteCarlo(SteadyStateGeneric):
+    """
+    Steady-state delays of a serverless edge computing with two options,
+    estimated by simulating many independent trajectories of the same chain
+    solved by SteadyState, which is not limited by the number of states.
+
+    In every state all the transitions have the same rate, and the total
+    rate of leaving a state is always 1: after an exponential time with unit
+    mean, a uniformly random non-empty subset of the clients that prefer to
+    leave, see SteadyState.remain(), switch to the server they probe. Since
+    the holding times do not depend on the state, they are replaced by their
+    mean and the time average of the delays is the average over the states
+    visited. A trajectory reaching an absorbing state remains there forever.
+
+    The trajectories are advanced together, in batches of steps, and the
+    simulation stops when the confidence interval of the average delay of
+    every client is smaller than precision times the average, or after
+    max_steps steps.
+    """
+
+    def __init__(self,
+                 configuration,
+                 verbose = False,
+                 trajectories = 64,
+                 precision = 0.01,
+                 confidence = 0.95,
+                 warmup = 1000,
+                 batch_steps = 1000,
+                 max_steps = 1000000,
+                 seed = None):
+
+        super(MonteCarlo, self).__init__(verbose)
+
+        # consistency checks
+        assert trajectories >= 2
+        assert precision > 0
+        assert 0 < confidence < 1
+        assert warmup >= 0
+        assert batch_steps >= 1
+        assert max_steps >= batch_steps
+
+        # simulation parameters
+        self.trajectories = trajectories
+        self.precision    = precision
+        self.confidence   = confidence
+        self.warmup       = warmup
+        self.batch_steps  = batch_steps
+        self.max_steps    = max_steps
+        self.rng          = np.random.RandomState(seed)
+
+        # input
+        self.chi         = configuration.chi
+        self.tau         = configuration.tau
+        self.x           = configuration.x
+        self.load        = configuration.load
+        self.mu          = configuration.mu
+        self.association = configuration.association
+
+        #
+        # derived variables
+        #
+
+        # lazy initialization variables
+        self.delays    = None
+        self.intervals = None
+
+        # execution statistics, see SteadyState.record()
+        self.stats     = dict()
+
+        # scalars
+        self.nclients = self.tau.shape[0]
+        self.nservers = self.tau.shape[1]
+
+        # possible servers for each client
+        self.possible_servers = np.zeros([self.nclients, 2], dtype=int)
+        for i in range(self.nclients):
+            server_list = np.flatnonzero(self.association[i] == 1)
+            assert len(server_list) == 2
+            self.possible_servers[i] = server_list
+
+        # load offered by every client (row) to its first and second server (column)
+        clients = np.arange(self.nclients)
+        self.on_first = np.zeros([self.nclients, self.nservers])
+        self.on_first[clients, self.possible_servers[:, 0]] = self.load
+        self.on_second = np.zeros([self.nclients, self.nservers])
+        self.on_second[clients, self.possible_servers[:, 1]] = self.load
+
+        # further size checks
+        assert self.x.shape[0] == self.nclients
+        assert self.load.shape[0] == self.nclients
+        assert self.mu.shape[0] == self.nservers
+        assert self.association.shape[0] == self.nclients
+        assert self.association.shape[1] == self.nservers
+
+    def clear(self):
+        "Remove all derived data structures"
+
+        self.delays    = None
+        self.intervals = None
+        self.stats     = dict()
+
+    def debugPrint(self, printDelay = False):
+        "Print the internal data structures"
+
+        self.printMat("Network delays",   self.tau)
+        self.printMat("Requests",         self.x)
+        self.printMat("Request rates",    self.load)
+        self.printMat("Server rates",     self.mu)
+        self.printMat("Associations",     self.association)
+        self.printMat("Possible servers", self.possible_servers)
+
+        if printDelay:
+            self.printMat("Steady state average delays", self.steady_state_delays())
+            self.printMat("Confidence intervals", self.intervals)
+
+    def delays_in(self, second):
+        """
+        Return the average delays of every client when served and when
+        probing, where second[t, i] is True if client i is served by its
+        second server in trajectory t.
+        """
+
+        first = np.logical_not(second)
+        served = np.dot(first, self.on_first) + np.dot(second, self.on_second)
+        probed = np.dot(second, self.on_first) + np.dot(first, self.on_second)
+
+        def delays(servers):
+            rows = np.arange(second.shape[0])[:, np.newaxis]
+            mu = self.mu[servers]
+            denominator = mu - served[rows, servers] - self.chi * probed[rows, servers]
+            stable = denominator > 0
+            tau = self.tau[np.arange(self.nclients), servers]
+            return np.where(stable, tau + self.x * mu / np.where(stable, denominator, 1.0), -1.0)
+
+        serving = np.where(second, self.possible_servers[:, 1], self.possible_servers[:, 0])
+        probing = np.where(second, self.possible_servers[:, 0], self.possible_servers[:, 1])
+
+        return (delays(serving), delays(probing))
+
+    def step(self, second, leaving):
+        """
+        Move every trajectory to the next state, given the clients that prefer
+        to leave, and return the new state.
+        """
+
+        # uniform non-empty subset of the clients leaving, drawn by including
+        # every client with probability 1/2 until the subset is not empty
+        switching = leaving & (self.rng.random_sample(leaving.shape) < 0.5)
+        pending = np.flatnonzero(leaving.any(axis=1) & np.logical_not(switching.any(axis=1)))
+        while len(pending) > 0:
+            switching[pending] = leaving[pending] & (self.rng.random_sample((len(pending), self.nclients)) < 0.5)
+            pending = pending[np.logical_not(switching[pending].any(axis=1))]
+
+        return second ^ switching
+
+    def steady_state_delays(self):
+        "Return the average delay per client"
+
+        if self.delays is not None:
+            return self.delays
+
+        now = time.time()
+
+        # all clients start on their first server
+        second = np.zeros([self.trajectories, self.nclients], dtype=bool)
+        total = np.zeros([self.trajectories, self.nclients])
+        quantile = scipy.stats.t.ppf(0.5 + self.confidence / 2.0, self.trajectories - 1)
+
+        steps = 0
+        while True:
+            for s in range(self.batch_steps):
+                (delta, deltabar) = self.delays_in(second)
+                if steps >= self.warmup:
+                    total += delta
+                second = self.step(second, np.logical_not(SteadyState.remain(delta, deltabar)))
+                steps += 1
+
+            # confidence interval of the time average across the trajectories
+            samples = total / max(1, steps - self.warmup)
+            self.delays = samples.mean(axis=0)
+            self.intervals = quantile * samples.std(axis=0, ddof=1) / np.sqrt(self.trajectories)
+            achieved = np.max(self.intervals / np.maximum(np.abs(self.delays), 1e-12))
+
+            converged = steps > self.warmup and achieved <= self.precision
+            if converged or steps + self.batch_steps > self.max_steps:
+                break
+
+        self.stats['time_simulate'] = time.time() - now
+        self.stats['steps']         = steps
+        self.stats['trajectories']  = self.trajectories
+        self.stats['precision']     = float(achieved)
+        self.stats['converged']     = bool(converged)
+        self.stats['peak_memory']   = peak_memory()
+
+        if self.verbose:
+            print "Monte Carlo: {} trajectories, {} steps, precision {}{}".format(
+                self.trajectories, steps, achieved, "" if converged else " (not converged)")
+
+        return self.delays
@@ -0,0 +1,210 @@
+"""
+Output of the results of the steady-state simulations
+"""
+
+__author__  = "Claudio Cicconetti"
+__version__ = "0.1.0"
+__license__ = "MIT"
+
+import numpy as np
+import os
+import threading
+import time
+
+def write_delays(filename, average_delays):
+    """
+    Write the average delays of the clients in every run to a text file,
+    one run per line, skipping those without results.
+    """
+
+    with open(filename, 'w') as outfile:
+        for array in average_delays:
+            if array is None:
+                # skip invalid measurements
+                continue
+            for value in array:
+                outfile.write('{} '.format(value))
+            outfile.write('\n')
+
+def write_absorbing(filename, absorbing_states):
+    """
+    Write the number of runs with absorbing states to a text file, given
+    the list of the absorbing states of every run, None if not searched.
+    """
+
+    num_absorbing = 0
+    for states in absorbing_states:
+        if states is not None and len(states) > 0:
+            if len(states) > 1:
+                print "> 1 absorbing states: {}".format(states)
+            num_absorbing += 1
+    with open(filename, 'w') as outfile:
+        outfile.write('{}\n'.format(num_absorbing))
+
+class StreamWriter(object):
+    """
+    Write the results to a text file as soon as they are available.
+
+    Every line contains the run index followed by the average delays of the
+    clients, separated by spaces, or only the run index if the run has been
+    skipped. The lines are in order of completion.
+
+    The file is flushed and synced to disk at most every checkpoint seconds,
+    and when closed.
+    """
+
+    def __init__(self, filename, append = False, checkpoint = 10):
+        assert checkpoint >= 0
+
+        self.outfile    = open(filename, 'a' if append else 'w')
+        self.checkpoint = checkpoint
+        self.lock       = threading.Lock()
+        self.last_sync  = time.time()
+
+    def write(self, run, delays):
+        "Write the result of a run, None if skipped"
+
+        line = '{} '.format(run)
+        if delays is not None:
+            line += ''.join(['{} '.format(value) for value in delays])
+        line = line[:-1] + '\n'
+
+        with self.lock:
+            self.outfile.write(line)
+            if time.time() - self.last_sync >= self.checkpoint:
+                self.__sync()
+
+    def __sync(self):
+        "Flush the data written to disk"
+
+        self.outfile.flush()
+        os.fsync(self.outfile.fileno())
+        self.last_sync = time.time()
+
+    def close(self):
+        "Sync and close the file"
+
+        with self.lock:
+            self.__sync()
+            self.outfile.close()
+
+class ArrayWriter(object):
+    """
+    Write the results to a directory of .npy files, which are memory-mapped
+    so that every result is written in place as soon as it is available:
+    - delays.npy: average delays of the clients (column) in every run (row),
+      NaN if not available
+    - valid.npy: True where the average delay is available and the server
+      is stable, i.e., the delay is not -1
+    - done.npy: True for every run completed, including those skipped
+
+    The files are flushed to disk at most every checkpoint seconds, and when
+    closed. With append, the results are added to those already in the
+    directory, which must have the same shape.
+    """
+
+    def __init__(self, directory, runs, nclients, append = False, checkpoint = 10):
+        assert checkpoint >= 0
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        shapes = {
+            'delays': ((runs, nclients), np.float64),
+            'valid':  ((runs, nclients), np.bool_),
+            'done':   ((runs,),          np.bool_),
+            }
+        arrays = dict()
+        for (name, (shape, dtype)) in shapes.items():
+            filename = os.path.join(directory, name + '.npy')
+            if append and os.path.exists(filename):
+                arrays[name] = np.load(filename, mmap_mode = 'r+')
+                assert arrays[name].shape == shape
+            else:
+                arrays[name] = np.lib.format.open_memmap(filename, mode = 'w+', dtype = dtype, shape = shape)
+                if name == 'delays':
+                    arrays[name][:] = np.nan
+
+        self.delays     = arrays['delays']
+        self.valid      = arrays['valid']
+        self.done       = arrays['done']
+        self.checkpoint = checkpoint
+        self.lock       = threading.Lock()
+        self.last_sync  = time.time()
+
+    def write(self, run, delays):
+        "Write the result of a run, None if skipped"
+
+        with self.lock:
+            if delays is not None:
+                self.delays[run] = delays
+                self.valid[run] = np.asarray(delays) >= 0
+            self.done[run] = True
+            if time.time() - self.last_sync >= self.checkpoint:
+                self.__sync()
+
+    def __sync(self):
+        "Flush the data written to disk"
+
+        self.delays.flush()
+        self.valid.flush()
+        self.done.flush()
+        self.last_sync = time.time()
+
+    def close(self):
+        "Sync and release the files"
+
+        with self.lock:
+            self.__sync()
+            self.delays = None
+            self.valid  = None
+            self.done   = None
+
+def read_arrays(directory, mmap = True):
+    """
+    Return the results in a directory written by ArrayWriter, as a tuple
+    with the delays, valid and done arrays, which are memory-mapped
+    read-only unless mmap is False. Return None if there are no results.
+    """
+
+    if not os.path.exists(os.path.join(directory, 'done.npy')):
+        return None
+
+    return tuple(
+        np.load(os.path.join(directory, name + '.npy'), mmap_mode = 'r' if mmap else None)
+        for name in ['delays', 'valid', 'done'])
+
+def read_stream(filename, repair = True):
+    """
+    Return the results in a file written by StreamWriter, as a dictionary
+    with the run index as key and the average delays as values, which are
+    None for the runs skipped.
+
+    If the last line is incomplete, e.g., because of a crash while writing
+    it, then it is ignored and, with repair, removed from the file, which
+    must not be written at the same time. Return an empty dictionary if
+    the file does not exist.
+    """
+
+    ret = dict()
+
+    if not os.path.exists(filename):
+        return ret
+
+    with open(filename, 'r+' if repair else 'r') as infile:
+        complete = 0
+        for line in iter(infile.readline, ''):
+            if not line.endswith('\n'):
+                break
+            complete += len(line)
+
+            values = line.split()
+            if len(values) == 0:
+                continue
+            run = int(values[0])
+            ret[run] = [float(value) for value in values[1:]] if len(values) > 1 else None
+
+        if repair:
+            infile.truncate(complete)
+
+    return ret
@@ -6,10 +6,18 @@ __version__ = "0.1.0"
 __license__ = "MIT"
 
 import argparse
+import json
 import steadystate
 import configuration
+import solvers
+import cache
+import results
+import generator
+import aggregate
+import distributed
 import numpy as np
 import random 
+import multiprocessing
 
 parser = argparse.ArgumentParser(
     description=__doc__,
@@ -29,6 +37,9 @@ parser.add_argument(
 parser.add_argument(
     "--seed", type=int, default=0,
     help="Random number generators' seed")
+parser.add_argument(
+    "--generator", type=str, default='legacy', choices=['counter', 'legacy'],
+    help="Random generation of the runs: from independent streams per run, or in sequence with the legacy generator of earlier versions, which is the default so that the same --seed yields the same runs")
 parser.add_argument(
     "--chi", type=float, default=0.1,
     help="Chi value, in (0,1)")
@@ -38,6 +49,9 @@ parser.add_argument(
 parser.add_argument(
     "--servers", type=int, default=2,
     help="Number of servers")
+parser.add_argument(
+    "--candidates", type=int, default=2,
+    help="Number of possible servers of every client (ignored with --single)")
 parser.add_argument(
     "--mu_min", type=float, default=1,
     help="Minimum serving rate, in 1/s")
@@ -58,20 +72,131 @@ parser.add_argument(
     help="Number of replications to be skipped")
 parser.add_argument(
     "--output", type=str, default='out',
-    help="Output file")
+    help="Output file, or directory with --format npy")
+parser.add_argument(
+    "--format", type=str, default='text', choices=['text', 'npy'],
+    help="Output format: text with the delays of a run per line, or a directory of memory-mappable .npy arrays written in place (cannot be used with --absorbing or --stream)")
+parser.add_argument(
+    "--input", type=str, default='',
+    help="Directory with the configurations of the runs in .npy arrays, instead of drawing them at random (--runs is ignored), empty for none")
+parser.add_argument(
+    "--save_input", type=str, default='',
+    help="Directory where to save the configurations of all the runs in .npy arrays, empty for none")
 parser.add_argument(
     "--threads", type=int, default=1,
-    help="Number of threads to use")
+    help="Number of threads (or processes) to use, 0 for one per CPU core")
+parser.add_argument(
+    "--processes", action="store_true", default=False,
+    help="Run the simulations in a pool of processes instead of threads")
+parser.add_argument(
+    "--method", type=str, default='exact', choices=['exact', 'montecarlo', 'meanfield'],
+    help="Solve the Markov chain exactly, estimate the delays by simulating it, or approximate them with a mean-field model (cannot be used with --single or --absorbing)")
+parser.add_argument(
+    "--trajectories", type=int, default=64,
+    help="Number of independent trajectories simulated with --method montecarlo")
+parser.add_argument(
+    "--precision", type=float, default=0.01,
+    help="Target relative half-width of the confidence intervals with --method montecarlo")
+parser.add_argument(
+    "--confidence", type=float, default=0.95,
+    help="Confidence level of the intervals with --method montecarlo")
+parser.add_argument(
+    "--max_steps", type=int, default=1000000,
+    help="Maximum number of steps of every trajectory with --method montecarlo")
+parser.add_argument(
+    "--time_budget", type=float, default=0,
+    help="Wall-time budget of every run with --method exact, in s, 0 for unlimited")
+parser.add_argument(
+    "--memory_budget", type=float, default=0,
+    help="Memory budget of every run with --method exact, in MB, 0 for unlimited")
+parser.add_argument(
+    "--fallback", type=str, default='none', choices=['none', 'montecarlo', 'meanfield'],
+    help="Method used for the runs over budget, which are skipped with none")
+parser.add_argument(
+    "--solver", type=str, default='auto', choices=solvers.SOLVERS,
+    help="Steady state solver")
+parser.add_argument(
+    "--preconditioner", type=str, default='jacobi', choices=solvers.PRECONDITIONERS,
+    help="Preconditioner of the Krylov solvers")
+parser.add_argument(
+    "--matrix_free", action="store_true", default=False,
+    help="Do not store the transition matrix, compute it on the fly (cannot be used with --solver direct)")
+parser.add_argument(
+    "--no_lumping", action="store_true", default=False,
+    help="Do not lump together indistinguishable clients")
+parser.add_argument(
+    "--tol", type=float, default=None,
+    help="Tolerance of the iterative solvers, also of --method meanfield (default depends on the solver)")
+parser.add_argument(
+    "--maxiter", type=int, default=None,
+    help="Maximum number of iterations of the iterative solvers, also of --method meanfield (default depends on the solver)")
+parser.add_argument(
+    "--cache", type=str, default='',
+    help="Directory of the persistent cache of the results, empty for no cache")
+parser.add_argument(
+    "--cache_size", type=float, default=0,
+    help="Maximum size of the cache, in MB, 0 for unlimited")
+parser.add_argument(
+    "--cache_pi", action="store_true", default=False,
+    help="Also store the steady state probabilities in the cache")
+parser.add_argument(
+    "--stream", action="store_true", default=False,
+    help="Write every result as soon as available, preceded by its run index (cannot be used with --absorbing)")
+parser.add_argument(
+    "--checkpoint", type=float, default=10,
+    help="Interval between consecutive syncs to disk of the streamed output, also with --format npy, in s")
+parser.add_argument(
+    "--resume", action="store_true", default=False,
+    help="Only execute the runs missing from the streamed output, to which results are appended (implies --stream, unless with --format npy)")
+parser.add_argument(
+    "--stats", type=str, default='',
+    help="File where to save the execution statistics of every run, as JSON lines, empty for none")
+parser.add_argument(
+    "--coordinator", type=str, default='',
+    help="Address, as host:port, where to serve the runs to the workers of distributed.py, with --threads of them on this host, unless with --remote_only, empty to run all locally (cannot be used with --cache)")
+parser.add_argument(
+    "--authkey", type=str, default='',
+    help="Authentication key of the workers with --coordinator, empty to read it from the {} environment variable, if set, otherwise to generate a random one, which is printed".format(distributed.AUTHKEY_VARIABLE))
+parser.add_argument(
+    "--remote_only", action="store_true", default=False,
+    help="Do not start any worker on this host with --coordinator")
+parser.add_argument(
+    "--lease", type=float, default=distributed.DEFAULT_LEASE,
+    help="Duration of the lease of a run given to a worker with --coordinator, renewed while running, in s")
+parser.add_argument(
+    "--retries", type=int, default=distributed.DEFAULT_RETRIES,
+    help="Number of times a run is given to another worker when its lease expires, with --coordinator")
+parser.add_argument(
+    "--summary", type=str, default='',
+    help="JSON file where to save the aggregate of the delays of all the runs, see aggregate.py, rebuilt from the runs already completed with --resume, empty for none (cannot be used with --absorbing)")
 args = parser.parse_args()
 
 # consistency checks
 assert args.clients >= 1
+assert args.threads >= 0
+assert args.cache_size >= 0
 assert args.servers >= 1
+assert args.single or 2 <= args.candidates <= args.servers
+assert args.single or args.candidates == 2 or args.method == 'exact'
 assert args.load_max >= args.load_min
 assert args.mu_max >= args.mu_min
 assert not (args.single and args.absorbing)
+assert not (args.matrix_free and args.solver == 'direct')
+assert args.method == 'exact' or not (args.single or args.absorbing)
+assert args.checkpoint >= 0
+assert args.time_budget >= 0
+assert args.memory_budget >= 0
+assert not (args.absorbing and (args.stream or args.resume or args.summary))
+assert not (args.format == 'npy' and (args.absorbing or args.stream))
+assert not (args.coordinator and args.cache)
+assert args.coordinator or not args.remote_only
+assert args.lease > 0
+assert args.retries >= 0
+
+if args.resume and args.format == 'text':
+    args.stream = True
 
-# initialize RNG
+# initialize the legacy RNG
 random.seed(args.seed)
 
 # no network delay
@@ -80,64 +205,211 @@ tau = np.zeros([args.clients, args.servers])
 # same task on all clients
 x = np.ones([args.clients])
 
-# create the configurations for all the runs
-num_servers_per_client = 1 if args.single else 2
-configurations = []
-skipped = 0
-for n in range(args.runs):
-    # random serving rate
-    mu = np.array([random.uniform(args.mu_min, args.mu_max) for i in range(args.servers)])
+# runs already completed in a previous execution
+completed = dict()
+arrays = None
+if args.resume and args.format == 'text':
+    completed = results.read_stream(args.output)
+elif args.resume:
+    arrays = results.read_arrays(args.output)
+    if arrays is not None:
+        completed = set(np.flatnonzero(arrays[2]))
 
-    # random load for clients
-    load = np.array([random.uniform(args.load_min, args.load_max) for i in range(args.clients)])
+# create the configurations of the runs: with the counter-based generator
+# every run is drawn independently, hence those skipped are not drawn,
+# while with the legacy one they are all drawn, in sequence, so that the
+# same random values are used when resuming
+num_servers_per_client = 1 if args.single else args.candidates
+first = 0
+drawn = []
+if not args.input and args.generator == 'counter':
+    if not args.save_input:
+        first = min(args.skip_runs, args.runs)
+    drawn = generator.ConfigurationGenerator(
+        runs = args.runs,
+        tau = tau,
+        x = x,
+        chi = args.chi,
+        candidates = num_servers_per_client,
+        mu_min = args.mu_min,
+        mu_max = args.mu_max,
+        load_min = args.load_min,
+        load_max = args.load_max,
+        seed = args.seed).batch(first, args.runs)
 
-    # random association
-    association = np.zeros([args.clients, args.servers], dtype = int)
-    for i in range(args.clients):
-        for j in random.sample(range(args.servers), num_servers_per_client):
-            association[i, j] = 1
+if not args.input and args.generator == 'legacy':
+    drawn = generator.legacy_configurations(
+        runs = args.runs,
+        tau = tau,
+        x = x,
+        chi = args.chi,
+        candidates = num_servers_per_client,
+        mu_min = args.mu_min,
+        mu_max = args.mu_max,
+        load_min = args.load_min,
+        load_max = args.load_max)
 
+# read the configurations from disk, if requested by the user
+if args.input:
+    drawn = configuration.ConfigurationBatch.load(args.input)
+
+if args.save_input:
+    batch = drawn
+    if not isinstance(batch, configuration.ConfigurationBatch):
+        batch = configuration.ConfigurationBatch.stack(batch)
+    batch.save(args.save_input)
+
+# number of runs, including those not drawn
+nruns = first + len(drawn)
+if first > 0:
+    print "skipped runs#0-{}".format(first - 1)
+
+configurations = []
+runs = []
+for n in range(first, nruns):
     # skip runs, if requested by the user
-    if args.skip_runs > skipped:
+    if n < args.skip_runs:
         print "skipped run#{}".format(n)
-        skipped += 1
         continue
 
-    configurations.append(configuration.Configuration(
-        chi = args.chi,
-        tau = tau,
-        x = x,
-        load = load,
-        mu = mu,
-        association = association))
+    if n in completed:
+        continue
+
+    runs.append(n)
+    configurations.append(drawn[n - first])
+
+# the batch is passed as a whole, if all its runs are needed
+if isinstance(drawn, configuration.ConfigurationBatch) and len(runs) == len(drawn):
+    configurations = drawn
+
+# persistent cache of the results
+result_cache = None
+if args.cache:
+    result_cache = cache.ResultCache(
+        args.cache,
+        max_size = int(args.cache_size * 1024 * 1024) if args.cache_size > 0 else None)
+
+# options of the Monte Carlo estimator, also used as fallback
+montecarlo_options = {
+    'trajectories': args.trajectories,
+    'precision': args.precision,
+    'confidence': args.confidence,
+    'max_steps': args.max_steps,
+    'seed': args.seed,
+    }
+
+# the seed of every run is derived from the one above and its index, see
+# steadystate._simulate(), hence the indices of the runs are passed to sim.run()
+
+# per-run budgets, see steadystate.Simulator
+budgets = {
+    'time_budget': args.time_budget if args.time_budget > 0 else None,
+    'memory_budget': int(args.memory_budget * 1024 * 1024) if args.memory_budget > 0 else None,
+    'fallback': args.fallback if args.fallback != 'none' else None,
+    'fallback_options': montecarlo_options if args.fallback == 'montecarlo' else None,
+    }
+
+# distributed execution, see distributed.py
+distribution = {
+    'coordinator': distributed.parse_address(args.coordinator) if args.coordinator else None,
+    'authkey': args.authkey if args.authkey else None,
+    'lease': args.lease,
+    'retries': args.retries,
+    }
+
+# number of threads, processes, or local workers with --coordinator
+nthreads = 0 if args.remote_only else args.threads if args.threads > 0 else multiprocessing.cpu_count()
+
+def save_stats(sim):
+    "Save the execution statistics of the runs, if requested"
+
+    if not args.stats:
+        return
+
+    with open(args.stats, 'a' if args.resume else 'w') as outfile:
+        for (job, stats) in enumerate(sim.stats):
+            if stats is None:
+                continue
+            record = dict(stats)
+            record['run'] = runs[job]
+            outfile.write(json.dumps(record, sort_keys=True) + '\n')
 
 if args.absorbing:
-    num_absorbing = 0
-    for conf in configurations:
-        ss = steadystate.SteadyState(conf, args.verbose)
-        absorbing_states = ss.absorbing()
-        if len(absorbing_states) > 0:
-            if len(absorbing_states) > 1:
-                print "> 1 absorbing states: {}".format(absorbing_states)
-            num_absorbing += 1
-    with open(args.output, 'w') as outfile:
-        outfile.write('{}\n'.format(num_absorbing))
+    sim = steadystate.Simulator(
+        nthreads = nthreads,
+        verbose = args.verbose,
+        progress = args.progress,
+        processes = args.processes,
+        cache = result_cache,
+        absorbing = True,
+        **dict(budgets, **distribution))
+
+    sim.run(configurations, runs)
+
+    save_stats(sim)
+
+    results.write_absorbing(args.output, sim.absorbing_states)
 
 else:
+    writer = None
+    if args.resume and len(completed) > 0:
+        print "resuming, {} runs completed, {} to go".format(len(completed), len(runs))
+    if args.stream:
+        writer = results.StreamWriter(args.output, append = args.resume, checkpoint = args.checkpoint)
+    elif args.format == 'npy':
+        writer = results.ArrayWriter(
+            args.output, nruns, drawn[0].tau.shape[0] if len(drawn) > 0 else 0,
+            append = args.resume, checkpoint = args.checkpoint)
+
+    # online aggregate of the delays, also of the previous executions, which
+    # is rebuilt from their results, since it is only saved at the end
+    summary = None
+    if args.summary:
+        summary = aggregate.Aggregate()
+        if arrays is not None:
+            # the delays of the runs skipped are NaN
+            for n in sorted(completed):
+                if not np.any(np.isnan(arrays[0][n])):
+                    summary.add(arrays[0][n])
+        else:
+            for n in sorted(completed):
+                summary.add(completed[n])
+
     sim = steadystate.Simulator(
         single = args.single,
-        nthreads = args.threads,
+        nthreads = nthreads,
         verbose = args.verbose,
-        progress = args.progress)
+        progress = args.progress,
+        processes = args.processes,
+        cache = result_cache,
+        cache_pi = args.cache_pi,
+        callback = (lambda job, delays: writer.write(runs[job], delays)) if writer is not None else None,
+        method = args.method,
+        options = {
+            'solver': args.solver,
+            'tol': args.tol,
+            'maxiter': args.maxiter,
+            'preconditioner': args.preconditioner,
+            'matrix_free': args.matrix_free,
+            'lumping': not args.no_lumping,
+            } if args.method == 'exact' else montecarlo_options if args.method == 'montecarlo' else {
+            'tol': args.tol,
+            'maxiter': args.maxiter,
+            },
+        aggregate = summary,
+        **dict(budgets, **distribution))
 
-    sim.run(configurations)
+    try:
+        sim.run(configurations, runs)
+    finally:
+        if writer is not None:
+            writer.close()
 
-    with open(args.output, 'w') as outfile:
-        for array in sim.average_delays:
-            if array is None:
-                # skip invalid measurements
-                continue
-            for value in array:
-                outfile.write('{} '.format(value))
-            outfile.write('\n')
+    save_stats(sim)
+
+    if summary is not None:
+        summary.save(args.summary)
+
+    if writer is None:
+        results.write_delays(args.output, sim.average_delays)
 
@@ -0,0 +1,358 @@
+"""
+Solvers of the steady-state probabilities of a continuous-time Markov chain
+"""
+
+__author__  = "Claudio Cicconetti"
+__version__ = "0.1.0"
+__license__ = "MIT"
+
+import time
+import numpy as np
+import scipy.sparse as sp
+import scipy.sparse.linalg as spla
+from scipy.sparse import csgraph
+from scipy.linalg import norm
+
+# solvers available, 'auto' selects one depending on the number of states
+SOLVERS = ['auto', 'direct', 'gmres', 'bicgstab', 'power']
+
+# preconditioners available for the Krylov solvers
+PRECONDITIONERS = ['none', 'jacobi', 'ilu']
+
+# default tolerance of each solver:
+# - power: L1 norm of the difference between two consecutive iterates
+# - gmres/bicgstab: relative residual of the normalized linear system
+DEFAULT_TOL = {
+    'power':    1e-3,
+    'gmres':    1e-10,
+    'bicgstab': 1e-10,
+    }
+
+# default maximum number of iterations of each solver
+DEFAULT_MAXITER = {
+    'power':    100000,
+    'gmres':    1000,
+    'bicgstab': 10000,
+    }
+
+# with 'auto', largest number of states solved with the direct method,
+# beyond which the fill-in of the LU factorization becomes prohibitive
+AUTO_DIRECT_STATES = 512
+
+class DeadlineException(Exception):
+    """Raised when a solver has not converged by its deadline"""
+
+class SolverResult(object):
+    """Steady-state probabilities with the statistics of the solver"""
+
+    def __init__(self, pi, solver, iterations, residual, converged, classes = 1, states = None):
+        self.pi         = pi
+        self.solver     = solver
+        self.iterations = iterations
+        self.residual   = residual
+        self.converged  = converged
+
+        # number of recurrent classes and of states solved, see solve_recurrent()
+        self.classes    = classes
+        self.states     = states if states is not None else len(pi)
+
+    def stats(self):
+        "Return the statistics of the solver as a dictionary"
+
+        return {
+            'solver':     self.solver,
+            'iterations': int(self.iterations),
+            'residual':   float(self.residual),
+            'converged':  bool(self.converged),
+            'classes':    int(self.classes),
+            'states':     int(self.states),
+            }
+
+    def __str__(self):
+        return "{} solver, {} iterations, residual {}{}{}".format(
+            self.solver, self.iterations, self.residual,
+            "" if self.converged else " (not converged)",
+            "" if self.classes == 1 else ", {} recurrent classes".format(self.classes))
+
+def left_product(Q):
+    """
+    Return a function computing the product pi * Q of a row vector by the
+    matrix Q, which can be either a sparse matrix or a LinearOperator.
+    """
+
+    if sp.issparse(Q):
+        Qt = Q.T.tocsr()
+        return Qt.dot
+    return Q.rmatvec
+
+def residual(Q, pi):
+    "Return the L1 norm of pi * Q, which is zero for the steady state"
+
+    return norm(left_product(Q)(pi), 1)
+
+def solve(Q, solver = 'auto', tol = None, maxiter = None, preconditioner = 'jacobi', x0 = None,
+          deadline = None):
+    """
+    Compute the steady-state probabilities of the generator Q.
+
+    Q can be a sparse matrix or a LinearOperator, in which case the direct
+    method cannot be used. The Krylov methods and the power method start from
+    x0, if not None, otherwise from a uniform and a degenerate distribution,
+    respectively.
+
+    If deadline is not None, it is the time, as returned by time.time(),
+    after which the iterations are abandoned raising DeadlineException,
+    checked at every iteration and, with the direct method, before starting.
+
+    Return a SolverResult object.
+    """
+
+    assert solver in SOLVERS
+    assert preconditioner in PRECONDITIONERS
+
+    if solver == 'auto':
+        if sp.issparse(Q) and Q.shape[0] <= AUTO_DIRECT_STATES:
+            solver = 'direct'
+        else:
+            solver = 'gmres'
+
+    if solver == 'direct':
+        if not sp.issparse(Q):
+            raise ValueError("The direct solver requires an explicit transition matrix")
+        expired(deadline)
+        return solve_direct(Q)
+
+    if tol is None:
+        tol = DEFAULT_TOL[solver]
+    if maxiter is None:
+        maxiter = DEFAULT_MAXITER[solver]
+
+    if solver == 'power':
+        return solve_power(Q, tol, maxiter, x0, deadline)
+
+    return solve_krylov(Q, solver, tol, maxiter, preconditioner, x0, deadline)
+
+def expired(deadline):
+    "Raise DeadlineException if the deadline, if not None, has passed"
+
+    if deadline is not None and time.time() > deadline:
+        raise DeadlineException("Deadline passed before convergence")
+
+def recurrent_classes(Q):
+    """
+    Return the recurrent classes of the sparse generator Q, i.e., the
+    strongly connected components of its transition graph that no
+    transition leaves, as a list of arrays of states sorted by their
+    first state. The other states are transient.
+    """
+
+    Q = sp.csr_matrix(Q)
+    (ncomponents, labels) = csgraph.connected_components(Q, directed=True, connection='strong')
+
+    # a component is closed if no transition leads to a different component
+    rows = np.repeat(np.arange(Q.shape[0]), np.diff(Q.indptr))
+    exits = (labels[rows] != labels[Q.indices]) & (Q.data != 0)
+    closed = np.ones(ncomponents, dtype=bool)
+    closed[labels[rows[exits]]] = False
+
+    order = np.argsort(labels, kind='mergesort')
+    bounds = np.searchsorted(labels[order], np.arange(ncomponents + 1))
+    classes = [order[bounds[c]:bounds[c + 1]] for c in np.flatnonzero(closed)]
+
+    return sorted(classes, key=lambda states: states[0])
+
+def absorption(Q, classes, start):
+    """
+    Return the probability of the chain with sparse generator Q, starting
+    from a given state, to end up in each of the given recurrent classes.
+
+    The expected time spent in the transient states reachable from the
+    start is found by solving a linear system restricted to them.
+    """
+
+    Q = sp.csr_matrix(Q)
+    size = Q.shape[0]
+    labels = np.full(size, -1, dtype=np.int64)
+    for (c, states) in enumerate(classes):
+        labels[states] = c
+
+    weights = np.zeros(len(classes))
+    if labels[start] >= 0:
+        weights[labels[start]] = 1.0
+        return weights
+
+    reachable = csgraph.breadth_first_order(Q, start, directed=True, return_predecessors=False)
+    transient = np.sort(reachable[labels[reachable] < 0])
+    first = np.searchsorted(transient, start)
+
+    # y * Q_TT = -e_start, where y is the expected time in the transient states
+    A = sp.csr_matrix(Q[transient][:, transient].T)
+    b = np.zeros(len(transient))
+    b[first] = -1.0
+    if len(transient) <= AUTO_DIRECT_STATES:
+        y = spla.spsolve(A.tocsc(), b)
+    else:
+        (y, info) = spla.gmres(A, b, tol=DEFAULT_TOL['gmres'], maxiter=DEFAULT_MAXITER['gmres'])
+
+    # rate of entering every class from the transient states
+    flow = Q[transient].T.dot(y)
+    entering = labels >= 0
+    np.add.at(weights, labels[entering], flow[entering])
+
+    weights = np.maximum(weights, 0)
+    return weights / weights.sum()
+
+def solve_recurrent(Q, start = 0, solver = 'auto', tol = None, maxiter = None,
+                    preconditioner = 'jacobi', x0 = None, deadline = None):
+    """
+    Compute the steady-state probabilities of the sparse generator Q, with
+    the same arguments as solve(), considering only its recurrent classes.
+
+    The transient states have zero probability, thus every recurrent class
+    is solved separately, restricted to its states. If there are several
+    recurrent classes, the steady state depends on the initial state: the
+    classes are weighted with the probability of ending up in them from
+    the start state, see absorption(), and those that cannot be reached
+    from it are not solved.
+
+    Return a SolverResult object, with the number of recurrent classes.
+    """
+
+    size = Q.shape[0]
+    classes = recurrent_classes(Q)
+    if len(classes) == 1 and len(classes[0]) == size:
+        return solve(Q, solver, tol, maxiter, preconditioner, x0, deadline)
+
+    weights = absorption(Q, classes, start) if len(classes) > 1 else np.ones(1)
+
+    Q = sp.csr_matrix(Q)
+    pi = np.zeros(size)
+    results = []
+    for (states, weight) in zip(classes, weights):
+        if weight == 0:
+            continue
+        guess = None
+        if x0 is not None and np.sum(x0[states]) > 0:
+            guess = x0[states] / np.sum(x0[states])
+        result = solve(Q[states][:, states], solver, tol, maxiter, preconditioner, guess, deadline)
+        pi[states] = weight * result.pi
+        results.append((len(states), result))
+
+    largest = max(results, key=lambda r: r[0])[1]
+    return SolverResult(
+        pi,
+        largest.solver,
+        sum(r.iterations for (_, r) in results),
+        residual(Q, pi),
+        all(r.converged for (_, r) in results),
+        classes = len(classes),
+        states = sum(n for (n, _) in results))
+
+def normalized(pi):
+    "Return the probability vector closest to pi, removing round-off negatives"
+
+    pi = np.maximum(np.real(pi), 0)
+    return pi / pi.sum()
+
+def normalization_system(Q):
+    """
+    Return the linear system A x = b whose solution is the steady state of Q,
+    where A is the transpose of Q with the last row replaced by all ones.
+
+    A is a sparse matrix if Q is, otherwise a LinearOperator.
+    """
+
+    size = Q.shape[0]
+    b = np.zeros(size)
+    b[-1] = 1.0
+
+    if sp.issparse(Q):
+        A = sp.vstack([sp.csr_matrix(Q.T)[:-1], sp.csr_matrix(np.ones([1, size]))], format='csr')
+        return (A, b)
+
+    def matvec(v):
+        y = np.array(Q.rmatvec(v), dtype=float).ravel()
+        y[-1] = np.sum(v)
+        return y
+
+    return (spla.LinearOperator((size, size), matvec=matvec, dtype=float), b)
+
+def solve_direct(Q):
+    "Solve with a sparse LU factorization of the normalized generator"
+
+    (A, b) = normalization_system(Q)
+    pi = normalized(spla.splu(A.tocsc()).solve(b))
+
+    return SolverResult(pi, 'direct', 1, residual(Q, pi), True)
+
+def solve_krylov(Q, solver, tol, maxiter, preconditioner, x0, deadline = None):
+    "Solve the normalized generator with GMRES or BiCGSTAB"
+
+    (A, b) = normalization_system(Q)
+    size = Q.shape[0]
+
+    M = None
+    if preconditioner == 'ilu' and sp.issparse(A):
+        try:
+            ilu = spla.spilu(A.tocsc(), drop_tol=1e-4, fill_factor=10)
+            M = spla.LinearOperator((size, size), matvec=ilu.solve, dtype=float)
+        except RuntimeError:
+            # singular factor, resort to the diagonal
+            preconditioner = 'jacobi'
+
+    if preconditioner in ['jacobi', 'ilu'] and M is None:
+        diagonal = np.array(Q.diagonal(), dtype=float)
+        diagonal[-1] = 1.0
+        diagonal[diagonal == 0] = 1.0
+        M = spla.LinearOperator((size, size), matvec=lambda v: v / diagonal, dtype=float)
+
+    if x0 is None:
+        x0 = np.ones(size) / size
+
+    iterations = [0]
+    def count(_):
+        iterations[0] += 1
+        expired(deadline)
+
+    if solver == 'gmres':
+        (x, info) = spla.gmres(A, b, x0=x0, tol=tol, maxiter=maxiter, M=M, callback=count)
+    else:
+        (x, info) = spla.bicgstab(A, b, x0=x0, tol=tol, maxiter=maxiter, M=M, callback=count)
+
+    pi = normalized(x)
+
+    return SolverResult(pi, solver, iterations[0], residual(Q, pi), info == 0)
+
+#
+# copied from the SciPy cookbook
+# file: tandemqueue.py
+# the method is originally called computePiMethod1()
+#
+# https://scipy-cookbook.readthedocs.io/items/Solving_Large_Markov_Chains.html
+#
+def solve_power(Q, tol, maxiter, x0, deadline = None):
+    "Solve with the power method on the uniformized chain"
+
+    size = Q.shape[0]
+    product = left_product(Q)
+
+    l = np.min(Q.diagonal())*1.001  # avoid periodicity, see trivedi's book
+    step = lambda v: v - product(v) / l
+
+    # compute Pi
+    if x0 is None:
+        pi = np.zeros(size)
+        pi[0] = 1
+    else:
+        pi = np.array(x0, dtype=float)
+    pi1 = np.zeros(size)
+    n = norm(pi - pi1, 1)
+    iterations = 0
+    while n > tol and iterations < maxiter:
+        expired(deadline)
+        pi1 = step(pi)
+        pi = step(pi1)   # avoid copying pi1 to pi
+        n = norm(pi - pi1, 1)
+        iterations += 1
+
+    return SolverResult(pi, 'power', iterations, residual(Q, pi), n <= tol)
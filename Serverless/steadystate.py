@@ -7,16 +7,47 @@ __version__ = "0.1.0"
 __license__ = "MIT"
 
 import numpy as np
-from itertools import product
 import scipy.sparse as sp
-from scipy.linalg import norm
+import scipy.sparse.linalg as spla
+from scipy.special import comb
 import threading
+import multiprocessing
+import Queue
+import os
+import sys
 import time
+import resource
+import signal
+import solvers
+from configuration import ConfigurationBatch
+from generator import run_seed
 
 class DegenerateException(Exception):
     """Raised when the transition matrix is degenerate"""
     pass
 
+class BudgetException(Exception):
+    """Raised when a simulation exceeds its time budget"""
+    pass
+
+def job_cost(configuration):
+    """
+    Return the estimated cost of solving a configuration with SteadyState,
+    proportional to the number of non-zero elements of its transition
+    matrix, assuming that every client prefers half of its alternatives.
+    """
+
+    radix = np.sum(configuration.association, axis=1)
+    return float(np.prod(radix * (1.0 + (radix - 1) / 2.0)))
+
+def peak_memory():
+    "Return the peak resident memory of the current process, in bytes"
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return peak
+    return peak * 1024
+
 class SteadyStateGeneric(object):
     """Steady-state simulation object"""
 
@@ -30,7 +61,7 @@ class SteadyStateGeneric(object):
         "Print a matrix per row, prepending the data structure name in a separate line"
 
         print "{}: ".format(name)
-        if isinstance(mat, sp.dok_matrix):
+        if sp.issparse(mat):
             for row in mat.toarray():
                 print row
         else:
@@ -41,15 +72,80 @@ class SteadyStateGeneric(object):
 ################################################################################
 ################################################################################
 
+class TransitionOperator(spla.LinearOperator):
+    """
+    Transition matrix computed on the fly.
+
+    transitions is a function returning an iterable over chunks of
+    transitions, see SteadyState.transition_operator(). The diagonal
+    elements are all -1, like for the explicit matrix.
+    """
+
+    def __init__(self, size, transitions):
+        super(TransitionOperator, self).__init__(dtype=np.float64, shape=(size, size))
+
+        self.transitions = transitions
+
+    def _matvec(self, v):
+        "Return Q * v"
+
+        v = np.ravel(v)
+        y = np.zeros(self.shape[0])
+        for (first, last, origins, destinations, rates) in self.transitions():
+            y[first:last] += np.bincount(
+                origins - first, weights=rates * v[destinations], minlength=last - first)
+        return y
+
+    def _rmatvec(self, v):
+        "Return v * Q"
+
+        v = np.ravel(v)
+        y = np.zeros(self.shape[0])
+        for (first, last, origins, destinations, rates) in self.transitions():
+            y += np.bincount(
+                destinations, weights=rates * v[origins], minlength=self.shape[0])
+        return y
+
+    def diagonal(self):
+        "Return the diagonal of the matrix"
+
+        return -np.ones(self.shape[0])
+
+################################################################################
+################################################################################
+################################################################################
+
 class SteadyState(SteadyStateGeneric):
-    """Steady-state delays of a serverless edge computing with two options"""
+    """
+    Steady-state delays of a serverless edge computing where every client
+    has two or more possible servers: it is served by one of them and it
+    probes all the others, called its alternatives, splitting evenly among
+    them the fraction chi of its requests sent to probe.
+    """
 
     def __init__(self,
                  configuration,
-                 verbose = False):
+                 verbose = False,
+                 solver = 'auto',
+                 tol = None,
+                 maxiter = None,
+                 preconditioner = 'jacobi',
+                 matrix_free = False,
+                 lumping = True):
 
         super(SteadyState, self).__init__(verbose)
 
+        # steady state solver configuration, see solvers.solve()
+        assert solver in solvers.SOLVERS
+        assert preconditioner in solvers.PRECONDITIONERS
+        self.solver         = solver
+        self.tol            = tol
+        self.maxiter        = maxiter
+        self.preconditioner = preconditioner
+
+        # do not store the transition matrix, see transition_operator()
+        self.matrix_free    = matrix_free
+
         # input
         self.chi         = configuration.chi
         self.tau         = configuration.tau
@@ -63,35 +159,71 @@ class SteadyState(SteadyStateGeneric):
         #
 
         # lazy initialization variables
+        self.served   = None
+        self.probed   = None
         self.delta    = None
         self.deltabar = None
+        self.leave    = None
         self.Q        = None
+        self.Qop      = None
         self.pi       = None
+        self.pi0      = None
+        self.solution = None
         self.delays   = None
 
+        # execution statistics, see record()
+        self.stats    = dict()
+
+        # time after which the computation is abandoned, see check()
+        self.deadline = None
+
         # scalars
         self.nclients = self.tau.shape[0]
         self.nservers = self.tau.shape[1]
-        self.nstates  = pow(2, self.nclients)
 
-        # possible servers for each client
+        # possible servers for each client, padded with -1 if a client
+        # has fewer possible servers than others
         possible_servers = []
         for i in range(self.nclients):
             server_list = []
             for (ndx,s) in zip(range(self.nservers),self.association[i]):
                 if s == 1:
                     server_list.append(ndx)
-            assert len(server_list) == 2
+            assert len(server_list) >= 2
             possible_servers.append(server_list)
-        self.possible_servers = np.array(possible_servers)
-
-        # server assigned to every client per state
-        self.state = np.zeros([self.nclients, self.nstates], dtype=int)
-        self.statebar = np.zeros([self.nclients, self.nstates], dtype=int)
-        for ndx, prod in zip(range(self.nstates), product([0, 1], repeat=self.nclients)):
-            for i in range(self.nclients):
-                self.state[i, ndx] = self.possible_servers[i][prod[i]]
-                self.statebar[i, ndx] = self.possible_servers[i][1-prod[i]]
+        self.radix = np.array([len(l) for l in possible_servers], dtype=np.int64)
+        self.possible_servers = np.full([self.nclients, self.radix.max()], -1, dtype=int)
+        for (i, server_list) in enumerate(possible_servers):
+            self.possible_servers[i, :len(server_list)] = server_list
+        self.binary = bool(np.all(self.radix == 2))
+
+        # weight of every client in the state index, which is in mixed radix
+        # with the first client being the most significant one, see server()
+        self.strides = np.ones(self.nclients, dtype=np.int64)
+        for i in range(self.nclients - 2, -1, -1):
+            self.strides[i] = self.strides[i + 1] * self.radix[i + 1]
+        self.nstates = int(np.prod([int(r) for r in self.radix]))
+
+        # bit of every alternative of every client (column) in the bitmask
+        # of the alternatives preferred, see __leaving(), which is 0 if the
+        # client has fewer alternatives; with two possible servers per
+        # client there is one bit per client, like in the state index
+        offsets = np.cumsum((self.radix - 1)[::-1])[::-1] - (self.radix - 1)
+        assert offsets[0] + self.radix[0] - 1 < 63
+        alternatives = np.arange(self.radix.max() - 1)
+        self.bits = np.where(
+            alternatives[np.newaxis, :] < (self.radix - 1)[:, np.newaxis],
+            np.left_shift(1, offsets[:, np.newaxis] + alternatives[np.newaxis, :]),
+            0).astype(np.int64)
+
+        # maximum number of transitions computed at once
+        self.chunk_size = 1 << 20
+
+        # groups of indistinguishable clients, see lumped_chain()
+        self.lumping = lumping
+        self.classes = LumpedChain.equivalence_classes(
+            self.possible_servers, self.tau, self.x, self.load)
+        self.lumped  = None
 
         # further size checks
         assert self.x.shape[0] == self.nclients
@@ -100,14 +232,128 @@ class SteadyState(SteadyStateGeneric):
         assert self.association.shape[0] == self.nclients
         assert self.association.shape[1] == self.nservers
 
+    def server(self, client, state, probing = False):
+        """
+        Return the server assigned to, or probed by, a client in a state.
+
+        A state is a number in mixed radix with one digit per client, the
+        first client being the most significant one, whose base is the
+        number of possible servers of the client: the client is served by
+        the possible server with the index equal to the digit, and it probes
+        the others. With two possible servers per client, the state is a
+        bitmask where the client is served by its first possible server if
+        the bit is 0, by the second one otherwise.
+
+        probing is False for the server assigned, otherwise the alternative
+        probed, from 1 (or True) to the number of possible servers minus
+        one, which are the possible servers following the one assigned in
+        circular order.
+
+        client and state can be integers or arrays, which are broadcast
+        against each other, e.g., server(np.arange(nclients)[:, np.newaxis],
+        np.arange(nstates)) returns the servers of all clients (row) in all
+        states (column).
+        """
+
+        client = np.asarray(client)
+        if self.binary:
+            digit = np.bitwise_and(np.right_shift(state, self.nclients - 1 - client), 1)
+            if probing:
+                digit = 1 - digit
+        else:
+            radix = self.radix[client]
+            digit = (np.asarray(state) // self.strides[client] + int(probing)) % radix
+        return self.possible_servers[client, digit]
+
     def clear(self):
         "Remove all derived data structures"
 
+        self.lumped   = None
+        self.served   = None
+        self.probed   = None
         self.delta    = None
         self.deltabar = None
+        self.leave    = None
         self.Q        = None
+        self.Qop      = None
         self.pi       = None
+        self.pi0      = None
+        self.solution = None
         self.delays   = None
+        self.stats    = dict()
+
+    def record(self, phase, since):
+        """
+        Add the time elapsed since a given instant to the execution time of
+        a phase, and update the peak memory.
+
+        The statistics are saved in the dictionary stats, with keys:
+        - time_<phase>: time spent in delta (delays when serving and probing),
+          transition (build of the transition matrix), solve (steady state
+          probabilities) and absorbing (search for the absorbing states), in s
+        - nstates: number of states of the chain solved
+        - lumped: True if the chain solved is the lumped one
+        - nnz: number of non-zero elements of the transition matrix
+        - solver, iterations, residual, converged: see solvers.SolverResult
+        - peak_memory: peak resident memory of the process, in bytes, which
+          is shared by all the objects in the same process
+        """
+
+        key = 'time_' + phase
+        self.stats[key] = self.stats.get(key, 0.0) + time.time() - since
+        self.stats['peak_memory'] = peak_memory()
+
+    def check(self, phase):
+        """
+        Raise BudgetException if the deadline has passed.
+
+        This is called before starting every phase, see record(), and
+        between the chunks of the longest ones, but never after a phase has
+        completed, so that no result already computed is discarded. The
+        solvers check the deadline at every iteration, see solvers.solve().
+        """
+
+        if self.deadline is not None and time.time() > self.deadline:
+            raise BudgetException("Time budget exceeded in phase {}".format(phase))
+
+    def estimate(self, matrix_free = None):
+        """
+        Return a dictionary with the estimated number of states, of non-zero
+        elements of the transition matrix, and of the memory required by
+        steady_state_delays(), in bytes, with the matrix stored or not
+        depending on matrix_free, which is that of the object if None.
+
+        Every client is assumed to prefer half of its alternatives in every
+        state, see job_cost(). The memory includes the delays of all the
+        clients in all the states, the transition matrix with its transpose
+        and the vectors of the solver.
+        """
+
+        if matrix_free is None:
+            matrix_free = self.matrix_free
+
+        lumped = self.lumped_chain()
+        if lumped is not None:
+            nstates = lumped.nstates
+            nnz = nstates * np.prod(1.0 + lumped.size / 2.0)
+            delays = 2 * lumped.nclasses * nstates * 8
+        else:
+            nstates = self.nstates
+            nnz = nstates * np.prod(1.0 + (self.radix - 1) / 2.0)
+            delays = self.nclients * self.radix.max() * nstates * 8
+
+        if matrix_free and lumped is None:
+            # chunks of transitions, with origin, destination and rate
+            matrix = min(nnz, max(self.chunk_size, nstates)) * 3 * 8
+        else:
+            # indices and data, twice
+            matrix = nnz * 2 * (4 + 8)
+
+        return {
+            'nstates': int(nstates),
+            'nnz':     int(nnz),
+            'memory':  int(delays + matrix + 10 * nstates * 8),
+            }
 
     def debugPrint(self, printDelay = False):
         "Print the internal data structures"
@@ -117,13 +363,21 @@ class SteadyState(SteadyStateGeneric):
         self.printMat("Request rates",    self.load)
         self.printMat("Server rates",     self.mu)
         self.printMat("Associations",     self.association)
-        self.printMat("Primary state",    self.state)
-        self.printMat("Probe state",      self.statebar)
+        clients = np.arange(self.nclients)[:, np.newaxis]
+        states = np.arange(self.nstates)
+        self.printMat("Primary state",    self.server(clients, states))
+        for j in range(1, self.radix.max()):
+            self.printMat("Probe state" if j == 1 else "Probe state (alternative {})".format(j),
+                          np.where(self.radix[:, np.newaxis] > j,
+                                   self.server(clients, states, j), -1))
         self.printMat("Possible servers", self.possible_servers)
 
         if printDelay:
             self.printMat("Average delays per state (serving)", self.__delta())
-            self.printMat("Average delays per state (probing)", self.__deltabar())
+            for j in range(1, self.radix.max()):
+                self.printMat("Average delays per state (probing)" if j == 1 else
+                              "Average delays per state (probing alternative {})".format(j),
+                              self.__deltabar(j))
             try:
                 self.printMat("Steady state state transition matrix", self.transition())
                 self.printMat("Steady state state probabilities", self.probabilities())
@@ -134,68 +388,141 @@ class SteadyState(SteadyStateGeneric):
     def I(self, client, server, state):
         "Return 1 if the client is served by server in a given state"
 
-        if self.state[client, state] == server:
+        if self.server(client, state) == server:
             return 1.0
         return 0.0
 
     def Ibar(self, client, server, state):
         "Return 1 if the client is probing server in a given state"
 
-        if self.statebar[client, state] == server:
-            return 1.0
+        for j in range(1, self.radix[client]):
+            if self.server(client, state, j) == server:
+                return 1.0
         return 0.0
 
-    def __delta(self):
-        "Compute the average delays when being server"
+    def __loads(self, states = None):
+        """
+        Compute the load offered to every server in the given states, all
+        if None, in which case the result is saved.
+
+        Return two matrices with shape (nservers, len(states)): the first one
+        contains the load of the clients served by the server, the second
+        one the load of the clients probing it (not yet scaled by chi),
+        divided by their number of alternatives.
+        """
 
-        if self.delta is not None:
-            return self.delta
+        if states is None and self.served is not None:
+            return (self.served, self.probed)
 
-        self.delta = np.zeros([self.nclients, self.nstates])
+        full = states is None
+        if full:
+            states = np.arange(self.nstates)
 
+        served = np.zeros([self.nservers, len(states)])
+        probed = np.zeros([self.nservers, len(states)])
+
+        columns = np.arange(len(states))
+        for h in range(self.nclients):
+            served[self.server(h, states), columns] += self.load[h]
+            for j in range(1, self.radix[h]):
+                probed[self.server(h, states, j), columns] += self.load[h] / float(self.radix[h] - 1)
+
+        if full:
+            self.served = served
+            self.probed = probed
+
+        return (served, probed)
+
+    def __delays(self, probing, states = None):
+        """
+        Compute the average delays of all the clients in the given states,
+        all if None, on the server assigned to them or, if probing is not
+        False, on the given alternative, see server(); the delay of the
+        clients that do not have that alternative is -1, as if unstable.
+
+        The load offered by client i is already accounted for in the
+        per-server loads, with the right weight depending on whether the
+        client is served by or probing the server.
+        """
+
+        (served, probed) = self.__loads(states)
+        if states is None:
+            states = np.arange(self.nstates)
+
+        # one client at a time, to bound the size of temporary arrays
+        ret = np.empty([self.nclients, len(states)])
         for i in range(self.nclients):
-            for k in range(self.nstates):
-                server = self.state[i, k]
-                assert 0 <= server < self.nservers
+            ret[i] = self.__client_delays(i, probing, states, served, probed)
+
+        return ret
 
-                numerator = self.x[i] * self.mu[server]
-                denominator = self.mu[server]
-                denominator -= self.load[i]
-                for h in range(self.nclients):
-                    if h == i:
-                        continue
-                    denominator -= \
-                        self.load[h] * ( self.I(h, server, k) + self.chi * self.Ibar(h, server, k) )
+    def __client_delays(self, i, probing, states, served, probed):
+        """
+        Compute the average delays of client i in the given states, where
+        served and probed are the per-server loads in the same states.
+        """
 
-                self.delta[i, k] = self.tau[i, server] + numerator / denominator if denominator > 0 else -1
+        if probing >= self.radix[i]:
+            return np.full(len(states), -1.0)
 
-        return self.delta
+        columns = np.arange(len(states))
+        servers = self.server(i, states, probing)
+        mu = self.mu[servers]
+        denominator = mu - served[servers, columns] - self.chi * probed[servers, columns]
+        stable = denominator > 0
+        return np.where(
+            stable,
+            self.tau[i, servers] + self.x[i] * mu / np.where(stable, denominator, 1.0),
+            -1.0)
 
-    def __deltabar(self):
-        "Compute the average delays when probing"
+    def __refresh(self, servers):
+        """
+        Recompute the average delays already computed, only where the
+        clients are served by or probe one of the given servers.
+        """
 
+        self.check('delta')
+        now = time.time()
+        states = np.arange(self.nstates)
+        alternatives = [(False, self.delta)]
         if self.deltabar is not None:
-            return self.deltabar
+            alternatives += [(j + 1, d) for (j, d) in enumerate(self.deltabar)]
+        for (probing, delays) in alternatives:
+            if delays is None:
+                continue
+            (served, probed) = self.__loads()
+            for i in range(self.nclients):
+                if probing >= self.radix[i]:
+                    continue
+                changed = np.flatnonzero(np.in1d(self.server(i, states, probing), servers))
+                delays[i, changed] = self.__client_delays(
+                    i, probing, changed, served[:, changed], probed[:, changed])
+        self.record('delta', now)
 
-        self.deltabar = np.zeros([self.nclients, self.nstates])
+    def __delta(self):
+        "Compute the average delays when being server"
 
-        for i in range(self.nclients):
-            for k in range(self.nstates):
-                server = self.statebar[i, k]
-                assert 0 <= server < self.nservers
+        if self.delta is None:
+            self.check('delta')
+            now = time.time()
+            self.delta = self.__delays(False)
+            self.record('delta', now)
 
-                numerator = self.x[i] * self.mu[server]
-                denominator = self.mu[server]
-                denominator -= self.chi * self.load[i]
-                for h in range(self.nclients):
-                    if h == i:
-                        continue
-                    denominator -= \
-                        self.load[h] * ( self.I(h, server, k) + self.chi * self.Ibar(h, server, k) )
+        return self.delta
 
-                self.deltabar[i, k] = self.tau[i, server] + numerator / denominator if denominator > 0 else -1
+    def __deltabar(self, alternative = 1):
+        """
+        Compute the average delays when probing, for all the alternatives,
+        and return those of the given one.
+        """
+
+        if self.deltabar is None:
+            self.check('delta')
+            now = time.time()
+            self.deltabar = [self.__delays(j) for j in range(1, self.radix.max())]
+            self.record('delta', now)
 
-        return self.deltabar
+        return self.deltabar[alternative - 1]
 
     def transition(self):
         "Compute the transition matrix"
@@ -203,94 +530,287 @@ class SteadyState(SteadyStateGeneric):
         if self.Q is not None:
             return self.Q
 
-        # make sure the self.delta and self.deltabar variables are initialized
-        self.__delta()
-        self.__deltabar()
+        (leaving, fanout) = self.__fanout()
 
-        # create an empty sparse matrix
-        self.Q = sp.dok_matrix((self.nstates,self.nstates))
+        self.check('transition')
+        now = time.time()
+        indptr = np.zeros(self.nstates + 1, dtype=np.int64)
+        np.cumsum(fanout, out=indptr[1:])
+        index_type = np.int32 if indptr[-1] < np.iinfo(np.int32).max else np.int64
+        indptr = indptr.astype(index_type)
+        indices = np.empty(indptr[-1], dtype=index_type)
+        data = np.empty(indptr[-1])
 
-        # fill the sparse matrix Q with the state transition probabilities
-        for k in range(self.nstates):
-            # for every client, the possible servers to which it may go
-            possible_destinations = []
-            for i in range(self.nclients):
-                if self.__remain(i, k):
-                    possible_destinations.append([self.state[i, k]])
-                else:
-                    possible_destinations.append([self.state[i, k], self.statebar[i, k]])
-
-            # identify the list of possible destination states, not including itself
-            dest_states = []
-            for h in range(self.nstates):
-                to_be_added = True
-                if h == k:
-                    to_be_added = False
-                else:
-                    for i in range(self.nclients):
-                        #if self.state[i, h] not in possible_destinations[i] or \
-                        #   self.delta[i, h] < 0:
-                        if self.state[i, h] not in possible_destinations[i]:
-                            to_be_added = False
-                            break
-                if to_be_added:
-                    dest_states.append(h)
-            
-            # if there are no possible destinations, then k is an absorbing state,
-            # which should not be the case
-            if len(dest_states) == 0:
-                #for xxx in range(self.nclients):
-                #    print "{} {} {}".format(
-                #        self.delta[xxx, k],
-                #        self.deltabar[xxx, k],
-                #        possible_destinations[xxx])
-                raise DegenerateException("Cannot compute transition matrix with absorbing states")
+        # fill the rows in chunks, to bound the size of temporary arrays
+        for (first, last, origins, destinations, rates) in \
+            self.__transitions(leaving, fanout, self.chunk_size):
+            indices[indptr[first]:indptr[last]] = destinations
+            data[indptr[first]:indptr[last]] = rates
+            self.check('transition')
 
-            # we assume any state has the same probability to be reached from this
-            state_prob = 1.0 / len(dest_states)
-            for h in dest_states:
-                self.Q[k, h] = state_prob
+        self.Q = sp.csr_matrix((data, indices, indptr), shape=(self.nstates, self.nstates))
+        self.Q.sort_indices()
 
-            # the transition matrix has zero-sum per row
-            self.Q[k, k] = -1.0
+        self.record('transition', now)
+        self.stats['nnz'] = int(self.Q.nnz)
 
         return self.Q
 
+    def transition_operator(self):
+        """
+        Return the transition matrix as a LinearOperator, which computes
+        the products with the matrix on the fly without storing it.
+        """
+
+        if self.Qop is not None:
+            return self.Qop
+
+        (leaving, fanout) = self.__fanout()
+
+        # use chunks at least as big as the number of states, since the
+        # cost of scattering every chunk over the states is proportional to it
+        chunk_size = max(self.chunk_size, self.nstates)
+        self.Qop = TransitionOperator(
+            self.nstates,
+            lambda: self.__transitions(leaving, fanout, chunk_size))
+        self.stats['nnz'] = int(fanout.sum())
+
+        return self.Qop
+
+    def __fanout(self):
+        """
+        Return the bitmask of the alternatives that the clients prefer, see
+        __leaving(), and the number of transitions, including that to the
+        same state, in every state.
+
+        Raise DegenerateException if there are absorbing states.
+        """
+
+        # for every state, the clients that may switch to the probed server
+        leaving = self.__leaving()
+
+        # if there are no possible destinations, then k is an absorbing state,
+        # which should not be the case
+        if np.any(leaving == 0):
+            raise DegenerateException("Cannot compute transition matrix with absorbing states")
+
+        # every combination of the clients leaving, each to one of the
+        # alternatives it prefers, is a transition, where the empty one is
+        # the state itself, i.e., the diagonal element
+        return (leaving, self.__choices(leaving))
+
+    def __transitions(self, leaving, fanout, chunk_size, states = None):
+        """
+        Generate the transitions from the given states, all if None, with about
+        chunk_size transitions at a time.
+
+        Yield tuples (first, last, origins, destinations, rates), where the
+        transitions are from states[first:last] grouped by origin.
+        """
+
+        if states is None:
+            states = np.arange(self.nstates)
+
+        indptr = np.zeros(len(states) + 1, dtype=np.int64)
+        np.cumsum(fanout[states], out=indptr[1:])
+
+        first = 0
+        while first < len(states):
+            last = max(first + 1,
+                       np.searchsorted(indptr, indptr[first] + chunk_size, side='right') - 1)
+            (origins, destinations) = self.__destinations(
+                states[first:last], leaving[states[first:last]])
+
+            # we assume any state has the same probability to be reached from this
+            # and the transition matrix has zero-sum per row
+            rates = np.where(origins == destinations, -1.0, 1.0 / (fanout[origins] - 1))
+
+            yield (first, last, origins, destinations, rates)
+
+            first = last
+
+    def __update_transition(self, leaving):
+        """
+        Update the transition matrix, if already computed, after a change of
+        the clients leaving: only the rows of the states where the clients
+        leaving are different from the given ones are computed again.
+        """
+
+        if self.Q is None or leaving is None:
+            return
+
+        try:
+            (leaving_new, fanout) = self.__fanout()
+        except DegenerateException:
+            self.Q = None
+            return
+
+        changed = np.flatnonzero(leaving != leaving_new)
+        if len(changed) == 0:
+            return
+
+        now = time.time()
+
+        # new number of elements per row
+        old_indptr = self.Q.indptr.astype(np.int64)
+        nelements = np.diff(old_indptr)
+        nelements[changed] = fanout[changed]
+        indptr = np.zeros(self.nstates + 1, dtype=np.int64)
+        np.cumsum(nelements, out=indptr[1:])
+        index_type = np.int32 if indptr[-1] < np.iinfo(np.int32).max else np.int64
+        indices = np.empty(indptr[-1], dtype=index_type)
+        data = np.empty(indptr[-1])
+
+        # copy the rows that have not changed
+        rows = np.repeat(np.arange(self.nstates), np.diff(old_indptr))
+        keep = np.ones(self.nstates, dtype=bool)
+        keep[changed] = False
+        keep = keep[rows]
+        positions = indptr[rows[keep]] + np.arange(len(rows))[keep] - old_indptr[rows[keep]]
+        indices[positions] = self.Q.indices[keep]
+        data[positions] = self.Q.data[keep]
+
+        # fill the rows that have changed
+        for (first, last, origins, destinations, rates) in \
+            self.__transitions(leaving_new, fanout, self.chunk_size, changed):
+            positions = indptr[origins] + np.arange(len(origins)) - \
+                np.repeat(np.cumsum(fanout[changed[first:last]]) - fanout[changed[first:last]],
+                          fanout[changed[first:last]])
+            indices[positions] = destinations
+            data[positions] = rates
+
+        self.Q = sp.csr_matrix(
+            (data, indices, indptr.astype(index_type)), shape=(self.nstates, self.nstates))
+        self.Q.sort_indices()
+
+        self.record('transition', now)
+        self.stats['nnz'] = int(self.Q.nnz)
+
+    def __destinations(self, states, leaving):
+        """
+        Return the transitions from the given states as two arrays with
+        the origin and destination state indices, grouped by origin.
+
+        leaving[k] is the bitmask of the alternatives preferred by the
+        clients when in states[k]: any subset of the clients with at least
+        one can switch, each to one of those it prefers, while all the others
+        remain where they are. The empty subset, i.e., the transition from
+        a state to itself, is the first one of every group.
+        """
+
+        fanout = self.__choices(leaving)
+        origins = np.repeat(states, fanout)
+        masks = np.repeat(leaving, fanout)
+        subset = np.arange(len(origins)) - np.repeat(np.cumsum(fanout) - fanout, fanout)
+
+        if self.binary:
+            # the bits of the subset index select which of the leaving clients switch
+            flips = np.zeros(len(origins), dtype=np.int64)
+            for bit in self.bits[::-1, 0]:
+                switching = (masks & bit) != 0
+                flips[switching & (subset & 1 == 1)] |= bit
+                subset[switching] >>= 1
+
+            return (origins, origins ^ flips)
+
+        # the subset index is in mixed radix, with one digit per client
+        # whose base is the number of alternatives preferred plus one:
+        # 0 if the client remains, otherwise the alternative it switches to
+        destinations = origins.copy()
+        for i in range(self.nclients - 1, -1, -1):
+            preferred = (masks[:, np.newaxis] & self.bits[i]) != 0
+            seen = np.cumsum(preferred, axis=1)
+            choice = subset % (seen[:, -1] + 1)
+            subset //= seen[:, -1] + 1
+
+            alternative = np.zeros(len(origins), dtype=np.int64)
+            for j in range(1, self.radix[i]):
+                alternative[preferred[:, j - 1] & (seen[:, j - 1] == choice)] = j
+
+            digit = (origins // self.strides[i]) % self.radix[i]
+            destinations += ((digit + alternative) % self.radix[i] - digit) * self.strides[i]
+
+        return (origins, destinations)
+
+    def __choices(self, masks):
+        """
+        Return the number of combinations of the clients remaining or
+        switching to one of the alternatives they prefer in every bitmask,
+        see __leaving().
+        """
+
+        if self.binary:
+            count = np.zeros(len(masks), dtype=np.int64)
+            for bit in self.bits[:, 0]:
+                count += (masks & bit) != 0
+            return np.left_shift(1, count)
+
+        choices = np.ones(len(masks), dtype=np.int64)
+        for i in range(self.nclients):
+            count = np.ones(len(masks), dtype=np.int64)
+            for bit in self.bits[i, :self.radix[i] - 1]:
+                count += (masks & bit) != 0
+            choices *= count
+        return choices
 
-    #
-    # copied from the SciPy cookbook
-    # file: tandemqueue.py
-    # the method is originally called computePiMethod1()
-    #
-    # https://scipy-cookbook.readthedocs.io/items/Solving_Large_Markov_Chains.html
-    #
     def probabilities(self):
-        "Compute the steady state probabilities"
+        """
+        Compute the steady state probabilities.
+
+        Only the recurrent classes of the chain are solved, see
+        solvers.solve_recurrent(), starting from state 0 if there are more
+        than one. With a matrix-free transition operator the whole chain is
+        solved, since finding the classes requires the explicit matrix.
+        """
 
         if self.pi is not None:
             return self.pi
 
-        # make sure the self.Q variable is initialized
-        self.transition()
-
-        size = self.nstates
-        l = min(self.Q.values())*1.001  # avoid periodicity, see trivedi's book
-        P = sp.eye(size, size) - self.Q/l
-        # compute Pi
-        P =  P.tocsr()
-        self.pi = np.zeros(size)
-        pi1 = np.zeros(size)
-        self.pi[0] = 1;
-        n = norm(self.pi - pi1, 1)
-        iterations = 0
-        while n > 1e-3 and iterations < 1e5:
-            pi1 = self.pi*P
-            self.pi = pi1*P   # avoid copying pi1 to pi
-            n = norm(self.pi - pi1, 1)
-            iterations += 1
+        # make sure the transition matrix is initialized
+        if self.matrix_free:
+            Q = self.transition_operator()
+        else:
+            Q = self.transition()
+
+        self.check('solve')
+        now = time.time()
+        solve = solvers.solve if self.matrix_free else solvers.solve_recurrent
+        try:
+            self.solution = solve(
+                Q,
+                solver = self.solver,
+                tol = self.tol,
+                maxiter = self.maxiter,
+                preconditioner = self.preconditioner,
+                x0 = self.pi0,
+                deadline = self.deadline)
+        except solvers.DeadlineException:
+            raise BudgetException("Time budget exceeded in phase solve")
+        self.pi = self.solution.pi
+        self.record('solve', now)
+        self.stats.update(self.solution.stats())
+        self.stats['nstates'] = self.nstates
+        self.stats['lumped']  = False
+
+        if self.solution.classes > 1:
+            print "> 1 recurrent class: {} classes, {} states solved".format(
+                self.solution.classes, self.solution.states)
+
+        if self.verbose:
+            print "Steady state probabilities: {}".format(self.solution)
 
         return self.pi
 
+    @staticmethod
+    def remain(delta, deltabar):
+        """
+        Return True where a client prefers to remain on its server, given
+        the average delays when served and when probing, which are -1 if
+        the server is unstable. Works element-wise on arrays.
+        """
+
+        return (delta >= 0) & ((deltabar < 0) | (deltabar >= delta))
+
     def __remain(self, i, k):
         """
         Return True if the client i prefers to remain when in state k.
@@ -309,35 +829,232 @@ class SteadyState(SteadyStateGeneric):
 
         if self.delta[i, k] < 0:
             return False  # leave
-        if self.deltabar[i, k] < 0:
+        if self.deltabar[0][i, k] < 0:
             return True   # remain
-        if self.deltabar[i, k] < self.delta[i, k]:
+        if self.deltabar[0][i, k] < self.delta[i, k]:
             return False  # leave
         return True  # remain
 
+    def __leaving(self):
+        """
+        Return the bitmask of the alternatives that the clients prefer to
+        their server in every state, see bits, which is 0 in the absorbing
+        states.
+
+        This is the vectorized counterpart of __remain(), applied to every
+        alternative: if the server of a client is unstable it prefers all
+        its alternatives, otherwise only those that are stable and with a
+        smaller delay. With two possible servers per client, this is the
+        bitmask of the clients that prefer to leave.
+        """
+
+        if self.leave is not None:
+            return self.leave
+
+        self.leave = self.__preferred(
+            self.__delta(), [self.__deltabar(j) for j in range(1, self.radix.max())])
+
+        return self.leave
+
+    def __preferred(self, delta, deltabar):
+        """
+        Return the bitmask of the alternatives preferred, given the delays
+        when served and the list of the delays when probing every alternative.
+        """
+
+        leave = np.zeros(delta.shape[1], dtype=np.int64)
+        for (j, delays) in enumerate(deltabar):
+            preferred = np.logical_not(self.remain(delta, delays)).astype(np.int64)
+            leave += np.dot(self.bits[:, j], preferred)
+
+        return leave
+
     def absorbing(self):
         "Return the list of absorbing states (may be empty)"
 
-        if self.delta is None:
-            self.__delta()
-        if self.deltabar is None:
-            self.__deltabar();
-        ret = []
-        for k in range(self.nstates):
-            serving_faster = True
-            for i in range(self.nclients):
-                serving_faster &= self.__remain(i, k)
-            if serving_faster:
-                ret.append(k)
+        leaving = self.__leaving()
+
+        # no client leaves an absorbing state
+        now = time.time()
+        ret = np.flatnonzero(leaving == 0).tolist()
+        self.record('absorbing', now)
 
         return ret
 
+    def has_absorbing(self):
+        """
+        Return True if there is at least one absorbing state.
+
+        If the delays have not been computed yet, the states are checked in
+        chunks, without saving the delays, stopping at the first absorbing
+        state found, which is cheaper than absorbing() when there is one.
+        """
+
+        if self.leave is not None or (self.delta is not None and self.deltabar is not None):
+            return len(self.absorbing()) > 0
+
+        now = time.time()
+        chunk_size = max(1, self.chunk_size // self.nclients)
+        for first in range(0, self.nstates, chunk_size):
+            self.check('absorbing')
+            states = np.arange(first, min(first + chunk_size, self.nstates))
+            leave = self.__preferred(
+                self.__delays(False, states),
+                [self.__delays(j, states) for j in range(1, self.radix.max())])
+            if np.any(leave == 0):
+                self.record('absorbing', now)
+                return True
+        self.record('absorbing', now)
+
+        return False
+
+    def lumped_chain(self):
+        """
+        Return the lumped chain, where the indistinguishable clients are
+        grouped together, or None if lumping is disabled, if some clients
+        have more than two possible servers, or if it would not reduce the
+        number of states.
+        """
+
+        if not self.lumping or not self.binary:
+            return None
+
+        if self.lumped is None:
+            sizes = np.array([len(c) for c in self.classes])
+            if np.prod(sizes + 1.0) >= self.nstates:
+                return None
+            self.lumped = LumpedChain(self, self.classes)
+
+        return self.lumped
+
+    def sweep(self, chis):
+        """
+        Return the average delay per client (column) for every value of chi (row).
+
+        The data structures that do not depend on chi are computed once, the
+        transition matrix is updated only in the rows of the states where the
+        clients leaving change, and every steady state is solved starting from
+        the probabilities found with the previous value of chi.
+
+        At the end, the object is left with the last value of chi.
+        """
+
+        delays = np.zeros([len(chis), self.nclients])
+        for (ndx, chi) in enumerate(chis):
+            self.set_chi(chi)
+            delays[ndx] = self.steady_state_delays()
+
+        return delays
+
+    def set_chi(self, chi):
+        """
+        Change the fraction of requests sent to the probed servers.
+
+        All the average delays depend on chi, but the data structures that do
+        not are kept, and the steady state is updated as in set_mu().
+        """
+
+        assert 0 < chi < 1
+        if chi == self.chi:
+            return
+
+        self.chi      = chi
+        self.delta    = None
+        self.deltabar = None
+        self.__update()
+
+    def set_mu(self, server, mu):
+        """
+        Change the serving rate of a server.
+
+        Only the average delays of the clients served by or probing the
+        server are computed again, then only the rows of the transition
+        matrix of the states where the clients leaving change are updated,
+        and the steady state is solved starting from the previous one.
+        """
+
+        assert 0 <= server < self.nservers
+        if mu == self.mu[server]:
+            return
+
+        # do not change the array of the configuration
+        self.mu = np.array(self.mu, dtype=float)
+        self.mu[server] = mu
+
+        self.__refresh([server])
+        self.__update()
+
+    def set_load(self, client, load):
+        """
+        Change the load of a client.
+
+        The load offered to its possible servers is updated, then only
+        the average delays of the clients served by or probing them are
+        computed again, and the steady state is updated as in set_mu().
+        """
+
+        assert 0 <= client < self.nclients
+        if load == self.load[client]:
+            return
+
+        # do not change the array of the configuration
+        difference = load - self.load[client]
+        self.load = np.array(self.load, dtype=float)
+        self.load[client] = load
+
+        if self.served is not None:
+            states = np.arange(self.nstates)
+            self.served[self.server(client, states), states] += difference
+            for j in range(1, self.radix[client]):
+                self.probed[self.server(client, states, j), states] += \
+                    difference / float(self.radix[client] - 1)
+
+        # the client may not be indistinguishable from the same others anymore
+        classes = LumpedChain.equivalence_classes(self.possible_servers, self.tau, self.x, self.load)
+        if classes != self.classes:
+            self.classes = classes
+            self.lumped  = None
+
+        self.__refresh(self.possible_servers[client, :self.radix[client]])
+        self.__update()
+
+    def __update(self):
+        """
+        Invalidate the data structures that depend on the delays, after these
+        have been reset or updated, but keep what can be reused to compute
+        them again.
+        """
+
+        # keep the last probabilities as the initial guess of the solver
+        if self.pi is not None:
+            self.pi0 = self.pi
+        if self.lumped is not None:
+            self.lumped = LumpedChain(self, self.classes, self.lumped.pi)
+
+        leaving = self.leave
+        self.leave    = None
+        self.Qop      = None
+        self.pi       = None
+        self.solution = None
+        self.delays   = None
+
+        self.__update_transition(leaving)
+
     def steady_state_delays(self):
         "Return the average delay per client"
 
         if self.delays is not None:
             return self.delays
 
+        # solve the smaller chain, if there are indistinguishable clients
+        lumped = self.lumped_chain()
+        if lumped is not None:
+            self.stats['nstates'] = lumped.nstates
+            self.stats['lumped']  = True
+            self.delays = lumped.steady_state_delays()
+            self.solution = lumped.solution
+            return self.delays
+
         # make sure the delta and state probabilities are initialized
         self.__delta()
 
@@ -366,6 +1083,298 @@ class SteadyState(SteadyStateGeneric):
 ################################################################################
 ################################################################################
 
+class LumpedChain(object):
+    """
+    Markov chain of SteadyState with indistinguishable clients lumped together.
+
+    The clients with the same possible servers, load, requests and network
+    delays form a class. Since the transition rates do not change if two
+    clients of the same class are swapped, the chain can be lumped into one
+    where the state is the number of clients of every class served by the
+    first of the two possible servers of that class, the others being
+    served by the second one.
+    """
+
+    def __init__(self, steadystate, classes, x0 = None):
+        self.ss      = steadystate
+        self.classes = classes
+
+        # initial guess of the steady state probabilities
+        self.x0 = x0
+
+        # lazy initialization variables
+        self.on_first  = None
+        self.on_second = None
+        self.Q         = None
+        self.pi        = None
+        self.solution  = None
+        self.delays    = None
+
+        # per class variables, taken from the first client of every class
+        first_client = np.array([c[0] for c in classes])
+        self.size    = np.array([len(c) for c in classes])
+        self.first   = self.ss.possible_servers[first_client, 0]
+        self.second  = self.ss.possible_servers[first_client, 1]
+        self.load    = self.ss.load[first_client]
+
+        # the state index is in mixed radix, the first class being the most significant
+        self.nclasses = len(classes)
+        self.nstates  = int(np.prod(self.size + 1))
+        self.strides  = np.ones(self.nclasses, dtype=np.int64)
+        for c in range(self.nclasses - 2, -1, -1):
+            self.strides[c] = self.strides[c + 1] * (self.size[c + 1] + 1)
+
+        # number of clients of every class (row) on the first server in every state (column)
+        self.count = (np.arange(self.nstates)[np.newaxis, :] // self.strides[:, np.newaxis]) % \
+            (self.size[:, np.newaxis] + 1)
+
+    @staticmethod
+    def equivalence_classes(possible_servers, tau, x, load):
+        "Return the list of the clients in every class of indistinguishable clients"
+
+        classes = []
+        keys = dict()
+        for i in range(len(possible_servers)):
+            key = (tuple(possible_servers[i]), tuple(tau[i]), x[i], load[i])
+            if key not in keys:
+                keys[key] = len(classes)
+                classes.append([])
+            classes[keys[key]].append(i)
+
+        return classes
+
+    def __delays(self):
+        """
+        Compute the average delays of the clients of every class (row) on the
+        first and second server in every state (column), which are the same
+        if the clients are served by or probing the server.
+        """
+
+        if self.on_first is not None:
+            return
+
+        self.ss.check('delta')
+        now = time.time()
+        served = np.zeros([self.ss.nservers, self.nstates])
+        probed = np.zeros([self.ss.nservers, self.nstates])
+        for c in range(self.nclasses):
+            served[self.first[c]]  += self.load[c] * self.count[c]
+            served[self.second[c]] += self.load[c] * (self.size[c] - self.count[c])
+            probed[self.first[c]]  += self.load[c] * (self.size[c] - self.count[c])
+            probed[self.second[c]] += self.load[c] * self.count[c]
+
+        first_client = [c[0] for c in self.classes]
+        def delays(servers):
+            mu = self.ss.mu[servers][:, np.newaxis]
+            denominator = mu - served[servers] - self.ss.chi * probed[servers]
+            stable = denominator > 0
+            numerator = self.ss.x[first_client][:, np.newaxis] * mu
+            tau = self.ss.tau[first_client, servers][:, np.newaxis]
+            return np.where(stable, tau + numerator / np.where(stable, denominator, 1.0), -1.0)
+
+        self.on_first  = delays(self.first)
+        self.on_second = delays(self.second)
+        self.ss.record('delta', now)
+
+    def leaving(self):
+        """
+        Return the number of clients of every class that prefer to leave the
+        first and second server, respectively, in every state.
+
+        The decision follows the same rules as in SteadyState.remain().
+        """
+
+        self.__delays()
+
+        leaving_first = np.where(
+            SteadyState.remain(self.on_first, self.on_second), 0, self.count)
+        leaving_second = np.where(
+            SteadyState.remain(self.on_second, self.on_first), 0, self.size[:, np.newaxis] - self.count)
+
+        return (leaving_first, leaving_second)
+
+    def absorbing(self):
+        "Return the list of absorbing states of the lumped chain (may be empty)"
+
+        (leaving_first, leaving_second) = self.leaving()
+        return np.flatnonzero(leaving_first.sum(axis=0) + leaving_second.sum(axis=0) == 0).tolist()
+
+    def transition(self):
+        """
+        Compute the transition matrix.
+
+        In the original chain every non-empty subset of the clients leaving
+        is a destination with the same probability. The number of subsets
+        yielding a given number of clients of a class on the first server is
+        found by convolving the binomial coefficients of the clients leaving
+        the first and second server, and the classes are independent.
+
+        The convolutions are tabulated once for all the numbers of clients
+        leaving, and the destinations of all the states are expanded one
+        class at a time, at most chunk_size transitions at once, see
+        SteadyState.
+        """
+
+        if self.Q is not None:
+            return self.Q
+
+        (leaving_first, leaving_second) = self.leaving()
+
+        self.ss.check('transition')
+        now = time.time()
+        nleaving = leaving_first.sum(axis=0) + leaving_second.sum(axis=0)
+        if np.any(nleaving == 0):
+            raise DegenerateException("Cannot compute transition matrix with absorbing states")
+
+        # number of subsets of a clients leaving the first server and b the
+        # second one with t - a clients moving to the first, in table[a, b, t]
+        largest = int(self.size.max())
+        table = np.zeros([largest + 1, largest + 1, 2 * largest + 1])
+        for a in range(largest + 1):
+            for b in range(largest + 1):
+                table[a, b, :a + b + 1] = np.convolve(
+                    comb(a, np.arange(a + 1)), comb(b, np.arange(b + 1)))
+
+        # number of destinations of every state
+        widths = leaving_first + leaving_second + 1
+        fanout = np.prod(widths, axis=0)
+
+        rows = []
+        cols = []
+        data = []
+        first = 0
+        while first < self.nstates:
+            # largest chunk of states with at most chunk_size transitions
+            last = first + max(1, int(np.searchsorted(
+                np.cumsum(fanout[first:]), self.ss.chunk_size, side='right')))
+
+            src = np.arange(first, last, dtype=np.int64)
+            subsets = np.ones(len(src))
+            destinations = np.zeros(len(src), dtype=np.int64)
+            for c in range(self.nclasses):
+                # every partial destination is expanded into widths[c] ones
+                width = widths[c, src]
+                expanded = np.repeat(np.arange(len(src)), width)
+                t = np.arange(len(expanded)) - np.repeat(np.cumsum(width) - width, width)
+                src = src[expanded]
+                a = leaving_first[c, src]
+                b = leaving_second[c, src]
+                subsets = subsets[expanded] * table[a, b, t]
+                destinations = destinations[expanded] + (self.count[c, src] - a + t) * self.strides[c]
+
+            # the empty subset, and those swapping clients of the same class,
+            # do not change the state
+            rates = subsets / (2.0 ** nleaving[src] - 1)
+            rates[destinations == src] = 0
+
+            rows += [src, np.arange(first, last, dtype=np.int64)]
+            cols += [destinations, np.arange(first, last, dtype=np.int64)]
+            data += [rates, -np.bincount(src - first, rates, last - first)]
+            first = last
+            self.ss.check('transition')
+
+        self.Q = sp.csr_matrix(
+            (np.concatenate(data), (np.concatenate(rows), np.concatenate(cols))),
+            shape=(self.nstates, self.nstates))
+        self.Q.eliminate_zeros()
+
+        self.ss.record('transition', now)
+        self.ss.stats['nnz'] = int(self.Q.nnz)
+
+        return self.Q
+
+    def probabilities(self):
+        "Compute the steady state probabilities of the recurrent classes"
+
+        if self.pi is not None:
+            return self.pi
+
+        Q = self.transition()
+
+        # the initial state of SteadyState, with all the clients on the first server
+        self.ss.check('solve')
+        now = time.time()
+        try:
+            self.solution = solvers.solve_recurrent(
+                Q,
+                start = self.nstates - 1,
+                solver = self.ss.solver,
+                tol = self.ss.tol,
+                maxiter = self.ss.maxiter,
+                preconditioner = self.ss.preconditioner,
+                x0 = self.x0,
+                deadline = self.ss.deadline)
+        except solvers.DeadlineException:
+            raise BudgetException("Time budget exceeded in phase solve")
+        self.pi = self.solution.pi
+        self.ss.record('solve', now)
+        self.ss.stats.update(self.solution.stats())
+
+        if self.solution.classes > 1:
+            print "> 1 recurrent class: {} classes, {} states solved".format(
+                self.solution.classes, self.solution.states)
+
+        return self.pi
+
+    def steady_state_delays(self):
+        """
+        Return the average delay per client.
+
+        All the clients of a class have the same average delay, where in
+        every state a client is on the first server with probability equal
+        to the fraction of the clients of its class there.
+        """
+
+        if self.delays is not None:
+            return self.delays
+
+        self.__delays()
+        fraction = self.count / self.size[:, np.newaxis].astype(float)
+
+        try:
+            self.probabilities()
+
+            per_class = np.matmul(
+                fraction * self.on_first + (1 - fraction) * self.on_second, self.pi)
+
+        except DegenerateException:
+            now = time.time()
+            absorbing_states = self.absorbing()
+            self.ss.record('absorbing', now)
+            assert len(absorbing_states) > 0
+
+            # the absorbing state with the smallest index in SteadyState has,
+            # in every class, the first clients on the first server
+            representative = lambda k: sum(
+                sum(1 << (self.ss.nclients - 1 - i) for i in self.classes[c][self.count[c, k]:])
+                for c in range(self.nclasses))
+            state = min(absorbing_states, key=representative)
+
+            nabsorbing = sum(np.prod(comb(self.size, self.count[:, k])) for k in absorbing_states)
+            if nabsorbing > 1:
+                print "> 1 absorbing state: {} states".format(int(nabsorbing))
+            else:
+                print "found an absorbing state"
+
+            self.delays = np.zeros([self.ss.nclients])
+            for c in range(self.nclasses):
+                for (ndx, i) in enumerate(self.classes[c]):
+                    if ndx < self.count[c, state]:
+                        self.delays[i] = self.on_first[c, state]
+                    else:
+                        self.delays[i] = self.on_second[c, state]
+            return self.delays
+
+        self.delays = np.zeros([self.ss.nclients])
+        for c in range(self.nclasses):
+            self.delays[self.classes[c]] = per_class[c]
+
+        return self.delays
+
+################################################################################
+################################################################################
+################################################################################
+
 class SteadyStateSingle(SteadyStateGeneric):
     """Steady-state delays of a serverless edge computing with a single option"""
 
@@ -454,40 +1463,208 @@ class SteadyStateSingle(SteadyStateGeneric):
                     ( self.x[i] * self.mu[server] ) / \
                     ( self.mu[server] - loads[server] )
 
-                self.delays[i] = self.tau[i, j] + queueing_delay \
-            
+                self.delays[i] = self.tau[i, server] + queueing_delay
+
         return self.delays
 
+    @staticmethod
+    def batch_delays(batch):
+        """
+        Return the average delay per client of all the configurations in a
+        ConfigurationBatch, as a matrix with shape (runs, clients).
+        """
+
+        assert np.all(batch.association.sum(axis=2) == 1)
+
+        (nruns, nclients, nservers) = batch.tau.shape
+        runs = np.arange(nruns)[:, np.newaxis]
+        clients = np.arange(nclients)[np.newaxis, :]
+
+        # server of every client and total load per every server
+        servers = np.argmax(batch.association, axis=2)
+        loads = np.einsum('ri,ris->rs', batch.load, batch.association)
+
+        # compute average delay, use -1 if server is unstable
+        mu = batch.mu[runs, servers]
+        load = loads[runs, servers]
+        stable = mu > load
+        queueing_delay = batch.x * mu / np.where(stable, mu - load, 1.0)
+
+        return np.where(stable, batch.tau[runs, clients, servers] + queueing_delay, -1.0)
+
 ################################################################################
 ################################################################################
 ################################################################################
 
 class Simulator(object):
-    "Run simulations using a pool of threads"
+    "Run simulations using a pool of threads or processes"
 
-    def __init__(self, single = False, nthreads = 1, verbose = False, progress = False):
-        "Initialize object"
+    def __init__(self, single = False, nthreads = 1, verbose = False, progress = False, options = None,
+                 processes = False, cache = None, cache_pi = False, callback = None, absorbing = False,
+                 method = 'exact', time_budget = None, memory_budget = None, fallback = None,
+                 fallback_options = None, aggregate = None, coordinator = None, authkey = None,
+                 lease = None, retries = None):
+        """
+        Initialize object.
+
+        options is a dictionary of additional keyword arguments passed to
+        every SteadyState object, e.g., to select the solver.
+
+        With processes, the simulations are run by a pool of nthreads worker
+        processes, instead of threads, so that they are not serialized by the GIL.
+
+        If cache is not None, it is a ResultCache where the results are looked
+        up before running a simulation, and stored after, with the steady
+        state probabilities only if cache_pi is True, those of the lumped
+        chain if solved instead, see ResultCache.get(). The simulations with
+        a single option are never cached, since they are cheaper than that.
+
+        If callback is not None, it is called with the job index and the
+        average delays, which are None if the run has been skipped, as soon
+        as every simulation completes, never concurrently, when its absorbing
+        states are already saved in absorbing_states.
+
+        If aggregate is not None, it is an aggregate.Aggregate to which the
+        average delays of every simulation are added as soon as available.
+
+        If coordinator is not None, it is the address, as a tuple with the
+        host and port, where the simulations are served to the workers, see
+        distributed.py, and nthreads of them are started on this host,
+        possibly none. The workers connect with the given authkey, if None
+        that in the environment, see distributed.find_authkey(), or else a
+        random one, which is printed and saved in authkey. Every job is
+        leased to a worker, which must complete it within lease seconds, or
+        renew the lease, otherwise it is given to another worker, up to
+        retries times, after which it is skipped with lost set to True in
+        stats. A job whose simulation raises an exception is skipped with
+        failed set to True, and the error in stats. If all the workers on
+        this host exit with jobs left, RuntimeError is raised. The cache
+        cannot be used, and with single the simulations are still run
+        locally.
+
+        With absorbing, only the absorbing states are searched, without
+        computing the average delays, and the results are saved in
+        absorbing_states. This cannot be used with single.
+
+        method is 'exact', to solve the Markov chain with SteadyState,
+        'montecarlo', to simulate it with montecarlo.MonteCarlo, or
+        'meanfield', to approximate it with meanfield.MeanField, in which
+        cases options are passed to the latter.
+
+        The execution statistics of every simulation are saved in stats,
+        see SteadyState.record(), with the total time required in elapsed
+        and, if found in the cache, cached set to True.
+
+        The jobs are executed in decreasing order of estimated cost, see
+        job_cost(), so that the largest ones do not delay the end of all.
+
+        With the exact method, every job can be given a wall-time budget,
+        in s, which is checked before every phase of the computation and at
+        every iteration of the solvers, see SteadyState.check(), and also
+        enforced with a timer in the worker processes, see _simulate(), and
+        a memory budget, in bytes, which is checked before starting it based
+        on SteadyState.estimate(): if the transition matrix does not fit, the
+        matrix-free operator is used instead. A result already computed is
+        never discarded, even if over the time budget. A job over budget is
+        computed again with the fallback method, 'montecarlo' or 'meanfield'
+        with fallback_options, if not None and possible, otherwise it is
+        skipped. The reason is saved in stats, in budget, and so is the
+        method used, in fallback, or skipped is set to True.
+        """
 
         # consistency checks
-        assert nthreads >= 1
+        assert nthreads >= 1 or (nthreads == 0 and coordinator is not None)
+        assert not (single and absorbing)
+        assert method in ['exact', 'montecarlo', 'meanfield']
+        assert method == 'exact' or not (single or absorbing)
+        assert time_budget is None or time_budget > 0
+        assert memory_budget is None or memory_budget > 0
+        assert fallback in [None, 'montecarlo', 'meanfield']
+        assert coordinator is None or cache is None
 
         # input
-        self.single   = single
-        self.nthreads = nthreads
-        self.verbose  = verbose
-        self.progress = progress
+        self.single    = single
+        self.nthreads  = nthreads
+        self.verbose   = verbose
+        self.progress  = progress
+        self.options   = options if options is not None else dict()
+        self.processes = processes
+        self.cache     = cache
+        self.cache_pi  = cache_pi
+        self.callback  = callback
+        self.absorbing = absorbing
+        self.method    = method
+        self.aggregate = aggregate
+
+        # distributed execution, see distributed.Coordinator
+        self.coordinator = coordinator
+        self.authkey     = authkey
+        self.lease       = lease
+        self.retries     = retries
+
+        # quantity computed, also used as the mode of the cache keys
+        self.mode = 'single' if single else 'absorbing' if absorbing else \
+            method if method != 'exact' else 'dual'
+
+        # per-job budgets, see _simulate()
+        self.budget = None
+        if time_budget is not None or memory_budget is not None:
+            self.budget = {
+                'time':             time_budget,
+                'memory':           memory_budget,
+                'fallback':         fallback,
+                'fallback_options': fallback_options if fallback_options is not None else dict(),
+                }
 
         # internal data structures
         self.lock = threading.Lock()
+        self.queue = None
         self.done = []
         self.average_delays = []
+        self.absorbing_states = []
+        self.stats = []
+
+    def run(self, configurations, runs = None):
+        """
+        Run the simulations in the given list of Configuration objects, or
+        in a ConfigurationBatch, e.g., memory-mapped from disk, whose
+        configurations are extracted only when simulated.
+
+        runs are the indices of the runs of the configurations, by default
+        their positions, from which the seed of the random number generator
+        of every run is derived, see _simulate().
+        """
 
-    def run(self, configurations):
-        "Run the simulations in the given list of Configuration objects"
+        assert runs is None or len(runs) == len(configurations)
 
         self.configurations = configurations
+        self.runs = list(runs) if runs is not None else range(len(configurations))
         self.done = [False for i in range(len(configurations))]
         self.average_delays = [None for i in range(len(configurations))]
+        self.absorbing_states = [None for i in range(len(configurations))]
+        self.stats = [None for i in range(len(configurations))]
+
+        batch = isinstance(configurations, ConfigurationBatch)
+        if self.single and (batch or len(set([c.tau.shape for c in configurations])) == 1):
+            self.__run_batch()
+            return
+
+        # largest jobs first, see job_cost()
+        costs = [job_cost(self.configurations[job]) for job in range(len(configurations))] \
+            if self.mode in ['dual', 'absorbing'] else [0] * len(configurations)
+        order = sorted(range(len(configurations)), key=lambda job: -costs[job])
+
+        if self.coordinator is not None:
+            self.__run_distributed(order)
+            return
+
+        if self.processes:
+            self.__run_processes(order)
+            return
+
+        self.queue = Queue.Queue()
+        for job in order:
+            self.queue.put(job)
 
         # spawn threads
         threads = []
@@ -500,38 +1677,370 @@ class Simulator(object):
         for t in threads:
             t.join()
 
+    def __run_batch(self):
+        "Execute all the simulations with a single option in one vectorized call"
+
+        if self.verbose:
+            for job in range(len(self.configurations)):
+                SteadyStateSingle(self.configurations[job], self.verbose).debugPrint(True)
+
+        batch = self.configurations
+        if not isinstance(batch, ConfigurationBatch):
+            batch = ConfigurationBatch.stack(batch)
+
+        now = time.time()
+        delays = SteadyStateSingle.batch_delays(batch)
+        elapsed = time.time() - now
+        for job in range(len(self.configurations)):
+            self.done[job] = True
+            self.average_delays[job] = delays[job]
+            self.stats[job] = {'elapsed': elapsed, 'batch': len(self.configurations)}
+            if self.aggregate is not None:
+                self.aggregate.add(delays[job])
+            if self.callback is not None:
+                self.callback(job, delays[job])
+
+        if self.progress:
+            print "batch of {} jobs, required {} s".format(len(self.configurations), elapsed)
+
+    def __run_processes(self, order):
+        """
+        Execute all the simulations in a pool of processes, in the given order.
+
+        The configurations are handed to every worker once, when it is
+        created, so that only the job indices are sent with the tasks.
+        """
+
+        if len(self.configurations) == 0:
+            return
+
+        pool = multiprocessing.Pool(
+            processes = min(self.nthreads, len(self.configurations)),
+            initializer = _init_worker,
+            initargs = (self.configurations, self.runs, self.mode, self.verbose, self.options,
+                        self.cache, self.cache_pi, self.budget))
+
+        try:
+            for (job, pid, elapsed, average_delays, absorbing_states, stats) in \
+                pool.imap_unordered(_work_process, order):
+                self.done[job] = True
+                self.__collect("process#{}".format(pid), job, elapsed, average_delays, absorbing_states, stats)
+
+        finally:
+            pool.close()
+            pool.join()
+
+    def __run_distributed(self, order):
+        """
+        Serve all the simulations to the workers of a coordinator, in the
+        given order, and collect their results as soon as available.
+        """
+
+        # imported here since distributed depends on this module
+        import distributed
+
+        if len(self.configurations) == 0:
+            return
+
+        authkey = distributed.find_authkey(self.authkey)
+        if authkey is None:
+            authkey = self.authkey = distributed.random_authkey()
+            print "coordinator authentication key: {}".format(authkey)
+
+        coordinator = distributed.Coordinator(self.coordinator, authkey)
+        coordinator.start(
+            self.configurations, order, (self.mode, self.verbose, self.options, self.budget),
+            runs = self.runs,
+            lease = self.lease if self.lease is not None else distributed.DEFAULT_LEASE,
+            retries = self.retries if self.retries is not None else distributed.DEFAULT_RETRIES)
+
+        completed = False
+        try:
+            if self.progress:
+                print "coordinator serving {} jobs at {}:{}".format(len(order), *coordinator.address)
+            coordinator.spawn(min(self.nthreads, len(self.configurations)))
+
+            remaining = len(order)
+            while remaining > 0:
+                # checked before collecting the last results of the workers
+                exited = len(coordinator.workers) > 0 and coordinator.alive() == 0
+                results = coordinator.collect()
+                for (job, (elapsed, average_delays, absorbing_states, stats)) in results:
+                    self.done[job] = True
+                    self.__collect("coordinator", job, elapsed, average_delays, absorbing_states, stats)
+                    remaining -= 1
+                if remaining > 0 and exited:
+                    raise RuntimeError("All the local workers have exited with {} jobs left".format(remaining))
+                if len(results) == 0:
+                    time.sleep(distributed.POLL_INTERVAL)
+            completed = True
+
+        finally:
+            # on errors, do not wait for the workers to complete the jobs
+            coordinator.shutdown(abort = not completed)
+
+    def __collect(self, worker, job, elapsed, average_delays, absorbing_states, stats):
+        "Save the result of a simulation"
+
+        self.stats[job] = stats
+        self.absorbing_states[job] = absorbing_states
+
+        if self.callback is not None:
+            self.callback(job, average_delays)
+
+        if stats is not None and stats.get('skipped', False):
+            print "skipped run#{}, over {} budget".format(job, stats['budget'])
+            return
+
+        if stats is not None and stats.get('lost', False):
+            print "skipped run#{}, lost after {} retries".format(job, stats['retries'])
+            return
+
+        if stats is not None and stats.get('failed', False):
+            print "skipped run#{}, failed: {}".format(job, stats['error'])
+            return
+
+        if average_delays is None and not self.absorbing:
+            print "skipped run#{}, absorbing states: {}".format(job, ', '.join([str(y) for y in absorbing_states]))
+            return
+
+        if self.progress:
+            print "{}, job {}/{}, required {} s".format(worker, job, len(self.done), elapsed)
+        self.average_delays[job] = average_delays
+        if self.aggregate is not None:
+            self.aggregate.add(average_delays)
+
     def __work(self, tid):
         "Execute a single simulation"
 
         while True:
             # find the next job, if none leave
-            job = None
+            try:
+                job = self.queue.get_nowait()
+            except Queue.Empty:
+                break
+            self.done[job] = True
+
+            (elapsed, average_delays, absorbing_states, stats) = _simulate(
+                self.configurations[job], self.mode, self.verbose, self.options,
+                self.cache, self.cache_pi, self.lock, self.budget, self.runs[job])
+
             with self.lock:
-                for done, ndx in zip(self.done, range(len(self.done))):
-                    if not done:
-                        self.done[ndx] = True
-                        job = ndx
-                        break
+                self.__collect("thread#{}".format(tid), job, elapsed, average_delays, absorbing_states, stats)
+
+def _simulate(configuration, mode, verbose, options, cache, cache_pi, lock = None, budget = None, run = None):
+    """
+    Execute a single simulation, unless its result is found in the cache.
+
+    mode is 'single' or 'dual', to compute the average delays with one or
+    two options per client, 'montecarlo' or 'meanfield', to estimate the
+    latter by simulation or approximate it, or 'absorbing', to only search
+    the absorbing states, see Simulator.
+
+    Return a tuple with the time required, the average delays, the
+    absorbing states, and the execution statistics, where the average
+    delays are None if the transition matrix is degenerate or with
+    'absorbing', and the absorbing states are None if not searched.
+
+    If lock is not None, it is held while printing the debug information.
+
+    If budget is not None, it is a dictionary with the time and memory
+    budgets of the exact methods, and the fallback method with its options,
+    see Simulator. The average delays and absorbing states of the jobs
+    skipped are both None. In the main thread, e.g., of a worker process,
+    the time budget is also enforced with a timer, see _arm(), which
+    interrupts the phases that do not check it, e.g., the direct solver,
+    as soon as the control returns to the interpreter.
+
+    If run is not None, it is the index of the run, from which the seed of
+    the Monte Carlo estimator is derived, together with the one in options,
+    see generator.run_seed(), so that the trajectories of different runs
+    are independent.
+    """
+
+    now = time.time()
+
+    if mode == 'montecarlo' and run is not None and options.get('seed', None) is not None:
+        options = dict(options, seed = run_seed(options['seed'], run))
+
+    key = None
+    if cache is not None and mode != 'single':
+        # the absorbing states do not depend on the options of the solver
+        key = cache.key(configuration, mode, options if mode != 'absorbing' else None)
+        result = cache.get(key)
+        if result is not None:
+            elapsed = time.time() - now
+            return (elapsed, result['delays'], result['absorbing'], {'elapsed': elapsed, 'cached': True})
+
+    if mode == 'single':
+        ss = SteadyStateSingle(configuration, verbose)
+    elif mode == 'montecarlo':
+        # imported here since montecarlo depends on this module
+        from montecarlo import MonteCarlo
+        ss = MonteCarlo(configuration, verbose, **options)
+    elif mode == 'meanfield':
+        # imported here since meanfield depends on this module
+        from meanfield import MeanField
+        ss = MeanField(configuration, verbose, **options)
+    else:
+        ss = SteadyState(configuration, verbose, **options)
+
+    if verbose and mode != 'absorbing':
+        if lock is not None:
+            with lock:
+                ss.debugPrint(True)
+        else:
+            ss.debugPrint(True)
 
-            if job is None:
-                break
+    stats = dict() if mode == 'single' else ss.stats
 
-            if self.single:
-                ss = SteadyStateSingle(self.configurations[job], self.verbose)
-            else:
-                ss = SteadyState(self.configurations[job], self.verbose)
+    alarm = False
+    try:
+        if budget is not None and mode in ['dual', 'absorbing']:
+            _enforce(ss, mode, budget, now)
+            alarm = _arm(ss.deadline)
 
-            if self.verbose:
-                with self.lock:
-                    ss.debugPrint(True)
+        if mode == 'absorbing':
+            absorbing_states = ss.absorbing()
+            if alarm:
+                _disarm()
+            if key is not None:
+                cache.put(key, absorbing = absorbing_states)
+            stats['elapsed'] = time.time() - now
+            return (stats['elapsed'], None, absorbing_states, stats)
 
-            try:
-                now = time.time()
-                average_delays = ss.steady_state_delays()
-                with self.lock:
-                    if self.progress:
-                        print "thread#{}, job {}/{}, required {} s".format(tid, ndx, len(self.done), time.time() - now)
-                    self.average_delays[job] = average_delays
+        try:
+            average_delays = ss.steady_state_delays()
+            if alarm:
+                _disarm()
+            if key is not None:
+                # the probabilities of the lumped chain, if solved instead
+                lumped = mode == 'dual' and ss.pi is None and ss.lumped is not None
+                pi = (ss.lumped.pi if lumped else ss.pi) if cache_pi and mode == 'dual' else None
+                cache.put(key, delays = average_delays, pi = pi, lumped = lumped and pi is not None)
+            stats['elapsed'] = time.time() - now
+            return (stats['elapsed'], average_delays, None, stats)
 
-            except DegenerateException:
-                print "skipped run#{}, absorbing states: {}".format(job, ', '.join([str(y) for y in ss.absorbing()]))
+        except DegenerateException:
+            # the absorbing states are found from the delays already computed
+            if alarm:
+                _disarm()
+            absorbing_states = ss.absorbing()
+            if key is not None:
+                cache.put(key, absorbing = absorbing_states)
+            stats['elapsed'] = time.time() - now
+            return (stats['elapsed'], None, absorbing_states, stats)
+
+    except BudgetException as err:
+        reason = 'memory' if err.args[0] == 'memory' else 'time'
+
+        # the timer may have expired just after the result was computed
+        if reason == 'time' and (ss.delays is not None or (mode == 'absorbing' and ss.leave is not None)):
+            absorbing_states = ss.absorbing() if mode == 'absorbing' else None
+            stats['elapsed'] = time.time() - now
+            return (stats['elapsed'], ss.delays if mode == 'dual' else None, absorbing_states, stats)
+
+    finally:
+        if alarm:
+            _disarm()
+
+    # release the memory of the job over budget before the fallback
+    del ss
+    sys.exc_clear()
+
+    fallback = budget['fallback']
+    if mode == 'dual' and fallback is not None and np.all(np.sum(configuration.association, axis=1) == 2):
+        (elapsed, average_delays, absorbing_states, stats) = _simulate(
+            configuration, fallback, verbose, budget['fallback_options'], cache, False, lock, run = run)
+        stats['budget']   = reason
+        stats['fallback'] = fallback
+        stats['elapsed']  = time.time() - now
+        return (stats['elapsed'], average_delays, absorbing_states, stats)
+
+    elapsed = time.time() - now
+    return (elapsed, None, None, {'elapsed': elapsed, 'budget': reason, 'skipped': True})
+
+def _enforce(ss, mode, budget, start):
+    """
+    Prepare a SteadyState object to respect the budget of a job started
+    at the given time, see Simulator.
+
+    Raise BudgetException('memory') if the job does not fit the memory
+    budget, even without storing the transition matrix when possible.
+    """
+
+    if budget['memory'] is not None:
+        # the absorbing states only require the delays
+        matrix_free = True if mode == 'absorbing' else None
+        if ss.estimate(matrix_free)['memory'] > budget['memory']:
+            if mode == 'absorbing' or ss.matrix_free or \
+               ss.estimate(True)['memory'] > budget['memory'] or \
+               ss.solver == 'direct' or ss.lumped_chain() is not None:
+                raise BudgetException('memory')
+            ss.matrix_free = True
+            ss.stats['matrix_free'] = True
+
+    if budget['time'] is not None:
+        ss.deadline = start + budget['time']
+
+# handlers of SIGALRM replaced by the timers of the jobs, see _arm()
+_handlers = []
+
+def _arm(deadline):
+    """
+    Start a timer raising BudgetException at the given deadline, if not
+    None, when in the main thread, to which the signals are delivered.
+
+    Return True if the timer has been started, in which case it must be
+    stopped with _disarm().
+    """
+
+    if deadline is None or not hasattr(signal, 'setitimer') or \
+       not isinstance(threading.current_thread(), threading._MainThread):
+        return False
+
+    def expired(signum, frame):
+        raise BudgetException("Time budget exceeded")
+
+    _handlers.append(signal.signal(signal.SIGALRM, expired))
+    signal.setitimer(signal.ITIMER_REAL, max(deadline - time.time(), 1e-6))
+    return True
+
+def _disarm():
+    "Stop the timer started by _arm(), if still running"
+
+    if len(_handlers) > 0:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, _handlers.pop())
+
+#
+# state of the worker processes of Simulator
+#
+
+_worker = dict()
+
+def _init_worker(configurations, runs, mode, verbose, options, cache, cache_pi, budget):
+    "Save the simulation parameters in a new worker process"
+
+    _worker['configurations'] = configurations
+    _worker['runs']           = runs
+    _worker['mode']           = mode
+    _worker['verbose']        = verbose
+    _worker['options']        = options
+    _worker['cache']          = cache
+    _worker['cache_pi']       = cache_pi
+    _worker['budget']         = budget
+
+def _work_process(job):
+    """
+    Execute a single simulation in a worker process.
+
+    Return a tuple with the job index, the process identifier, and the
+    values returned by _simulate().
+    """
+
+    (elapsed, average_delays, absorbing_states, stats) = _simulate(
+        _worker['configurations'][job], _worker['mode'], _worker['verbose'], _worker['options'],
+        _worker['cache'], _worker['cache_pi'], budget = _worker['budget'], run = _worker['runs'][job])
+
+    return (job, os.getpid(), elapsed, average_delays, absorbing_states, stats)
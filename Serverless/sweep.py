@@ -0,0 +1,280 @@
+#!/usr/bin/python
+"""Run a grid of experiments of a serverless edge computing in a single process"""
+
+__author__  = "Claudio Cicconetti"
+__version__ = "0.1.0"
+__license__ = "MIT"
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import numpy as np
+import steadystate
+import results
+import generator
+import aggregate
+
+# parameters of a grid point, in the order in which the grid is expanded,
+# with their default values, the same as serverless.py
+PARAMETERS = [
+    ('mode',       'dual'),
+    ('clients',    2),
+    ('servers',    2),
+    ('candidates', 2),
+    ('chi',        0.1),
+    ('mu_min',     1.0),
+    ('mu_max',     1.0),
+    ('mu_total',   None),
+    ('load_min',   0.1),
+    ('load_max',   0.3),
+    ('runs',       1),
+    ('seed',       0),
+    ('generator',  'legacy'),
+    ]
+
+# quantities computed by the runs of a grid point
+MODES = ['single', 'dual', 'absorbing']
+
+# keys of a specification other than the parameters
+KEYS = ['output', 'options', 'summary', 'statistics', 'abscissa']
+
+# default statistics of the summary files, see aggregate.Aggregate.statistic()
+DEFAULT_STATISTICS = ['0.5', '0.9', '0.95', '0.98', 'mean']
+
+def expand(spec):
+    """
+    Return the list of the grid points of a sweep specification.
+
+    The specification is a dictionary with the parameters in PARAMETERS,
+    each either a single value or a list of values, in which case it is
+    a dimension of the grid, and the name of the output file of every point
+    in output, with the values of its parameters as format fields, e.g.,
+    'raw/out.p={mode}.c={clients}.s={servers}.dat'. With mu_total, the
+    serving rate of all the servers is mu_total divided by their number,
+    and mu_min and mu_max are ignored.
+
+    Every grid point is a dictionary with all the parameters, and the name
+    of its output file in output, which must be different for all.
+    """
+
+    unknown = set(spec.keys()) - set([name for (name, default) in PARAMETERS] + KEYS)
+    if len(unknown) > 0:
+        raise KeyError("Unknown parameters: {}".format(', '.join(sorted(unknown))))
+    if 'output' not in spec:
+        raise KeyError("Missing output file name")
+
+    names = [name for (name, default) in PARAMETERS]
+    values = []
+    for (name, default) in PARAMETERS:
+        value = spec.get(name, default)
+        values.append(value if isinstance(value, list) else [value])
+
+    ret = []
+    for combination in itertools.product(*values):
+        point = dict(zip(names, combination))
+        if point['mu_total'] is not None:
+            point['mu_min'] = point['mu_max'] = float(point['mu_total']) / point['servers']
+        point['output'] = spec['output'].format(**point)
+
+        # consistency checks, see serverless.py
+        assert point['mode'] in MODES
+        assert point['generator'] in ['counter', 'legacy']
+        assert point['clients'] >= 1
+        assert point['servers'] >= 1
+        assert point['mode'] == 'single' or 2 <= point['candidates'] <= point['servers']
+        assert point['mu_max'] >= point['mu_min']
+        assert point['load_max'] >= point['load_min']
+        assert point['runs'] >= 0
+
+        ret.append(point)
+
+    outputs = [point['output'] for point in ret]
+    if len(set(outputs)) != len(outputs):
+        raise ValueError("The output file names of the grid points are not unique")
+
+    return ret
+
+def draw(point):
+    """
+    Return the configurations of the runs of a grid point, the same as
+    drawn by serverless.py with the same parameters.
+    """
+
+    tau = np.zeros([point['clients'], point['servers']])
+    x = np.ones([point['clients']])
+    parameters = {
+        'runs':       point['runs'],
+        'tau':        tau,
+        'x':          x,
+        'chi':        point['chi'],
+        'candidates': 1 if point['mode'] == 'single' else point['candidates'],
+        'mu_min':     point['mu_min'],
+        'mu_max':     point['mu_max'],
+        'load_min':   point['load_min'],
+        'load_max':   point['load_max'],
+        }
+
+    if point['generator'] == 'legacy':
+        random.seed(point['seed'])
+        return generator.legacy_configurations(**parameters)
+
+    gen = generator.ConfigurationGenerator(seed = point['seed'], **parameters)
+    return gen.batch(0, len(gen))
+
+def write(point, average_delays, absorbing_states):
+    "Write the output file of a grid point, creating its directory if needed"
+
+    directory = os.path.dirname(point['output'])
+    if directory and not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    if point['mode'] == 'absorbing':
+        results.write_absorbing(point['output'], absorbing_states)
+    else:
+        results.write_delays(point['output'], average_delays)
+
+def run(spec, nthreads = 1, processes = False, verbose = False, progress = False, cache = None):
+    """
+    Run all the grid points of a sweep specification, see expand(), and
+    write the output file of every point as soon as all its runs are done,
+    in the same format as serverless.py. Return the list of grid points.
+
+    The runs of all the grid points in dual and absorbing mode are executed
+    by a single Simulator for every mode, hence in decreasing order of cost
+    across the whole grid, by the same pool of nthreads threads, or worker
+    processes with processes. The runs in single mode are executed in one
+    vectorized call for every grid point, see SteadyStateSingle.
+
+    options in the specification, if present, are passed to the Simulator
+    in dual mode, see SteadyState, e.g., to select the solver.
+
+    With summary in the specification, the delays of the runs of every grid
+    point in single or dual mode are also aggregated, see aggregate.py, and
+    for every statistic in statistics a summary file is written, named as
+    the output files with the name of the statistic in the statistic format
+    field, e.g., 'data/{statistic}.p={mode}.s={servers}.dat', with a line
+    for every grid point, in order, with the value of the parameter in
+    abscissa, clients by default, followed by those of the statistic.
+    """
+
+    points = expand(spec)
+
+    # aggregates of the grid points, by output file name
+    aggregates = dict([(point['output'], aggregate.Aggregate()) for point in points])
+
+    for mode in MODES:
+        selected = [point for point in points if point['mode'] == mode]
+        if len(selected) == 0:
+            continue
+
+        groups = [selected] if mode != 'single' else [[point] for point in selected]
+        for group in groups:
+            # concatenate the runs of all the grid points, a single one
+            # is passed as a whole, e.g., as a ConfigurationBatch
+            drawn = [draw(point) for point in group]
+            configurations = drawn[0] if len(group) == 1 else \
+                [confs[n] for confs in drawn for n in range(len(confs))]
+            owners = [ndx for (ndx, point) in enumerate(group) for n in range(point['runs'])]
+
+            average_delays = [[None] * point['runs'] for point in group]
+            absorbing_states = [[None] * point['runs'] for point in group]
+            first = np.cumsum([0] + [point['runs'] for point in group])
+            missing = [point['runs'] for point in group]
+
+            def collect(job, delays):
+                "Save the result of a run and write its grid point if complete"
+
+                ndx = owners[job]
+                average_delays[ndx][job - first[ndx]] = delays
+                absorbing_states[ndx][job - first[ndx]] = sim.absorbing_states[job]
+                aggregates[group[ndx]['output']].add(delays)
+                missing[ndx] -= 1
+                if missing[ndx] == 0:
+                    write(group[ndx], average_delays[ndx], absorbing_states[ndx])
+                    if progress:
+                        print "written {}".format(group[ndx]['output'])
+
+            sim = steadystate.Simulator(
+                single = mode == 'single',
+                absorbing = mode == 'absorbing',
+                nthreads = nthreads,
+                verbose = verbose,
+                progress = progress,
+                processes = processes,
+                cache = cache,
+                callback = collect,
+                options = spec.get('options', None) if mode == 'dual' else None)
+
+            if len(configurations) > 0:
+                sim.run(configurations)
+
+            # grid points without runs
+            for point in group:
+                if point['runs'] == 0:
+                    write(point, [], [])
+
+    if 'summary' in spec:
+        write_summaries(spec, points, aggregates)
+
+    return points
+
+def write_summaries(spec, points, aggregates):
+    "Write the summary files of the grid points not in absorbing mode, see run()"
+
+    summaries = dict()
+    for point in points:
+        if point['mode'] == 'absorbing':
+            continue
+        abscissa = point[spec.get('abscissa', 'clients')]
+        for statistic in spec.get('statistics', DEFAULT_STATISTICS):
+            filename = spec['summary'].format(statistic = statistic, **point)
+            if filename not in summaries:
+                summaries[filename] = (str(statistic), [])
+            summaries[filename][1].append((abscissa, aggregates[point['output']]))
+
+    for (filename, (statistic, entries)) in summaries.items():
+        aggregate.write_summary(filename, statistic, entries)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description=__doc__,
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument(
+        "spec", type=str,
+        help="JSON file with the specification of the grid, see sweep.expand()")
+    parser.add_argument(
+        "--verbose", action="store_true", default=False,
+        help="Be verbose")
+    parser.add_argument(
+        "--progress", action="store_true", default=False,
+        help="Print progress")
+    parser.add_argument(
+        "--threads", type=int, default=1,
+        help="Number of threads (or processes) to use, 0 for one per CPU core")
+    parser.add_argument(
+        "--processes", action="store_true", default=False,
+        help="Run the simulations in a pool of processes instead of threads")
+    parser.add_argument(
+        "--list", action="store_true", default=False,
+        help="Only print the grid points, without running them")
+    args = parser.parse_args()
+
+    # consistency checks
+    assert args.threads >= 0
+
+    with open(args.spec, 'r') as infile:
+        spec = json.load(infile)
+
+    if args.list:
+        for point in expand(spec):
+            print ' '.join(['{}={}'.format(name, point[name]) for (name, default) in PARAMETERS]), point['output']
+
+    else:
+        run(spec,
+            nthreads = args.threads if args.threads > 0 else multiprocessing.cpu_count(),
+            processes = args.processes,
+            verbose = args.verbose,
+            progress = args.progress)
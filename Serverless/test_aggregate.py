@@ -0,0 +1,169 @@
+__author__  = "Claudio Cicconetti"
+__version__ = "0.1.0"
+__license__ = "MIT"
+
+import unittest
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import numpy as np
+import aggregate
+import generator
+import results
+import steadystate
+
+class TestAggregate(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def runs(self, seed, nruns, nclients = 10):
+        rng = np.random.RandomState(seed)
+        delays = rng.lognormal(0, 1, [nruns, nclients])
+        delays[rng.uniform(size = delays.shape) < 0.1] = -1
+        return delays
+
+    def test_exact(self):
+        delays = self.runs(1, 100)
+        stable = delays[delays >= 0]
+
+        agg = aggregate.Aggregate()
+        for run in delays:
+            agg.add(run)
+        agg.add(None)
+
+        self.assertIsNone(agg.sketch)
+        self.assertEqual(len(stable), agg.count)
+        self.assertEqual(delays.size - len(stable), agg.unstable)
+        self.assertAlmostEqual(np.mean(stable), agg.mean())
+        self.assertAlmostEqual(float(agg.unstable) / delays.size, agg.statistic('unstable')[0])
+        for q in [0, 0.5, 0.95, 1]:
+            self.assertAlmostEqual(np.percentile(stable, 100 * q), agg.quantile(q))
+        self.assertTrue(agg.confidence(0.99) > agg.confidence(0.9) > 0)
+
+    def test_sketch(self):
+        delays = self.runs(2, 1000)
+        stable = delays[delays >= 0]
+
+        agg = aggregate.Aggregate(exact_limit = 500, accuracy = 0.01)
+        for run in delays:
+            agg.add(run)
+
+        self.assertIsNotNone(agg.sketch)
+        self.assertEqual(len(stable), len(agg.sketch))
+        self.assertAlmostEqual(np.mean(stable), agg.mean())
+        for q in [0.01, 0.5, 0.9, 0.99]:
+            expected = np.percentile(stable, 100 * q, interpolation = 'lower')
+            self.assertLess(abs(agg.quantile(q) - expected), 0.0101 * expected)
+
+    def test_merge(self):
+        for exact_limit in [100000, 500]:
+            whole = aggregate.Aggregate(exact_limit)
+            parts = [aggregate.Aggregate(exact_limit) for i in range(3)]
+            delays = self.runs(3, 300)
+            for (ndx, run) in enumerate(delays):
+                whole.add(run)
+                parts[ndx % 3 if ndx < 200 else 0].add(run)
+
+            # also through a JSON file, as from another host
+            parts[1].save(os.path.join(self.dir, 'part.json'))
+            parts[1] = aggregate.Aggregate.load(os.path.join(self.dir, 'part.json'))
+
+            merged = aggregate.Aggregate(exact_limit)
+            for part in parts:
+                merged.merge(part)
+
+            self.assertEqual(whole.count, merged.count)
+            self.assertEqual(whole.unstable, merged.unstable)
+            self.assertAlmostEqual(whole.mean(), merged.mean())
+            self.assertAlmostEqual(whole.confidence(), merged.confidence())
+            for q in [0.1, 0.5, 0.98]:
+                self.assertAlmostEqual(whole.quantile(q), merged.quantile(q))
+
+    def test_read(self):
+        delays = self.runs(4, 20)
+        filename = os.path.join(self.dir, 'out.dat')
+        with open(filename, 'w') as outfile:
+            for run in delays:
+                outfile.write(' '.join([str(v) for v in run]) + ' \n')
+
+        agg = aggregate.read(filename)
+        stable = delays[delays >= 0]
+        self.assertEqual(len(stable), agg.count)
+        self.assertAlmostEqual(np.median(stable), agg.quantile(0.5))
+
+        # with the run index first, in order of completion, and a run skipped
+        streamed = os.path.join(self.dir, 'stream.dat')
+        writer = results.StreamWriter(streamed)
+        for run in np.random.RandomState(5).permutation(len(delays)):
+            writer.write(run, delays[run])
+        writer.write(len(delays), None)
+        writer.close()
+
+        for agg in [aggregate.read(streamed, stream = True), aggregate.read(filename)]:
+            self.assertEqual(len(stable), agg.count)
+            self.assertEqual(delays.size - len(stable), agg.unstable)
+            self.assertAlmostEqual(np.mean(stable), agg.mean())
+            self.assertAlmostEqual(np.percentile(stable, 98), agg.quantile(0.98))
+
+        summary = os.path.join(self.dir, 'data', '0.5.dat')
+        aggregate.write_summary(summary, '0.5', [(2, agg), (4, agg)])
+        with open(summary, 'r') as infile:
+            lines = [line.split() for line in infile]
+        self.assertEqual(['2', '4'], [line[0] for line in lines])
+        self.assertAlmostEqual(agg.quantile(0.5), float(lines[1][1]))
+
+    def test_simulator(self):
+        for (single, processes) in [(True, False), (False, False), (False, True)]:
+            configurations = generator.ConfigurationGenerator(
+                4, np.zeros([4, 3]), np.ones(4), candidates = 1 if single else 2,
+                mu_min = 2, mu_max = 8, load_min = 0.5, load_max = 2, seed = 1)
+            agg = aggregate.Aggregate()
+            sim = steadystate.Simulator(nthreads = 2, single = single, processes = processes, aggregate = agg)
+            sim.run(configurations)
+
+            expected = aggregate.Aggregate()
+            for delays in sim.average_delays:
+                expected.add(delays)
+            self.assertEqual(expected.total(), agg.total())
+            self.assertAlmostEqual(expected.mean(), agg.mean())
+            self.assertAlmostEqual(expected.quantile(0.9), agg.quantile(0.9))
+
+    def test_resume(self):
+        script = os.path.join(os.path.dirname(os.path.abspath(aggregate.__file__)), 'serverless.py')
+        summary = os.path.join(self.dir, 'summary.json')
+
+        for fmt in ['text', 'npy']:
+            output = os.path.join(self.dir, 'out.' + fmt)
+            command = [sys.executable, script, '--clients', '4', '--servers', '3', '--runs', '6',
+                       '--output', output, '--summary', summary, '--format', fmt]
+            subprocess.check_output(command + (['--stream'] if fmt == 'text' else []))
+            expected = aggregate.Aggregate.load(summary)
+            self.assertEqual(24, expected.total())
+
+            # crash after three runs, before saving the summary
+            if fmt == 'text':
+                with open(output, 'r') as infile:
+                    lines = infile.readlines()
+                with open(output, 'w') as outfile:
+                    outfile.writelines(lines[:3])
+            else:
+                done = np.load(os.path.join(output, 'done.npy'), mmap_mode = 'r+')
+                done[3:] = False
+                done.flush()
+                del done
+            os.remove(summary)
+
+            subprocess.check_output(command + ['--resume'])
+            actual = aggregate.Aggregate.load(summary)
+            self.assertEqual(expected.total(), actual.total())
+            self.assertAlmostEqual(expected.mean(), actual.mean())
+            self.assertAlmostEqual(expected.quantile(0.9), actual.quantile(0.9))
+
+if __name__ == '__main__':
+    unittest.main()
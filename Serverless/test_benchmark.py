@@ -0,0 +1,42 @@
+__author__  = "Claudio Cicconetti"
+__version__ = "0.1.0"
+__license__ = "MIT"
+
+import unittest
+import benchmark
+
+class TestBenchmark(unittest.TestCase):
+
+    def test_run(self):
+        records = benchmark.run([2, 3], [2], repetitions = 1, runs = 2, workers = 2)
+
+        phases = [r for r in records if r['benchmark'] == 'phases']
+        self.assertEqual(len(phases), 2 * len(benchmark.PHASES))
+        self.assertEqual(len([r for r in records if r['benchmark'] == 'single']), 2 * 2)
+        self.assertEqual(
+            sorted([(r['clients'], r['workers']) for r in records if r['benchmark'] == 'simulator']),
+            [(2, 1), (2, 2), (3, 1), (3, 2)])
+        for r in records:
+            self.assertTrue(r['time'] is None or r['time'] >= 0)
+
+    def test_compare(self):
+        baseline = [
+            {'benchmark': 'phases', 'phase': 'delta', 'clients': 2, 'servers': 2, 'time': 1.0},
+            {'benchmark': 'phases', 'phase': 'transition', 'clients': 2, 'servers': 2, 'time': 1.0},
+            {'benchmark': 'phases', 'phase': 'absorbing', 'clients': 2, 'servers': 2, 'time': 1e-5},
+            ]
+        current = [
+            {'benchmark': 'phases', 'phase': 'delta', 'clients': 2, 'servers': 2, 'time': 1.2},
+            {'benchmark': 'phases', 'phase': 'transition', 'clients': 2, 'servers': 2, 'time': 2.0},
+            {'benchmark': 'phases', 'phase': 'absorbing', 'clients': 2, 'servers': 2, 'time': 1e-4},
+            {'benchmark': 'phases', 'phase': 'delta', 'clients': 4, 'servers': 2, 'time': 5.0},
+            ]
+
+        (entries, regressions) = benchmark.compare(baseline, current, threshold = 1.5)
+        self.assertEqual(len(entries), 3)
+        self.assertEqual(len(regressions), 1)
+        self.assertEqual(dict(regressions[0][0])['phase'], 'transition')
+        self.assertAlmostEqual(regressions[0][3], 2.0)
+
+if __name__ == '__main__':
+    unittest.main()
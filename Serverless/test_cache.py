@@ -0,0 +1,135 @@
+__author__  = "Claudio Cicconetti"
+__version__ = "0.1.0"
+__license__ = "MIT"
+
+import unittest
+import numpy as np
+import shutil
+import tempfile
+import os
+import time
+import cache
+import configuration
+import steadystate
+
+class TestResultCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def conf(self, chi = 0.1, load = [0.2, 0.3]):
+        tau = np.array([[1, 1, 3], [2, 2, 1]])
+        x = np.array([1, 1])
+        mu = np.array([1, 2, 1])
+        association = np.array([[1, 1, 0], [0, 1, 1]])
+        return configuration.Configuration(chi, tau, x, np.array(load), mu, association)
+
+    def test_key(self):
+        key = cache.ResultCache.key(self.conf(), 'dual', {'solver': 'auto'})
+        self.assertEqual(key, cache.ResultCache.key(self.conf(), 'dual', {'solver': 'auto'}))
+        self.assertNotEqual(key, cache.ResultCache.key(self.conf(), 'dual', {'solver': 'power'}))
+        self.assertNotEqual(key, cache.ResultCache.key(self.conf(), 'absorbing', {'solver': 'auto'}))
+        self.assertNotEqual(key, cache.ResultCache.key(self.conf(chi = 0.2), 'dual', {'solver': 'auto'}))
+        self.assertNotEqual(key, cache.ResultCache.key(self.conf(load = [0.2, 0.4]), 'dual', {'solver': 'auto'}))
+
+    def test_put_get(self):
+        rc = cache.ResultCache(self.directory)
+        self.assertIsNone(rc.get('0123'))
+
+        rc.put('0123', delays = np.array([1.0, 2.0]))
+        result = rc.get('0123')
+        self.assertTrue(np.array_equal([1.0, 2.0], result['delays']))
+        self.assertEqual([], result['absorbing'])
+        self.assertIsNone(result['pi'])
+
+        rc.put('0123', absorbing = [1, 3], pi = np.array([0.5, 0.5]))
+        result = rc.get('0123')
+        self.assertIsNone(result['delays'])
+        self.assertEqual([1, 3], result['absorbing'])
+        self.assertTrue(np.array_equal([0.5, 0.5], result['pi']))
+
+    def test_evict(self):
+        rc = cache.ResultCache(self.directory)
+        for key in ['aa00', 'bb00', 'cc00']:
+            rc.put(key, delays = np.zeros(1000))
+        size = os.path.getsize(os.path.join(self.directory, 'aa', 'aa00.npz'))
+
+        # make 'aa00' the least recently used, then the most recently used
+        os.utime(os.path.join(self.directory, 'aa', 'aa00.npz'), (0, 0))
+        os.utime(os.path.join(self.directory, 'bb', 'bb00.npz'), (1, 1))
+        os.utime(os.path.join(self.directory, 'cc', 'cc00.npz'), (2, 2))
+        self.assertIsNotNone(rc.get('aa00'))
+
+        rc = cache.ResultCache(self.directory, max_size = 2 * size)
+        self.assertIsNotNone(rc.get('aa00'))
+        self.assertIsNone(rc.get('bb00'))
+        self.assertIsNotNone(rc.get('cc00'))
+
+    def test_index(self):
+        rc = cache.ResultCache(self.directory, max_size = 10 ** 6)
+        rc.put('aa00', delays = np.zeros(1000))
+        size = os.path.getsize(os.path.join(self.directory, 'aa', 'aa00.npz'))
+        self.assertEqual(size, rc.total)
+
+        # the directory is not scanned again after opening the cache
+        rc = cache.ResultCache(self.directory, max_size = int(3.5 * size))
+        self.assertEqual(size, rc.total)
+        walk = os.walk
+        try:
+            os.walk = None
+            for key in ['bb00', 'cc00']:
+                time.sleep(0.01)
+                rc.put(key, delays = np.zeros(1000))
+            self.assertIsNotNone(rc.get('aa00'))
+            rc.put('dd00', delays = np.zeros(1000))
+        finally:
+            os.walk = walk
+
+        # the least recently used is evicted
+        self.assertLessEqual(rc.total, rc.max_size)
+        self.assertIsNotNone(rc.get('aa00'))
+        self.assertIsNone(rc.get('bb00'))
+        self.assertIsNotNone(rc.get('cc00'))
+        self.assertIsNotNone(rc.get('dd00'))
+        self.assertEqual(rc.total, sum([os.path.getsize(path) for path in rc.index]))
+
+    def test_lumped(self):
+        tau = np.zeros([3, 2])
+        conf = configuration.Configuration(
+            0.1, tau, np.ones(3), np.array([0.2, 0.2, 0.3]), np.array([1.0, 1.5]), np.ones([3, 2], dtype=int))
+        rc = cache.ResultCache(self.directory)
+
+        for lumping in [False, True]:
+            sim = steadystate.Simulator(cache = rc, cache_pi = True, options = {'lumping': lumping})
+            sim.run([conf])
+            result = rc.get(rc.key(conf, 'dual', sim.options))
+            ss = steadystate.SteadyState(conf, lumping = lumping)
+            ss.steady_state_delays()
+            expected = ss.lumped.pi if lumping else ss.pi
+            self.assertEqual(lumping, result['lumped'])
+            self.assertTrue(np.allclose(expected, result['pi']))
+            self.assertEqual(6 if lumping else 8, len(result['pi']))
+
+    def test_simulator(self):
+        configurations = [self.conf(load = [0.2, 0.3]), self.conf(load = [0.1, 0.4])]
+        rc = cache.ResultCache(self.directory)
+
+        sim = steadystate.Simulator(cache = rc, cache_pi = True)
+        sim.run(configurations)
+        for conf, delays in zip(configurations, sim.average_delays):
+            result = rc.get(rc.key(conf, 'dual', sim.options))
+            self.assertTrue(np.array_equal(delays, result['delays']))
+            self.assertIsNotNone(result['pi'])
+
+        # results are taken from the cache
+        for conf in configurations:
+            rc.put(rc.key(conf, 'dual', sim.options), delays = np.array([-2.0, -2.0]))
+        sim.run(configurations)
+        for delays in sim.average_delays:
+            self.assertTrue(np.array_equal([-2.0, -2.0], delays))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,195 @@
+__author__  = "Claudio Cicconetti"
+__version__ = "0.1.0"
+__license__ = "MIT"
+
+import unittest
+import multiprocessing
+import os
+import socket
+import time
+import numpy as np
+import configuration
+import distributed
+import generator
+import steadystate
+
+def crash(address, authkey):
+    "Take a job and terminate without returning its result"
+
+    manager = distributed.QueueManager(address = address, authkey = authkey)
+    manager.connect()
+    manager.queue().get('crashed', 1)
+
+def serve(address, authkey):
+    "Execute the jobs of a coordinator, waiting for it to start"
+
+    for attempt in range(100):
+        if distributed.work(address, authkey) > 0:
+            break
+        time.sleep(0.1)
+
+class TestDistributed(unittest.TestCase):
+
+    def configurations(self, runs = 6):
+        return generator.ConfigurationGenerator(
+            runs, np.zeros([4, 3]), np.ones(4), mu_min = 1, mu_max = 2, seed = 1)
+
+    def test_queue(self):
+        queue = distributed.WorkQueue()
+        self.assertEqual([], queue.get('a'))
+        self.assertIsNone(queue.parameters())
+
+        queue.load(['c0', 'c1', 'c2'], [2, 0, 1], ('dual', False, {}, None), lease = 0.05, retries = 1,
+                   runs = [10, 11, 12])
+        self.assertEqual(('dual', False, {}, None, 0.05), queue.parameters())
+        self.assertEqual([(2, 12, 'c2'), (0, 10, 'c0')], queue.get('a', 2))
+        self.assertEqual([(1, 11, 'c1')], queue.get('b', 2))
+        self.assertEqual([], queue.get('b'))
+
+        # the lease of the first worker expires, its jobs are given to another one
+        queue.renew('b')
+        queue.put('b', 1, 'r1')
+        time.sleep(0.1)
+        self.assertEqual([(1, 'r1')], queue.collect())
+        self.assertEqual([(0, 10, 'c0'), (2, 12, 'c2')], sorted(queue.get('b', 2)))
+        queue.put('b', 2, 'r2')
+        queue.put('a', 2, 'late')
+        self.assertEqual([(2, 'r2')], queue.collect())
+
+        # and then dropped, after the maximum number of retries
+        time.sleep(0.1)
+        (job, result) = queue.collect()[0]
+        self.assertEqual(0, job)
+        self.assertEqual((None, None), result[1:3])
+        self.assertTrue(result[3]['lost'])
+        self.assertIsNone(queue.get('b'))
+
+    def test_simulator(self):
+        configurations = self.configurations()
+        for absorbing in [False, True]:
+            expected = steadystate.Simulator(absorbing = absorbing)
+            expected.run(configurations)
+
+            sim = steadystate.Simulator(
+                nthreads = 2, absorbing = absorbing, coordinator = ('127.0.0.1', 0), authkey = 'test')
+            sim.run(configurations)
+            self.assertTrue(all(sim.done))
+            for (e, a) in zip(expected.average_delays, sim.average_delays):
+                self.assertTrue(np.array_equal(e, a))
+            self.assertEqual(expected.absorbing_states, sim.absorbing_states)
+
+    def test_authkey(self):
+        environ = dict(os.environ)
+        try:
+            os.environ.pop(distributed.AUTHKEY_VARIABLE, None)
+            self.assertIsNone(distributed.find_authkey())
+
+            # without a key, the coordinator of a simulator generates one
+            sim = steadystate.Simulator(nthreads = 2, coordinator = ('127.0.0.1', 0))
+            sim.run(self.configurations(2))
+            self.assertTrue(all(sim.done))
+            self.assertEqual(32, len(sim.authkey))
+            self.assertEqual('given', distributed.find_authkey('given'))
+            os.environ[distributed.AUTHKEY_VARIABLE] = 'environment'
+            self.assertEqual('environment', distributed.find_authkey(''))
+            self.assertEqual('given', distributed.find_authkey('given'))
+        finally:
+            os.environ.clear()
+            os.environ.update(environ)
+
+        self.assertEqual(32, len(distributed.random_authkey()))
+        self.assertNotEqual(distributed.random_authkey(), distributed.random_authkey())
+        with self.assertRaises(AssertionError):
+            distributed.Coordinator(('127.0.0.1', 0), '')
+
+    def test_remote_only(self):
+        configurations = self.configurations(3)
+        expected = steadystate.Simulator()
+        expected.run(configurations)
+
+        # the port of the coordinator is known in advance by the worker
+        s = socket.socket()
+        s.bind(('127.0.0.1', 0))
+        address = s.getsockname()
+        s.close()
+
+        p = multiprocessing.Process(target = serve, args = (address, 'test'))
+        p.start()
+        sim = steadystate.Simulator(nthreads = 0, coordinator = address, authkey = 'test')
+        sim.run(configurations)
+        p.join()
+
+        for (e, a) in zip(expected.average_delays, sim.average_delays):
+            self.assertTrue(np.array_equal(e, a))
+
+    def test_failure(self):
+        configurations = [self.configurations(4)[job] for job in range(4)]
+
+        # a client with a single server cannot be simulated in dual mode
+        association = np.zeros([4, 3], dtype=int)
+        association[:, :2] = 1
+        association[2] = [0, 0, 1]
+        bad = configurations[1]
+        configurations[1] = configuration.Configuration(
+            bad.chi, bad.tau, bad.x, bad.load, bad.mu, association)
+
+        expected = steadystate.Simulator()
+        expected.run(configurations[:1] + configurations[2:])
+
+        sim = steadystate.Simulator(nthreads = 2, coordinator = ('127.0.0.1', 0), authkey = 'test', lease = 0.5)
+        sim.run(configurations)
+        self.assertIsNone(sim.average_delays[1])
+        self.assertTrue(sim.stats[1]['failed'])
+        self.assertIn('AssertionError', sim.stats[1]['error'])
+        for (e, a) in zip(expected.average_delays, sim.average_delays[:1] + sim.average_delays[2:]):
+            self.assertTrue(np.array_equal(e, a))
+
+        # the local workers exit without completing their jobs
+        work = distributed.work
+        distributed.work = crash
+        try:
+            sim = steadystate.Simulator(nthreads = 2, coordinator = ('127.0.0.1', 0), authkey = 'test')
+            with self.assertRaises(RuntimeError):
+                sim.run(self.configurations(3))
+        finally:
+            distributed.work = work
+
+    def test_abort(self):
+        # jobs that take much longer than the test
+        options = {'precision': 1e-9, 'max_steps': 1 << 40}
+        coordinator = distributed.Coordinator(('127.0.0.1', 0), 'test')
+        coordinator.start(self.configurations(4), range(4), ('montecarlo', False, options, None))
+        coordinator.spawn(2)
+        workers = list(coordinator.workers)
+        time.sleep(0.5)
+
+        now = time.time()
+        coordinator.shutdown(abort = True)
+        self.assertLess(time.time() - now, 5)
+        self.assertFalse(any(p.is_alive() for p in workers))
+
+    def test_retry(self):
+        configurations = self.configurations(3)
+        expected = steadystate.Simulator()
+        expected.run(configurations)
+
+        coordinator = distributed.Coordinator(('127.0.0.1', 0), 'test')
+        coordinator.start(configurations, range(3), ('dual', False, {}, None), lease = 0.5)
+        try:
+            p = multiprocessing.Process(target = crash, args = (coordinator.address, 'test'))
+            p.start()
+            p.join()
+
+            coordinator.spawn(1)
+            results = dict()
+            while len(results) < 3:
+                results.update(dict(coordinator.collect()))
+                time.sleep(0.1)
+        finally:
+            coordinator.shutdown()
+
+        for job in range(3):
+            self.assertTrue(np.array_equal(expected.average_delays[job], results[job][1]))
+
+if __name__ == '__main__':
+    unittest.main()
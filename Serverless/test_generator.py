@@ -0,0 +1,63 @@
+__author__  = "Claudio Cicconetti"
+__version__ = "0.1.0"
+__license__ = "MIT"
+
+import unittest
+import numpy as np
+import generator
+import steadystate
+
+class TestGenerator(unittest.TestCase):
+
+    def test_splitmix64(self):
+        # first output of the reference implementation seeded with 0
+        self.assertEqual(0xe220a8397b1dcdaf, int(generator.splitmix64(np.uint64(0))))
+
+        u = generator.uniform(1, np.arange(1000), generator.STREAM_LOAD, 50)
+        self.assertEqual((1000, 50), u.shape)
+        self.assertTrue(np.all((u >= 0) & (u < 1)))
+        self.assertAlmostEqual(0.5, u.mean(), 2)
+        self.assertAlmostEqual(1 / 12.0, u.var(), 2)
+
+        # independent of the other runs and streams
+        self.assertTrue(np.array_equal(u[[7, 3]], generator.uniform(1, [7, 3], generator.STREAM_LOAD, 50)))
+        self.assertFalse(np.any(u == generator.uniform(1, np.arange(1000), generator.STREAM_MU, 50)))
+        self.assertFalse(np.any(u == generator.uniform(2, np.arange(1000), generator.STREAM_LOAD, 50)))
+
+    def test_batch(self):
+        for candidates in [1, 2, 3]:
+            gen = generator.ConfigurationGenerator(
+                100, np.zeros([6, 4]), np.ones(6), candidates = candidates,
+                mu_min = 1, mu_max = 2, load_min = 0.1, load_max = 0.3, seed = 5)
+            batch = gen.batch(0, len(gen))
+            self.assertEqual(100, len(batch))
+            self.assertTrue(np.all((batch.mu >= 1) & (batch.mu < 2)))
+            self.assertTrue(np.all((batch.load >= 0.1) & (batch.load < 0.3)))
+            self.assertTrue(np.all(batch.association.sum(axis=2) == candidates))
+            self.assertTrue(np.all(batch.association.mean(axis=0) > 0))
+
+            # any run can be generated on its own
+            for run in [0, 42, 99]:
+                conf = gen[run]
+                self.assertTrue(np.array_equal(batch.mu[run], conf.mu))
+                self.assertTrue(np.array_equal(batch.load[run], conf.load))
+                self.assertTrue(np.array_equal(batch.association[run], conf.association))
+            self.assertTrue(np.array_equal(batch.load[40:60], gen.batch(40, 60).load))
+
+        with self.assertRaises(IndexError):
+            gen[100]
+
+    def test_simulator(self):
+        gen = generator.ConfigurationGenerator(
+            6, np.zeros([4, 3]), np.ones(4), mu_min = 1, mu_max = 2, seed = 1)
+        batch = gen.batch(0, len(gen))
+
+        expected = [steadystate.SteadyState(batch[run]).steady_state_delays() for run in range(len(batch))]
+        for processes in [False, True]:
+            sim = steadystate.Simulator(nthreads = 2, processes = processes)
+            sim.run(gen)
+            for (e, a) in zip(expected, sim.average_delays):
+                self.assertTrue(np.array_equal(e, a))
+
+if __name__ == '__main__':
+    unittest.main()
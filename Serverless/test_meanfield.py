@@ -0,0 +1,64 @@
+__author__  = "Claudio Cicconetti"
+__version__ = "0.1.0"
+__license__ = "MIT"
+
+import unittest
+import numpy as np
+import configuration
+import meanfield
+import steadystate
+
+class TestMeanField(unittest.TestCase):
+
+    def conf(self, rng, nclients, nservers):
+        association = np.zeros([nclients, nservers], dtype=int)
+        for i in range(nclients):
+            association[i, rng.choice(nservers, 2, replace=False)] = 1
+        load = rng.uniform(0.5, 2, nclients)
+        mu = rng.uniform(1, 2, nservers) * 2 * load.sum() / nservers
+        return configuration.Configuration(
+            0.1, np.zeros([nclients, nservers]), np.ones(nclients), load, mu, association)
+
+    def test_symmetric(self):
+        # two identical clients on two identical servers: one on each
+        conf = configuration.Configuration(
+            0.1, np.zeros([2, 2]), np.ones(2), np.array([1.0, 1.0]), np.array([3.0, 3.0]), np.ones([2, 2], dtype=int))
+        mf = meanfield.MeanField(conf)
+        delays = mf.steady_state_delays()
+        self.assertTrue(mf.stats['converged'])
+        self.assertTrue(np.allclose(delays, delays[0]))
+        self.assertTrue(np.all(delays > 0))
+
+    def test_accuracy(self):
+        rng = np.random.RandomState(3)
+        for (nclients, runs) in [(4, 4), (8, 4), (12, 3), (14, 2)]:
+            errors = []
+            for r in range(runs):
+                conf = self.conf(rng, nclients, max(2, nclients // 3))
+                ss = steadystate.SteadyState(conf, lumping = False)
+                expected = ss.steady_state_delays()
+
+                # probability of every client to be on its second server
+                states = np.arange(ss.nstates)
+                second = np.array([ss.server(i, states) == ss.possible_servers[i, 1] for i in range(ss.nclients)])
+                p = np.dot(second, ss.pi)
+
+                mf = meanfield.MeanField(conf)
+                actual = mf.steady_state_delays()
+                self.assertLess(np.max(np.abs(mf.p - p)), 0.12)
+                errors.append(np.mean(np.abs(actual - expected) / np.abs(expected)))
+
+            self.assertLess(np.mean(errors), 0.12)
+
+    def test_simulator(self):
+        rng = np.random.RandomState(1)
+        configurations = [self.conf(rng, 30, 6) for r in range(3)]
+        expected = [meanfield.MeanField(conf).steady_state_delays() for conf in configurations]
+
+        sim = steadystate.Simulator(nthreads = 2, method = 'meanfield')
+        sim.run(configurations)
+        for (e, a) in zip(expected, sim.average_delays):
+            self.assertTrue(np.array_equal(e, a))
+
+if __name__ == '__main__':
+    unittest.main()
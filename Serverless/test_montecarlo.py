@@ -0,0 +1,100 @@
+__author__  = "Claudio Cicconetti"
+__version__ = "0.1.0"
+__license__ = "MIT"
+
+import unittest
+import numpy as np
+import configuration
+import generator
+import montecarlo
+import steadystate
+
+class TestMonteCarlo(unittest.TestCase):
+
+    def conf(self, seed):
+        rng = np.random.RandomState(seed)
+        association = np.zeros([5, 3], dtype=int)
+        for i in range(5):
+            association[i, rng.choice(3, 2, replace=False)] = 1
+        return configuration.Configuration(
+            0.1, rng.uniform(0, 1, [5, 3]), np.ones(5), rng.uniform(0.5, 2, 5), rng.uniform(4, 10, 3), association)
+
+    def test_delays_in(self):
+        conf = self.conf(1)
+        mc = montecarlo.MonteCarlo(conf)
+        ss = steadystate.SteadyState(conf)
+        delta = ss._SteadyState__delta()
+        deltabar = ss._SteadyState__deltabar()
+
+        states = np.arange(ss.nstates)
+        second = np.array([ss.server(i, states) == ss.possible_servers[i, 1] for i in range(ss.nclients)]).T
+        (mc_delta, mc_deltabar) = mc.delays_in(second)
+        self.assertTrue(np.allclose(delta.T, mc_delta))
+        self.assertTrue(np.allclose(deltabar.T, mc_deltabar))
+
+    def test_steady_state_delays(self):
+        for seed in range(3):
+            conf = self.conf(seed)
+            expected = steadystate.SteadyState(conf).steady_state_delays()
+
+            mc = montecarlo.MonteCarlo(conf, precision = 0.01, seed = seed)
+            actual = mc.steady_state_delays()
+            self.assertTrue(mc.stats['converged'])
+            self.assertEqual(actual.shape, expected.shape)
+            self.assertTrue(np.all(np.abs(actual - expected) <= 0.03 * np.abs(expected)))
+            self.assertTrue(np.all(mc.intervals <= 0.01 * np.abs(actual)))
+
+            # same seed, same estimate
+            again = montecarlo.MonteCarlo(conf, precision = 0.01, seed = seed).steady_state_delays()
+            self.assertTrue(np.array_equal(actual, again))
+
+    def test_absorbing(self):
+        chi = 0.1
+        tau = np.array([[0, 0], [0, 0]])
+        x = np.array([1, 1])
+        load = np.array([0.1, 0.1])
+        mu = np.array([12, 1])
+        association = np.array([[1, 1], [1, 1]])
+        conf = configuration.Configuration(chi, tau, x, load, mu, association)
+
+        # all trajectories are trapped in the only absorbing state
+        ss = steadystate.SteadyState(conf)
+        self.assertEqual([0], ss.absorbing())
+        delays = montecarlo.MonteCarlo(conf, warmup = 100, batch_steps = 100).steady_state_delays()
+        self.assertTrue(np.allclose(ss._SteadyState__delta()[:, 0], delays))
+
+    def test_simulator(self):
+        configurations = [self.conf(seed) for seed in range(3)]
+        expected = [montecarlo.MonteCarlo(conf, seed = generator.run_seed(1, run)).steady_state_delays()
+                    for (run, conf) in zip([4, 5, 6], configurations)]
+
+        for processes in [False, True]:
+            sim = steadystate.Simulator(
+                nthreads = 2, processes = processes, method = 'montecarlo', options = {'seed': 1})
+            sim.run(configurations, runs = [4, 5, 6])
+            for (e, a, stats) in zip(expected, sim.average_delays, sim.stats):
+                self.assertTrue(np.array_equal(e, a))
+                self.assertTrue(stats['converged'])
+
+    def test_seeds(self):
+        # the same configuration in every run, with different trajectories
+        conf = self.conf(0)
+        sim = steadystate.Simulator(method = 'montecarlo', options = {'seed': 1, 'trajectories': 2})
+        sim.run([conf] * 3)
+        for (n, delays) in enumerate(sim.average_delays):
+            for other in sim.average_delays[n + 1:]:
+                self.assertFalse(np.array_equal(delays, other))
+
+        # which are reproducible, given the global seed and the run index
+        again = steadystate.Simulator(method = 'montecarlo', options = {'seed': 1, 'trajectories': 2})
+        again.run([conf], runs = [2])
+        self.assertTrue(np.array_equal(sim.average_delays[2], again.average_delays[0]))
+
+        # also when used as fallback over budget
+        fallback = steadystate.Simulator(
+            time_budget = 1e-9, fallback = 'montecarlo', fallback_options = {'seed': 1, 'trajectories': 2})
+        fallback.run([conf], runs = [2])
+        self.assertTrue(np.array_equal(sim.average_delays[2], fallback.average_delays[0]))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+__author__  = "Claudio Cicconetti"
+__version__ = "0.1.0"
+__license__ = "MIT"
+
+import unittest
+import numpy as np
+import shutil
+import tempfile
+import os
+import configuration
+import results
+import steadystate
+
+class TestResults(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, 'out')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_stream(self):
+        self.assertEqual(results.read_stream(self.filename), dict())
+
+        writer = results.StreamWriter(self.filename, checkpoint = 0)
+        writer.write(3, [1.5, 2.0])
+        writer.write(0, None)
+        writer.close()
+
+        # append a partial line, as if interrupted while writing
+        with open(self.filename, 'a') as outfile:
+            outfile.write('7 1.0 2')
+
+        # the partial line is ignored, and then removed
+        self.assertEqual(results.read_stream(self.filename, repair = False), {3: [1.5, 2.0], 0: None})
+        with open(self.filename, 'r') as infile:
+            self.assertTrue(infile.read().endswith('7 1.0 2'))
+        self.assertEqual(results.read_stream(self.filename), {3: [1.5, 2.0], 0: None})
+
+        writer = results.StreamWriter(self.filename, append = True)
+        writer.write(7, [1.0, 2.0])
+        writer.close()
+
+        self.assertEqual(results.read_stream(self.filename), {3: [1.5, 2.0], 0: None, 7: [1.0, 2.0]})
+
+    def test_simulator(self):
+        tau = np.array([[1, 1, 3], [2, 2, 1]])
+        x = np.array([1, 1])
+        mu = np.array([1, 2, 1])
+        association = np.array([[1, 1, 0], [0, 1, 1]])
+        configurations = [
+            configuration.Configuration(0.1, tau, x, np.array(load), mu, association)
+            for load in [[0.2, 0.3], [0.1, 0.1], [0.3, 0.2]]]
+
+        writer = results.StreamWriter(self.filename)
+        sim = steadystate.Simulator(
+            nthreads = 2, callback = lambda job, delays: writer.write(job + 10, delays))
+        sim.run(configurations)
+        writer.close()
+
+        streamed = results.read_stream(self.filename)
+        self.assertEqual(sorted(streamed.keys()), [10, 11, 12])
+        for job in range(len(configurations)):
+            self.assertEqual(len(streamed[job + 10]), 2)
+            for (expected, actual) in zip(sim.average_delays[job], streamed[job + 10]):
+                self.assertAlmostEqual(expected, actual)
+
+    def test_arrays(self):
+        self.assertIsNone(results.read_arrays(self.filename))
+
+        writer = results.ArrayWriter(self.filename, 4, 2, checkpoint = 0)
+        writer.write(3, [1.5, -1.0])
+        writer.write(0, None)
+        writer.close()
+
+        (delays, valid, done) = results.read_arrays(self.filename)
+        self.assertEqual((4, 2), delays.shape)
+        self.assertEqual([True, False, False, True], done.tolist())
+        self.assertEqual([[False, False], [False, False], [False, False], [True, False]], valid.tolist())
+        self.assertEqual([1.5, -1.0], delays[3].tolist())
+        self.assertTrue(np.all(np.isnan(delays[:3])))
+
+        # resume, keeping the previous results
+        writer = results.ArrayWriter(self.filename, 4, 2, append = True)
+        writer.write(1, [2.0, 3.0])
+        writer.close()
+
+        (delays, valid, done) = results.read_arrays(self.filename, mmap = False)
+        self.assertEqual([True, True, False, True], done.tolist())
+        self.assertEqual([2.0, 3.0], delays[1].tolist())
+        self.assertEqual([1.5, -1.0], delays[3].tolist())
+
+    def test_batch(self):
+        rng = np.random.RandomState(1)
+        configurations = []
+        for r in range(4):
+            association = np.zeros([3, 3], dtype=int)
+            for i in range(3):
+                association[i, rng.choice(3, 2, replace=False)] = 1
+            configurations.append(configuration.Configuration(
+                0.1, rng.uniform(0, 1, [3, 3]), np.ones(3), rng.uniform(0.1, 0.3, 3),
+                rng.uniform(1, 2, 3), association))
+
+        configuration.ConfigurationBatch.stack(configurations).save(self.filename)
+        batch = configuration.ConfigurationBatch.load(self.filename)
+        self.assertEqual(len(configurations), len(batch))
+        self.assertTrue(isinstance(batch.tau, np.memmap))
+        for (expected, actual) in zip(configurations, [batch[r] for r in range(len(batch))]):
+            for field in configuration.ConfigurationBatch.FIELDS:
+                self.assertTrue(np.array_equal(getattr(expected, field), getattr(actual, field)))
+
+        # the simulator writes the results of the batch in place
+        writer = results.ArrayWriter(os.path.join(self.directory, 'results'), len(batch), 3)
+        sim = steadystate.Simulator(nthreads = 2, callback = writer.write)
+        sim.run(batch)
+        writer.close()
+
+        (delays, valid, done) = results.read_arrays(os.path.join(self.directory, 'results'))
+        self.assertTrue(np.all(done))
+        for (conf, actual) in zip(configurations, delays):
+            self.assertTrue(np.allclose(steadystate.SteadyState(conf).steady_state_delays(), actual))
+
+if __name__ == '__main__':
+    unittest.main()
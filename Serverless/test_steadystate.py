@@ -3,9 +3,15 @@ __version__ = "0.1.0"
 __license__ = "MIT"
 
 import unittest
+import threading
+import time
 import numpy as np
+import scipy.sparse as sp
+from itertools import product
 import steadystate
 import configuration
+import meanfield
+import solvers
 
 class TestSteadyState(unittest.TestCase):
 
@@ -32,6 +38,34 @@ class TestSteadyState(unittest.TestCase):
         self.assertEqual([0], ss.absorbing())
 
 
+    def test_has_absorbing(self):
+        rng = np.random.RandomState(1)
+        found = 0
+        for r in range(40):
+            association = np.zeros([6, 3], dtype=int)
+            for i in range(6):
+                association[i, rng.choice(3, 2, replace=False)] = 1
+            conf = configuration.Configuration(
+                0.5, np.zeros([6, 3]), np.ones(6), rng.uniform(1, 3, 6), rng.uniform(4, 16, 3), association)
+
+            expected = steadystate.SteadyState(conf).absorbing()
+            found += len(expected) > 0
+
+            # check in small chunks, before computing the delays
+            ss = steadystate.SteadyState(conf)
+            ss.chunk_size = 30
+            self.assertEqual(len(expected) > 0, ss.has_absorbing())
+            self.assertIsNone(ss.delta)
+            self.assertEqual(expected, ss.absorbing())
+            self.assertEqual(len(expected) > 0, ss.has_absorbing())
+
+            # the absorbing states do not leave
+            for k in expected:
+                self.assertTrue(all(ss._SteadyState__remain(i, k) for i in range(ss.nclients)))
+
+        self.assertGreater(found, 0)
+        self.assertLess(found, 40)
+
     def test_steady_state_delays(self):
         chi = 0.5
         tau = np.array([[1, 1, 3], [2, 2, 1]])
@@ -48,5 +82,551 @@ class TestSteadyState(unittest.TestCase):
         for e,a in zip(expected, ss.steady_state_delays()):
             self.assertAlmostEqual(e, a, 3)
 
+    def test_delta(self):
+        chi = 0.2
+        tau = np.array([[1, 2, 3], [2, 2, 1], [0, 1, 1]])
+        x = np.array([1, 2, 1])
+        load = np.array([0.2, 0.3, 0.4])
+        mu = np.array([1, 2, 0.5])
+        association = np.array([[1, 1, 0], [0, 1, 1], [1, 0, 1]])
+
+        ss = steadystate.SteadyState(configuration.Configuration(chi, tau, x, load, mu, association), False)
+
+        delta = ss._SteadyState__delta()
+        deltabar = ss._SteadyState__deltabar()
+        for i in range(ss.nclients):
+            for k in range(ss.nstates):
+                for (probing, own, actual) in [(False, 1, delta), (True, chi, deltabar)]:
+                    server = ss.server(i, k, probing)
+                    denominator = mu[server] - own * load[i]
+                    for h in range(ss.nclients):
+                        if h != i:
+                            denominator -= load[h] * (ss.I(h, server, k) + chi * ss.Ibar(h, server, k))
+                    expected = tau[i, server] + x[i] * mu[server] / denominator if denominator > 0 else -1
+                    self.assertAlmostEqual(expected, actual[i, k])
+
+    def test_server(self):
+        chi = 0.1
+        tau = np.zeros([3, 4])
+        x = np.ones(3)
+        load = np.array([0.2, 0.3, 0.4])
+        mu = np.ones(4)
+        association = np.array([[1, 1, 0, 0], [0, 1, 0, 1], [1, 0, 1, 0]])
+
+        ss = steadystate.SteadyState(configuration.Configuration(chi, tau, x, load, mu, association), False)
+
+        clients = np.arange(ss.nclients)[:, np.newaxis]
+        states = np.arange(ss.nstates)
+        servers = ss.server(clients, states)
+        probed = ss.server(clients, states, True)
+        self.assertEqual((ss.nclients, ss.nstates), servers.shape)
+        for (k, prod) in enumerate(product([0, 1], repeat=ss.nclients)):
+            for i in range(ss.nclients):
+                self.assertEqual(ss.possible_servers[i][prod[i]], ss.server(i, k))
+                self.assertEqual(ss.possible_servers[i][1 - prod[i]], ss.server(i, k, True))
+                self.assertEqual(ss.server(i, k), servers[i, k])
+                self.assertEqual(ss.server(i, k, True), probed[i, k])
+
+    def test_transition(self):
+        chi = 0.2
+        tau = np.array([[0, 0, 0], [0, 0, 0], [0, 0, 0]])
+        x = np.array([1, 1, 1])
+        load = np.array([0.2, 0.3, 0.4])
+        mu = np.array([1, 0.5, 0.6])
+        association = np.array([[1, 1, 0], [0, 1, 1], [1, 0, 1]])
+
+        ss = steadystate.SteadyState(configuration.Configuration(chi, tau, x, load, mu, association), False)
+
+        Q = ss.transition().toarray()
+        self.assertEqual((ss.nstates, ss.nstates), Q.shape)
+        for k in range(ss.nstates):
+            remain = [ss._SteadyState__remain(i, k) for i in range(ss.nclients)]
+            destinations = [
+                h for h in range(ss.nstates)
+                if h != k and all(ss.server(i, h) == ss.server(i, k) or not remain[i] for i in range(ss.nclients))]
+            self.assertGreater(len(destinations), 0)
+            for h in range(ss.nstates):
+                if h == k:
+                    self.assertEqual(-1.0, Q[k, h])
+                elif h in destinations:
+                    self.assertAlmostEqual(1.0 / len(destinations), Q[k, h])
+                else:
+                    self.assertEqual(0.0, Q[k, h])
+
+    def test_candidates(self):
+        chi = 0.2
+        tau = np.zeros([3, 4])
+        x = np.ones(3)
+        load = np.array([0.2, 0.3, 0.4])
+        mu = np.array([1, 0.8, 0.6, 0.7])
+        association = np.array([[1, 1, 0, 0], [0, 1, 1, 1], [1, 1, 1, 1]])
+
+        ss = steadystate.SteadyState(configuration.Configuration(chi, tau, x, load, mu, association), False)
+        self.assertEqual(2 * 3 * 4, ss.nstates)
+
+        # mixed radix state index, the alternatives follow the server in circular order
+        radix = [2, 3, 4]
+        for (k, prod) in enumerate(product(*[range(r) for r in radix])):
+            for i in range(ss.nclients):
+                self.assertEqual(ss.possible_servers[i][prod[i]], ss.server(i, k))
+                for j in range(1, radix[i]):
+                    self.assertEqual(ss.possible_servers[i][(prod[i] + j) % radix[i]], ss.server(i, k, j))
+
+        # the requests sent to probe are split evenly among the alternatives
+        delta = ss._SteadyState__delta()
+        for k in range(ss.nstates):
+            for i in range(ss.nclients):
+                for j in range(radix[i]):
+                    server = ss.server(i, k, j)
+                    denominator = mu[server]
+                    for h in range(ss.nclients):
+                        denominator -= load[h] * ss.I(h, server, k)
+                        denominator -= load[h] * chi / (radix[h] - 1) * ss.Ibar(h, server, k)
+                    expected = x[i] * mu[server] / denominator if denominator > 0 else -1
+                    actual = delta[i, k] if j == 0 else ss._SteadyState__deltabar(j)[i, k]
+                    self.assertAlmostEqual(expected, actual)
+
+        # every client leaving switches to one of the alternatives it prefers
+        Q = ss.transition().toarray()
+        for k in range(ss.nstates):
+            options = []
+            for i in range(ss.nclients):
+                delays = [delta[i, k]] + [ss._SteadyState__deltabar(j)[i, k] for j in range(1, radix[i])]
+                options.append([ss.server(i, k)] + [
+                    ss.server(i, k, j) for j in range(1, radix[i])
+                    if delays[0] < 0 or 0 <= delays[j] < delays[0]])
+            destinations = [
+                h for h in range(ss.nstates)
+                if h != k and all(ss.server(i, h) in options[i] for i in range(ss.nclients))]
+            self.assertGreater(len(destinations), 0)
+            for h in range(ss.nstates):
+                if h == k:
+                    self.assertEqual(-1.0, Q[k, h])
+                elif h in destinations:
+                    self.assertAlmostEqual(1.0 / len(destinations), Q[k, h])
+                else:
+                    self.assertEqual(0.0, Q[k, h])
+        self.assertTrue(np.all(ss.steady_state_delays() > 0))
+
+        # with two possible servers per client, the same chain as the bitmask encoding
+        association = np.array([[1, 1, 0, 0], [0, 1, 0, 1], [1, 0, 1, 0]])
+        conf = configuration.Configuration(chi, tau, x, load, mu, association)
+        expected = steadystate.SteadyState(conf, False)
+        ss = steadystate.SteadyState(conf, False)
+        ss.binary = False
+        self.assertEqual(0, (expected.transition() != ss.transition()).nnz)
+        self.assertTrue(np.allclose(expected.steady_state_delays(), ss.steady_state_delays()))
+
+    def test_solvers(self):
+        chi = 0.1
+        tau = np.array([[1, 1, 3, 0], [2, 2, 1, 0], [0, 1, 2, 1], [1, 1, 1, 1]])
+        x = np.array([1, 1, 2, 1])
+        load = np.array([0.2, 0.3, 0.1, 0.4])
+        mu = np.array([1, 2, 1, 1.5])
+        association = np.array([[1, 1, 0, 0], [0, 1, 1, 0], [0, 0, 1, 1], [1, 0, 0, 1]])
+        conf = configuration.Configuration(chi, tau, x, load, mu, association)
+
+        expected = steadystate.SteadyState(conf, False, solver='direct').steady_state_delays()
+        for solver in ['gmres', 'bicgstab', 'power']:
+            for preconditioner in solvers.PRECONDITIONERS:
+                ss = steadystate.SteadyState(
+                    conf, False, solver=solver, tol=1e-9, preconditioner=preconditioner)
+                for e,a in zip(expected, ss.steady_state_delays()):
+                    self.assertAlmostEqual(e, a, 6)
+                self.assertTrue(ss.solution.converged)
+                self.assertLess(ss.solution.residual, 1e-6)
+                self.assertGreater(ss.solution.iterations, 0)
+
+        ss = steadystate.SteadyState(conf, False, solver='power', maxiter=1)
+        ss.probabilities()
+        self.assertEqual(1, ss.solution.iterations)
+        self.assertFalse(ss.solution.converged)
+
+    def test_transition_operator(self):
+        chi = 0.1
+        tau = np.array([[1, 1, 3, 0], [2, 2, 1, 0], [0, 1, 2, 1], [1, 1, 1, 1]])
+        x = np.array([1, 1, 2, 1])
+        load = np.array([0.2, 0.3, 0.1, 0.4])
+        mu = np.array([1, 2, 1, 1.5])
+        association = np.array([[1, 1, 0, 0], [0, 1, 1, 0], [0, 0, 1, 1], [1, 0, 0, 1]])
+        conf = configuration.Configuration(chi, tau, x, load, mu, association)
+
+        ss = steadystate.SteadyState(conf, False)
+        ss.chunk_size = 10
+        Q = ss.transition()
+        op = ss.transition_operator()
+        v = np.arange(ss.nstates, dtype=float)
+        self.assertTrue(np.allclose(Q.dot(v), op.matvec(v)))
+        self.assertTrue(np.allclose(Q.T.dot(v), op.rmatvec(v)))
+        self.assertTrue(np.allclose(Q.diagonal(), op.diagonal()))
+
+        expected = ss.steady_state_delays()
+        for solver in ['auto', 'gmres', 'bicgstab', 'power']:
+            ss = steadystate.SteadyState(conf, False, solver=solver, tol=1e-9, matrix_free=True)
+            for e,a in zip(expected, ss.steady_state_delays()):
+                self.assertAlmostEqual(e, a, 6)
+            self.assertIsNone(ss.Q)
+
+    def test_recurrent(self):
+        # state 0 leads to the classes {1, 2} and {3, 4}, state 5 only to the latter
+        Q = sp.csr_matrix(np.array([
+            [-4,  1,  0,  3,  0,  0],
+            [ 0, -1,  1,  0,  0,  0],
+            [ 0,  2, -2,  0,  0,  0],
+            [ 0,  0,  0, -1,  1,  0],
+            [ 0,  0,  0,  1, -1,  0],
+            [ 0,  0,  0,  1,  0, -1]], dtype=float))
+        classes = solvers.recurrent_classes(Q)
+        self.assertEqual([[1, 2], [3, 4]], [c.tolist() for c in classes])
+        self.assertTrue(np.allclose([0.25, 0.75], solvers.absorption(Q, classes, 0)))
+        self.assertTrue(np.allclose([0, 1], solvers.absorption(Q, classes, 5)))
+        self.assertTrue(np.allclose([1, 0], solvers.absorption(Q, classes, 2)))
+
+        for solver in ['direct', 'gmres', 'power']:
+            solution = solvers.solve_recurrent(Q, solver = solver, tol = 1e-12)
+            self.assertTrue(np.allclose([0, 1 / 6.0, 1 / 12.0, 0.375, 0.375, 0], solution.pi))
+            self.assertEqual(2, solution.classes)
+            self.assertEqual(4, solution.states)
+            self.assertTrue(solution.converged)
+
+        # only the recurrent class is solved, with the same result as the whole chain
+        tau = np.zeros([5, 3])
+        x = np.ones(5)
+        load = np.array([1.5, 1.3, 1.0, 0.7, 0.7])
+        mu = np.array([1.7, 2.6, 1.6])
+        association = np.array([[1, 0, 1], [1, 0, 1], [1, 0, 1], [0, 1, 1], [1, 0, 1]])
+        conf = configuration.Configuration(0.1, tau, x, load, mu, association)
+
+        ss = steadystate.SteadyState(conf, False, lumping = False)
+        delays = ss.steady_state_delays()
+        self.assertEqual(1, ss.stats['classes'])
+        self.assertEqual(16, ss.stats['states'])
+        self.assertEqual(0, ss.pi[[2, 3, 6, 7]].sum())
+        expected = solvers.solve(ss.transition(), solver = 'power', tol = 1e-12, maxiter = 100000).pi
+        self.assertTrue(np.allclose(np.dot(ss.delta, expected), delays))
+        self.assertTrue(np.allclose(delays, steadystate.SteadyState(conf, False).steady_state_delays()))
+
+        ss = steadystate.SteadyState(conf, False, solver='direct', matrix_free=True)
+        self.assertRaises(ValueError, ss.probabilities)
+
+    def test_lumping(self):
+        tau = np.zeros([6, 4])
+        x = np.ones(6)
+        mu = np.array([2, 3, 2.5, 1])
+        association = np.array([[1, 1, 0, 0], [1, 1, 0, 0], [0, 1, 1, 0], [0, 1, 1, 0], [1, 1, 0, 0], [0, 0, 1, 1]])
+
+        for (chi, load) in [(0.1, [0.5, 0.5, 1, 1, 0.5, 0.2]),
+                            (0.3, [0.5, 0.5, 1, 1, 0.2, 0.2]),
+                            (0.2, [0.1, 0.1, 0.1, 0.1, 0.1, 0.1])]:
+            conf = configuration.Configuration(chi, tau, x, np.array(load), mu, association)
+            expected = steadystate.SteadyState(conf, False, solver='direct', lumping=False)
+            ss = steadystate.SteadyState(conf, False, solver='direct')
+            self.assertIsNotNone(ss.lumped_chain())
+            self.assertLess(ss.lumped_chain().nstates, ss.nstates)
+            for e,a in zip(expected.steady_state_delays(), ss.steady_state_delays()):
+                self.assertAlmostEqual(e, a)
+            self.assertEqual(len(expected.absorbing()) > 0, len(ss.lumped_chain().absorbing()) > 0)
+
+        # all clients different
+        load = np.array([0.1, 0.2, 0.3, 0.4, 0.5, 0.6])
+        ss = steadystate.SteadyState(configuration.Configuration(0.1, tau, x, load, mu, association), False)
+        self.assertIsNone(ss.lumped_chain())
+
+    def test_lumped_transition(self):
+        tau = np.zeros([6, 4])
+        x = np.ones(6)
+        mu = np.array([4, 3, 2.5, 2])
+        association = np.array([[1, 1, 0, 0], [1, 1, 0, 0], [0, 1, 1, 0], [0, 1, 1, 0], [1, 1, 0, 0], [0, 0, 1, 1]])
+
+        # from one pair of indistinguishable clients, the smallest reduction, to larger classes
+        for load in [[0.5, 0.5, 1, 0.8, 0.4, 0.2], [0.5, 0.5, 1, 1, 0.5, 0.2]]:
+            conf = configuration.Configuration(0.1, tau, x, np.array(load), mu, association)
+            full = steadystate.SteadyState(conf, False, lumping = False)
+            Q = full.transition().toarray()
+
+            # lumped state of every state of the full chain
+            states = np.arange(full.nstates)
+            ss = steadystate.SteadyState(conf, False)
+            lumped = ss.lumped_chain()
+            index = np.zeros(full.nstates, dtype=int)
+            for (c, clients) in enumerate(lumped.classes):
+                on_first = sum([full.server(i, states) == full.possible_servers[i, 0] for i in clients])
+                index += on_first * lumped.strides[c]
+
+            for chunk_size in [1, 5, 1 << 20]:
+                ss = steadystate.SteadyState(conf, False)
+                ss.chunk_size = chunk_size
+                lumped_Q = ss.lumped_chain().transition().toarray()
+
+                # the rate from every state to a lumped state is the lumped rate
+                for k in states:
+                    rates = np.bincount(index, Q[k], lumped.nstates)
+                    self.assertTrue(np.allclose(lumped_Q[index[k]], rates))
+
+    def test_single_batch(self):
+        tau = np.array([[1, 2, 3], [2, 2, 1], [0, 1, 1], [1, 0, 0]])
+        x = np.array([1, 2, 1, 1])
+        mu = np.array([1, 2, 0.5])
+        configurations = []
+        for load in [[0.2, 0.3, 0.1, 0.1], [0.4, 0.4, 0.4, 0.4], [0.5, 0.1, 0.2, 1]]:
+            for association in [[[1, 0, 0], [0, 1, 0], [0, 0, 1], [1, 0, 0]],
+                                [[0, 1, 0], [0, 1, 0], [0, 0, 1], [0, 0, 1]]]:
+                configurations.append(configuration.Configuration(
+                    0.1, tau, x, np.array(load), mu, np.array(association)))
+
+        batch = configuration.ConfigurationBatch.stack(configurations)
+        self.assertEqual(len(configurations), len(batch))
+        delays = steadystate.SteadyStateSingle.batch_delays(batch)
+        self.assertEqual((len(configurations), 4), delays.shape)
+        self.assertTrue(np.any(delays == -1))
+        for conf,actual in zip(configurations, delays):
+            self.assertTrue(np.allclose(steadystate.SteadyStateSingle(conf).steady_state_delays(), actual))
+
+        sim = steadystate.Simulator(single = True)
+        sim.run(configurations)
+        self.assertTrue(np.allclose(delays, np.array(sim.average_delays)))
+
+    def test_sweep(self):
+        tau = np.zeros([5, 4])
+        x = np.ones(5)
+        load = np.array([0.3, 0.5, 0.4, 0.6, 0.2])
+        mu = np.array([1, 1.5, 1, 0.8])
+        association = np.array([[1, 1, 0, 0], [0, 1, 1, 0], [0, 0, 1, 1], [1, 0, 0, 1], [0, 1, 0, 1]])
+        chis = [0.001, 0.01, 0.9, 0.1, 0.2, 0.5]
+
+        ss = steadystate.SteadyState(
+            configuration.Configuration(0.05, tau, x, load, mu, association), False, solver='gmres')
+        ss.transition()
+        ss.chunk_size = 8
+        delays = ss.sweep(chis)
+        self.assertEqual((len(chis), 5), delays.shape)
+
+        for (chi, actual) in zip(chis, delays):
+            expected = steadystate.SteadyState(
+                configuration.Configuration(chi, tau, x, load, mu, association), False, solver='direct')
+            for e,a in zip(expected.steady_state_delays(), actual):
+                self.assertAlmostEqual(e, a, 6)
+        self.assertEqual(0, abs(expected.transition() - ss.transition()).max())
+
+    def test_sweep_degenerate(self):
+        tau = np.zeros([5, 4])
+        x = np.ones(5)
+        load = np.array([0.3, 0.5, 0.4, 0.6, 0.2])
+        mu = np.array([1, 1.5, 1, 0.8])
+        association = np.array([[1, 1, 0, 0], [0, 1, 1, 0], [0, 0, 1, 1], [1, 0, 0, 1], [0, 1, 0, 1]])
+
+        # the last value of chi has an absorbing state
+        ss = steadystate.SteadyState(
+            configuration.Configuration(0.05, tau, x, load, mu, association), False, solver='gmres')
+        ss.transition()
+        delays = ss.sweep([0.1, 0.5, 0.9])
+        expected = steadystate.SteadyState(
+            configuration.Configuration(0.9, tau, x, load, mu, association), False, solver='direct')
+        self.assertEqual([16], expected.absorbing())
+        self.assertTrue(np.allclose(expected.steady_state_delays(), delays[-1]))
+        with self.assertRaises(steadystate.DegenerateException):
+            ss.transition()
+
+        # and the sweep can continue from there
+        delays = ss.sweep([0.2])
+        expected = steadystate.SteadyState(
+            configuration.Configuration(0.2, tau, x, load, mu, association), False, solver='direct')
+        self.assertTrue(np.allclose(expected.steady_state_delays(), delays[0]))
+        self.assertEqual(0, abs(expected.transition() - ss.transition()).max())
+
+    def test_update(self):
+        rng = np.random.RandomState(2)
+        association = np.zeros([7, 3], dtype=int)
+        for i in range(7):
+            association[i, rng.choice(3, 2, replace=False)] = 1
+        conf = configuration.Configuration(
+            0.1, np.zeros([7, 3]), np.ones(7), rng.choice([0.6, 1.0], 7), rng.uniform(3, 6, 3), association)
+        mu = conf.mu.copy()
+        load = conf.load.copy()
+
+        for lumping in [False, True]:
+            ss = steadystate.SteadyState(conf, solver = 'gmres', tol = 1e-12, lumping = lumping)
+            ss.steady_state_delays()
+            self.assertEqual(lumping, ss.lumped_chain() is not None)
+
+            for (method, args) in [('set_mu', (1, 2.5)), ('set_load', (3, 1.2)), ('set_chi', (0.3,)),
+                                   ('set_mu', (0, 8.0)), ('set_load', (0, 0.1)), ('set_mu', (2, 4.0))]:
+                getattr(ss, method)(*args)
+                actual = ss.steady_state_delays()
+
+                expected = steadystate.SteadyState(
+                    configuration.Configuration(ss.chi, conf.tau, conf.x, ss.load, ss.mu, association),
+                    solver = 'gmres', tol = 1e-12, lumping = lumping)
+                self.assertTrue(np.allclose(expected.steady_state_delays(), actual))
+                if not lumping:
+                    self.assertTrue(np.allclose(expected._SteadyState__delta(), ss._SteadyState__delta()))
+                    self.assertTrue(np.allclose(expected._SteadyState__deltabar(), ss._SteadyState__deltabar()))
+                    self.assertEqual(0, (expected.transition() != ss.transition()).nnz)
+
+            # the configuration is not changed
+            self.assertTrue(np.array_equal(mu, conf.mu))
+            self.assertTrue(np.array_equal(load, conf.load))
+
+    def test_simulator(self):
+        chi = 0.1
+        tau = np.zeros([3, 3])
+        x = np.ones(3)
+        mu = np.array([1, 2, 1.5])
+        configurations = []
+        for load in [[0.2, 0.3, 0.1], [0.4, 0.4, 0.4], [0.5, 0.1, 0.2], [0.1, 0.1, 0.1]]:
+            association = np.array([[1, 1, 0], [0, 1, 1], [1, 0, 1]])
+            configurations.append(configuration.Configuration(chi, tau, x, np.array(load), mu, association))
+
+        expected = [steadystate.SteadyState(conf, False).steady_state_delays() for conf in configurations]
+        for processes in [False, True]:
+            sim = steadystate.Simulator(nthreads = 2, processes = processes)
+            sim.run(configurations)
+            self.assertEqual(len(expected), len(sim.average_delays))
+            for e,a in zip(expected, sim.average_delays):
+                self.assertTrue(np.allclose(e, a))
+            self.assertEqual(len(sim.stats), len(configurations))
+            for stats in sim.stats:
+                self.assertGreater(stats['elapsed'], 0)
+                self.assertEqual(stats['nstates'], 8)
+
+    def test_simulator_absorbing(self):
+        rng = np.random.RandomState(1)
+        configurations = []
+        for r in range(10):
+            association = np.zeros([6, 3], dtype=int)
+            for i in range(6):
+                association[i, rng.choice(3, 2, replace=False)] = 1
+            configurations.append(configuration.Configuration(
+                0.5, np.zeros([6, 3]), np.ones(6), rng.uniform(1, 3, 6), rng.uniform(4, 16, 3), association))
+
+        expected = [steadystate.SteadyState(conf).absorbing() for conf in configurations]
+        for processes in [False, True]:
+            sim = steadystate.Simulator(nthreads = 2, processes = processes, absorbing = True)
+            sim.run(configurations)
+            self.assertEqual(expected, sim.absorbing_states)
+            self.assertEqual([None] * len(configurations), sim.average_delays)
+
+    def test_simulator_budget(self):
+        rng = np.random.RandomState(2)
+        configurations = []
+        for nclients in [3, 9, 6]:
+            association = np.zeros([nclients, 3], dtype=int)
+            for i in range(nclients):
+                association[i, rng.choice(3, 2, replace=False)] = 1
+            configurations.append(configuration.Configuration(
+                0.1, rng.uniform(0, 1, [nclients, 3]), np.ones(nclients),
+                rng.uniform(0.1, 0.3, nclients), rng.uniform(3, 4, 3), association))
+        expected = [steadystate.SteadyState(conf).steady_state_delays() for conf in configurations]
+
+        # largest jobs first
+        order = []
+        sim = steadystate.Simulator(callback = lambda job, delays: order.append(job))
+        sim.run(configurations)
+        self.assertEqual([1, 2, 0], order)
+
+        # the largest job does not fit the memory budget, even without the matrix
+        memory = steadystate.SteadyState(configurations[1], lumping = False).estimate(True)['memory']
+        for processes in [False, True]:
+            sim = steadystate.Simulator(nthreads = 2, processes = processes, memory_budget = memory - 1,
+                                        options = {'lumping': False})
+            sim.run(configurations)
+            self.assertIsNone(sim.average_delays[1])
+            self.assertEqual({'memory', True}, {sim.stats[1]['budget'], sim.stats[1]['skipped']})
+            for job in [0, 2]:
+                self.assertTrue(np.allclose(expected[job], sim.average_delays[job]))
+                self.assertNotIn('budget', sim.stats[job])
+
+        # ... unless the matrix is not stored, which saves memory with small chunks
+        ss = steadystate.SteadyState(configurations[1], lumping = False)
+        ss.chunk_size = 64
+        budget = {'memory': ss.estimate(True)['memory'], 'time': None}
+        self.assertLess(budget['memory'], ss.estimate()['memory'])
+        steadystate._enforce(ss, 'dual', budget, 0)
+        self.assertTrue(ss.matrix_free)
+        self.assertTrue(np.allclose(expected[1], ss.steady_state_delays()))
+        budget['memory'] -= 1
+        with self.assertRaises(steadystate.BudgetException):
+            steadystate._enforce(steadystate.SteadyState(configurations[1], lumping = False), 'dual', budget, 0)
+
+        # all the jobs exceed the time budget
+        sim = steadystate.Simulator(time_budget = 1e-9, fallback = 'meanfield')
+        sim.run(configurations)
+        for (conf, delays, stats) in zip(configurations, sim.average_delays, sim.stats):
+            self.assertEqual('time', stats['budget'])
+            self.assertEqual('meanfield', stats['fallback'])
+            self.assertTrue(np.array_equal(meanfield.MeanField(conf).steady_state_delays(), delays))
+
+    def test_time_budget(self):
+        rng = np.random.RandomState(3)
+        conf = configuration.Configuration(
+            0.1, rng.uniform(0, 1, [6, 2]), np.ones(6), rng.uniform(0.1, 0.3, 6),
+            np.array([3, 4]), np.ones([6, 2], dtype=int))
+
+        # the solvers stop at their deadline
+        Q = steadystate.SteadyState(conf, lumping = False).transition()
+        for solver in ['direct', 'gmres', 'bicgstab', 'power']:
+            with self.assertRaises(solvers.DeadlineException):
+                solvers.solve(Q, solver = solver, deadline = 0)
+
+        # the phases are not started after the deadline...
+        ss = steadystate.SteadyState(conf, lumping = False)
+        ss.transition()
+        ss.deadline = 0
+        with self.assertRaises(steadystate.BudgetException):
+            ss.steady_state_delays()
+        self.assertIsNone(ss.pi)
+
+        # ... but the results already computed are kept
+        ss.deadline = None
+        expected = ss.steady_state_delays()
+        ss.deadline = 0
+        self.assertTrue(np.array_equal(expected, ss.steady_state_delays()))
+
+        # the timer interrupts the computations that do not check the deadline
+        now = time.time()
+        self.assertTrue(steadystate._arm(now + 0.05))
+        with self.assertRaises(steadystate.BudgetException):
+            time.sleep(1)
+        steadystate._disarm()
+        self.assertLess(time.time() - now, 0.5)
+
+        # only in the main thread, where the signals are delivered
+        armed = []
+        t = threading.Thread(target = lambda: armed.append(steadystate._arm(time.time() + 1)))
+        t.start()
+        t.join()
+        self.assertEqual([False], armed)
+
+    def test_stats(self):
+        tau = np.array([[1, 1, 3], [2, 2, 1]])
+        x = np.array([1, 1])
+        load = np.array([0.2, 0.3])
+        mu = np.array([1, 2, 1])
+        association = np.array([[1, 1, 0], [0, 1, 1]])
+        conf = configuration.Configuration(0.1, tau, x, load, mu, association)
+
+        ss = steadystate.SteadyState(conf, solver = 'gmres')
+        ss.steady_state_delays()
+        for key in ['time_delta', 'time_transition', 'time_solve']:
+            self.assertGreaterEqual(ss.stats[key], 0)
+        self.assertEqual(ss.stats['nstates'], 4)
+        self.assertEqual(ss.stats['nnz'], ss.transition().nnz)
+        self.assertFalse(ss.stats['lumped'])
+        self.assertEqual(ss.stats['solver'], 'gmres')
+        self.assertEqual(ss.stats['iterations'], ss.solution.iterations)
+        self.assertEqual(ss.stats['classes'], 1)
+        self.assertEqual(ss.stats['states'], 2)
+        self.assertLess(ss.stats['residual'], 1e-6)
+        self.assertTrue(ss.stats['converged'])
+        self.assertGreater(ss.stats['peak_memory'], 0)
+
+        # lumped chain
+        conf = configuration.Configuration(0.1, np.zeros([4, 2]), np.ones(4), np.ones(4) * 0.2,
+                                           np.array([1, 1]), np.ones([4, 2], dtype=int))
+        ss = steadystate.SteadyState(conf)
+        ss.steady_state_delays()
+        self.assertTrue(ss.stats['lumped'])
+        self.assertEqual(ss.stats['nstates'], 5)
+
 if __name__ == '__main__':
     unittest.main()
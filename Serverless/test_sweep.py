@@ -0,0 +1,84 @@
+__author__  = "Claudio Cicconetti"
+__version__ = "0.1.0"
+__license__ = "MIT"
+
+import unittest
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import aggregate
+import sweep
+
+class TestSweep(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_expand(self):
+        points = sweep.expand({
+            'mode': ['single', 'dual'],
+            'clients': [2, 4],
+            'servers': [4, 6],
+            'mu_total': 96,
+            'output': 'raw/out.p={mode}.c={clients}.s={servers}.dat'})
+        self.assertEqual(8, len(points))
+        self.assertEqual('raw/out.p=single.c=2.s=4.dat', points[0]['output'])
+        for point in points:
+            self.assertEqual(96, point['mu_min'] * point['servers'])
+            self.assertEqual(point['mu_min'], point['mu_max'])
+
+        with self.assertRaises(ValueError):
+            sweep.expand({'clients': [2, 4], 'output': 'out.dat'})
+        with self.assertRaises(KeyError):
+            sweep.expand({'client': 2, 'output': 'out.dat'})
+
+    def test_run(self):
+        spec = {
+            'mode': ['single', 'dual', 'absorbing'],
+            'clients': [2, 3],
+            'chi': [0.1, 0.3],
+            'servers': 3,
+            'mu_min': 1, 'mu_max': 2,
+            'runs': 3,
+            'output': os.path.join(self.dir, 'sweep', 'out.p={mode}.chi={chi}.c={clients}.dat'),
+            'summary': os.path.join(self.dir, 'data', '{statistic}.p={mode}.c={clients}.dat'),
+            'statistics': ['0.5', 'mean'],
+            'abscissa': 'chi',
+            }
+
+        for processes in [False, True]:
+            points = sweep.run(spec, nthreads = 2, processes = processes)
+            self.assertEqual(12, len(points))
+
+        # same output as a separate execution of serverless.py for every point
+        script = os.path.join(os.path.dirname(os.path.abspath(sweep.__file__)), 'serverless.py')
+        for point in points:
+            expected = os.path.join(self.dir, 'expected.dat')
+            command = [sys.executable, script,
+                       '--clients', str(point['clients']), '--servers', '3', '--chi', str(point['chi']),
+                       '--mu_min', '1', '--mu_max', '2', '--runs', '3', '--output', expected]
+            if point['mode'] != 'dual':
+                command.append('--' + point['mode'])
+            subprocess.check_output(command)
+            with open(expected, 'r') as infile:
+                with open(point['output'], 'r') as outfile:
+                    self.assertEqual(infile.read(), outfile.read())
+
+        # summaries of the points not in absorbing mode, by chi
+        for mode in ['single', 'dual']:
+            for clients in [2, 3]:
+                with open(os.path.join(self.dir, 'data', 'mean.p={}.c={}.dat'.format(mode, clients)), 'r') as infile:
+                    lines = [line.split() for line in infile]
+                self.assertEqual(['0.1', '0.3'], [line[0] for line in lines])
+                for (chi, line) in zip([0.1, 0.3], lines):
+                    agg = aggregate.read(spec['output'].format(mode = mode, chi = chi, clients = clients))
+                    self.assertAlmostEqual(agg.mean(), float(line[1]))
+        self.assertFalse(os.path.exists(os.path.join(self.dir, 'data', 'mean.p=absorbing.c=2.dat')))
+
+if __name__ == '__main__':
+    unittest.main()